@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks every phase of the annual cycle and the headless simulation
+on synthetic islands of several sizes and populations.
+
+Each scenario is a square island from biosim.island_generator, with
+animals from examples/generated_island.generate_population spread over random
+habitable locations, four Herbivores for every Carnivore. The
+time of each phase is taken from the instrumentation of the annual cycle,
+while the whole simulation is timed with BioSim.simulate in headless mode.
+
+Run the full suite, store it as a baseline and compare a later run::
+
+    python benchmarks/bench_annual_cycle.py --output baseline.json
+    python benchmarks/bench_annual_cycle.py --baseline baseline.json --threshold 0.2
+
+The full suite with a million animals takes a long time; a quick run is
+e.g. ``--animals 1000 10000 --map-sizes 20 100``. The script exits with
+status 1 if any timing is slower than the baseline by more than the
+threshold.
+"""
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "examples"))
+
+from biosim.instrumentation import CycleInstrumentation
+from biosim.island_generator import generate_geography
+from biosim.simulation import BioSim
+from generated_island import generate_population
+
+DEFAULT_ANIMALS = [1000, 10000, 100000, 1000000]
+DEFAULT_MAP_SIZES = [20, 100, 500]
+NUM_LOCATIONS = 100
+
+
+def make_scenario(size, num_animals, seed):
+    """Returns the map and the initial population of a scenario, with the
+    animals spread over up to NUM_LOCATIONS locations."""
+    geogr = generate_geography(size, size, seed=seed)
+    n_herbivores = max(round(0.8 * num_animals / NUM_LOCATIONS), 1)
+    n_carnivores = max(round(0.2 * num_animals / NUM_LOCATIONS), 1)
+    return geogr, generate_population(geogr, n_herbivores, n_carnivores,
+                                      num_locations=NUM_LOCATIONS, seed=seed)
+
+
+def run_scenario(size, num_animals, num_years, seed):
+    """Runs one scenario and returns its timings.
+
+    :return: Dict with the mean time per year of each phase, the years per
+             second of the headless simulation and the animals at the end
+    """
+    geogr, ini_pop = make_scenario(size, num_animals, seed)
+    sim = BioSim(geogr, ini_pop, seed=seed, headless=True)
+    sim.instrument()
+    sim.simulate(num_years)
+    phase_times = sim.cycle_statistics["phase_times"].mean(axis=0)
+
+    sim = BioSim(geogr, ini_pop, seed=seed, headless=True)
+    start = time.perf_counter()
+    sim.simulate(num_years)
+    simulate_time = time.perf_counter() - start
+
+    return {"map_size": size,
+            "animals": num_animals,
+            "years": num_years,
+            "phase_times": dict(zip(CycleInstrumentation.phases, phase_times.tolist())),
+            "simulate_time_per_year": simulate_time / num_years,
+            "final_animals": sim.num_animals}
+
+
+def timings(result):
+    """Returns the timings of a scenario result as a flat dict, in seconds per year."""
+    flat = {"phase." + phase: seconds for phase, seconds in result["phase_times"].items()}
+    flat["simulate"] = result["simulate_time_per_year"]
+    return flat
+
+
+def compare(results, baseline, threshold):
+    """Compares the timings of every scenario found in both runs.
+
+    :param results: Scenario results of this run
+    :param baseline: Scenario results of the baseline run
+    :param threshold: Allowed relative slow-down, e.g. 0.2 for 20 %
+    :return: List of (scenario, timing, baseline seconds, seconds, ratio) that are regressions
+    """
+    regressions = []
+    print("{:<22} {:<24} {:>10} {:>10} {:>8}".format(
+        "scenario", "timing", "baseline", "now", "ratio"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base_timings = timings(baseline[name])
+        for timing, seconds in timings(result).items():
+            base_seconds = base_timings.get(timing)
+            if not base_seconds:
+                continue
+            ratio = seconds / base_seconds
+            print("{:<22} {:<24} {:10.4f} {:10.4f} {:7.2f}x".format(
+                name, timing, base_seconds, seconds, ratio))
+            if ratio > 1 + threshold:
+                regressions.append((name, timing, base_seconds, seconds, ratio))
+    return regressions
+
+
+def main(argv=None):
+    """Runs the scenarios given on the command line, and returns the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--animals", type=int, nargs="+", default=DEFAULT_ANIMALS,
+                        help="initial number of animals of the scenarios")
+    parser.add_argument("--map-sizes", type=int, nargs="+", default=DEFAULT_MAP_SIZES,
+                        help="side lengths of the square islands of the scenarios")
+    parser.add_argument("--years", type=int, default=3,
+                        help="years simulated per scenario")
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--output", help="JSON file to store the results in")
+    parser.add_argument("--baseline", help="JSON file with results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slow-down before a timing is a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.map_sizes:
+        for num_animals in args.animals:
+            name = "map{}_animals{}".format(size, num_animals)
+            start = time.perf_counter()
+            results[name] = run_scenario(size, num_animals, args.years, args.seed)
+            print("{:<22} {:8.1f} s  {:10.4f} s/year".format(
+                name, time.perf_counter() - start,
+                results[name]["simulate_time_per_year"]), flush=True)
+
+    report = {"meta": {"python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "machine": platform.machine(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            baseline = json.load(json_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, timing, base_seconds, seconds, ratio in regressions:
+            print("REGRESSION {} {}: {:.4f} s -> {:.4f} s ({:.2f}x)".format(
+                name, timing, base_seconds, seconds, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+Validates the cohort engine against the individual-based engine.
+
+Both engines simulate the check_sim scenario, 150 Herbivores on the
+default island with 40 Carnivores added after 50 years, for a number of
+replicate seeds. For every year and species the mean counts of the two
+engines are compared, both relative to the individual engine and in units
+of the standard error of the difference. A year is flagged when both the
+relative difference exceeds the tolerance and the difference exceeds three
+standard errors, so noise from few replicates alone is not flagged.
+
+    python benchmarks/validate_cohorts.py --replicates 8 --years 150
+
+The script prints the largest differences, the time per engine, and exits
+with status 1 if any year is flagged.
+"""
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from biosim.island import Island
+from biosim.simulation import BioSim
+
+CARNIVORE_YEAR = 50
+SPECIES = ("Herbivore", "Carnivore")
+
+
+def scenario_population(species, number):
+    """Returns the initial population of one species on location (10, 10)."""
+    return [{"loc": (10, 10),
+             "pop": [{"species": species, "age": 5, "weight": 20} for _ in range(number)]}]
+
+
+def run_replicate(seed, num_years, weight_bin=None):
+    """Runs the scenario once, with cohorts if weight_bin is given.
+
+    :return: Array of shape (years, species) with the counts after every year
+    """
+    sim = BioSim(Island.default_geogr, scenario_population("Herbivore", 150),
+                 seed=seed, headless=True)
+    if weight_bin is not None:
+        sim.use_cohorts(weight_bin)
+    counts = []
+    for snapshot in sim.iter_years(num_years):
+        if snapshot.year == CARNIVORE_YEAR:
+            sim.add_population(scenario_population("Carnivore", 40))
+        counts.append([snapshot.counts[species] for species in SPECIES])
+    return np.array(counts, dtype=float)
+
+
+def run_engine(replicates, num_years, seed, weight_bin=None):
+    """Runs all replicates of one engine and returns their counts and wall time."""
+    start = time.perf_counter()
+    counts = np.stack([run_replicate(seed + replicate, num_years, weight_bin)
+                       for replicate in range(replicates)])
+    return counts, time.perf_counter() - start
+
+
+def compare(individual, cohort, tolerance):
+    """Compares the mean counts of the engines year by year.
+
+    :param individual: Counts of the individual engine, shape (replicates, years, species)
+    :param cohort: Counts of the cohort engine, same shape
+    :param tolerance: Allowed relative difference of the means
+    :return: Relative differences, differences in standard errors and flagged years,
+             each of shape (years, species)
+    """
+    mean_individual = individual.mean(axis=0)
+    difference = cohort.mean(axis=0) - mean_individual
+    standard_error = np.sqrt((individual.var(axis=0, ddof=1) + cohort.var(axis=0, ddof=1))
+                             / len(individual))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative = np.abs(difference) / np.maximum(mean_individual, 1)
+        z_score = np.abs(difference) / standard_error
+    z_score[standard_error == 0] = np.where(difference[standard_error == 0] == 0, 0, np.inf)
+    flagged = (relative > tolerance) & (z_score > 3)
+    return relative, z_score, flagged
+
+
+def main(argv=None):
+    """Runs the validation given on the command line, and returns the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--replicates", type=int, default=8,
+                        help="number of seeds simulated by each engine")
+    parser.add_argument("--years", type=int, default=150)
+    parser.add_argument("--weight-bin", type=float, default=1.0,
+                        help="width of the weight bins of the cohort engine")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative difference of the mean counts")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    individual, individual_time = run_engine(args.replicates, args.years, args.seed)
+    cohort, cohort_time = run_engine(args.replicates, args.years, args.seed, args.weight_bin)
+    relative, z_score, flagged = compare(individual, cohort, args.tolerance)
+
+    print("individual engine {:8.1f} s".format(individual_time))
+    print("cohort engine     {:8.1f} s".format(cohort_time))
+    for index, species in enumerate(SPECIES):
+        year = int(np.argmax(relative[:, index]))
+        print("{:<10} largest relative difference {:6.1%} in year {} ({:.1f} standard errors)"
+              .format(species, relative[year, index], year + 1, z_score[year, index]))
+        for year in np.flatnonzero(flagged[:, index]):
+            print("FLAGGED {} year {}: {:.0f} vs {:.0f}".format(
+                species, year + 1, individual[:, year, index].mean(),
+                cohort[:, year, index].mean()))
+    return 1 if flagged.any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
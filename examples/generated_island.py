@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generates a random island with biosim.island_generator, and a matching
+initial population with population_generator.Population on locations
+where animals can live, and simulates it headless.
+
+Both the island and the population are reproducible from their seeds,
+so they can be used to compare how the simulation scales with the size
+of the map and the number of animals.
+"""
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from biosim.island import Island
+from biosim.island_generator import generate_geography
+from biosim.simulation import BioSim
+from population_generator import Population
+
+
+def generate_population(geogr, n_herbivores, n_carnivores, num_locations=10, seed=None):
+    """Returns an initial population for the island of geogr, with n_herbivores
+    and n_carnivores on each of num_locations random locations that are
+    neither Ocean nor Mountain."""
+    habitable = np.argwhere(Island(geogr).get_habitable_grid())
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(habitable), size=min(num_locations, len(habitable)), replace=False)
+    coords = [tuple(int(index) for index in habitable[row]) for row in sorted(chosen)]
+    random.seed(seed)
+    return Population(n_herbivores=n_herbivores, coord_herb=coords,
+                      n_carnivores=n_carnivores, coord_carn=coords).get_animals()
+
+
+if __name__ == "__main__":
+    for size in (20, 100, 500):
+        geogr = generate_geography(size, size, seed=1)
+        ini_pop = generate_population(geogr, n_herbivores=100, n_carnivores=20,
+                                      num_locations=size, seed=1)
+        start = time.perf_counter()
+        sim = BioSim(geogr, ini_pop, seed=1, headless=True)
+        sim.simulate(10)
+        print("{0}x{0}: {1:6.2f} s for 10 years, {2} animals".format(
+            size, time.perf_counter() - start, sim.num_animals))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the simulation throughput of the headless mode of BioSim with
+the graphical path on the default island.
+
+The graphical path is run with the Agg backend, so the numbers do not
+include the time spent by a GUI toolkit showing the figure.
+"""
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+
+from biosim.island import Island
+from biosim.simulation import BioSim
+
+
+def run(num_years, headless):
+    """Runs a simulation and returns the simulated years per second."""
+    ini_pop = [{"loc": (10, 10),
+                "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                        for _ in range(150)]},
+               {"loc": (10, 10),
+                "pop": [{"species": "Carnivore", "age": 5, "weight": 20}
+                        for _ in range(40)]}]
+    sim = BioSim(Island.default_geogr, ini_pop, seed=123456, headless=headless)
+    start = time.perf_counter()
+    sim.simulate(num_years, vis_years=1, img_years=2000)
+    return num_years / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    years = 50
+    graphic = run(years, headless=False)
+    headless = run(years, headless=True)
+    print("Graphical: {:8.2f} years/s".format(graphic))
+    print("Headless:  {:8.2f} years/s".format(headless))
+    print("Speed-up:  {:8.2f}x".format(headless / graphic))
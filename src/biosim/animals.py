@@ -16,6 +16,7 @@ class Animals:
     """
 
     parameters = None
+    __slots__ = ("age", "loc", "island", "fitness", "weight")
 
     def __init__(self, island, loc, age=0, weight=None):
         """Base class for the animal sublasses Herbivore and Carnivore.
@@ -183,33 +184,46 @@ class Animals:
         self.weight -= eta * self.weight
         self.fitness_change()
 
+    def death_probability(self):
+        """Returns the probability that the animal dies this year.
+
+        :return: 1 if the fitness is 0, else omega times one minus the fitness
+        :rtype: float
+        """
+        if self.fitness == 0:
+            return 1
+        return self.parameters["omega"] * (1 - self.fitness)
+
     def death(self):
         """Checks if death occurs according to formula and a probability.
 
         :return: True if death occurs, and False if death does not occur
         :rtype: bool
         """
-        omega = self.parameters["omega"]
-        death_prob = omega * (1 - self.fitness)
-
         if self.fitness == 0:
             return True
 
-        elif random.random() <= death_prob: #SJEKK ALLE SANNSYNLIGHETER, om <= blir riktig
+        elif random.random() <= self.death_probability(): #SJEKK ALLE SANNSYNLIGHETER, om <= blir riktig
             return True
 
         else:
             return False
 
+    def move_probability(self):
+        """Returns the probability that the animal moves this year.
+
+        :return: mu times the fitness
+        :rtype: float
+        """
+        return self.parameters["mu"] * self.fitness
+
     def will_move(self):
         """Checks whether or not the animal is able to move.
 
         :return: True if animal can move, False if animal can not move
         :rtype: bool
         """
-        mu = self.parameters["mu"]
-
-        if random.random() <= mu * self.fitness:
+        if random.random() <= self.move_probability():
             return True
         else:
             return False
@@ -341,17 +355,24 @@ class Animals:
         the correct location.
         """
         if self.will_move():
-            loc_list = self.get_potential_coordinates()
-            destination = self.destination(loc_list)
-            if destination is not None:
-                self.island.remove_pop_on_loc(self.loc, self)
-                self.island.add_pop_on_loc(destination, self)
-                self.loc = destination
+            self.move()
+
+    def move(self):
+        """Moves the animal to one of the neighbouring coordinates, chosen
+        with respect to the probabilities, if any can be moved to.
+        """
+        loc_list = self.get_potential_coordinates()
+        destination = self.destination(loc_list)
+        if destination is not None:
+            self.island.remove_pop_on_loc(self.loc, self)
+            self.island.add_pop_on_loc(destination, self)
+            self.loc = destination
 
 
 class Herbivore(Animals):
     """Herbivore class. Contains specific parameters, attributes, and methods for herbivores.
     """
+    __slots__ = ()
     parameters = {"w_birth": 8.0,
                   "sigma_birth": 1.5,
                   "beta": 0.9,
@@ -424,6 +445,7 @@ class Herbivore(Animals):
 class Carnivore(Animals):
     """Carnivore class, contains specific parameters, attributes and methods for carnivores.
     """
+    __slots__ = ()
 
     parameters = {"w_birth": 6.0,
                                             "sigma_birth": 1.0,
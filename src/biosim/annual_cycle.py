@@ -3,6 +3,47 @@
 __author__ = 'Daniil Efremov', 'Sigurd Grøtan'
 __email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
 
+import time
+
+import numpy as np
+
+
+def binned_events(probabilities, bins):
+    """Decides for every animal whether an event with its own probability
+    happens, with a few draws per bin instead of one draw per animal.
+
+    The animals are binned by probability. In every bin the number of
+    candidates is drawn from a binomial distribution with the largest
+    probability p_max in the bin, the candidates are sampled without
+    replacement, and each candidate is kept with probability p / p_max.
+    Each animal is thereby chosen independently with exactly its own
+    probability, as with one draw per animal.
+
+    :param probabilities: Probability of the event for each animal
+    :type probabilities: numpy.ndarray
+    :param bins: Number of equally wide probability bins
+    :type bins: int
+    :return: Boolean array, True for the animals the event happens to
+    :rtype: numpy.ndarray
+    """
+    probabilities = np.clip(np.asarray(probabilities, dtype=float), 0, 1)
+    happens = np.zeros(len(probabilities), dtype=bool)
+    bin_index = np.minimum((probabilities * bins).astype(np.int64), bins - 1)
+    order = np.argsort(bin_index, kind="stable")
+    bin_starts = np.searchsorted(bin_index[order], np.arange(bins + 1))
+    for start, stop in zip(bin_starts[:-1], bin_starts[1:]):
+        if start == stop:
+            continue
+        members = order[start:stop]
+        p_max = probabilities[members].max()
+        if p_max == 0:
+            continue
+        candidates = np.random.choice(members, np.random.binomial(len(members), p_max),
+                                      replace=False)
+        kept = np.random.random(len(candidates)) * p_max < probabilities[candidates]
+        happens[candidates[kept]] = True
+    return happens
+
 
 class AnnualCycle:
     """Annual cycle class. Manages all the yearly events on the island.
@@ -16,6 +57,8 @@ class AnnualCycle:
         :type island: class:'src.biosim.island.Island'
         """
         self.island = island
+        self.instrumentation = None
+        self.probability_bins = None
 
     def fodder_growth(self):
         """Refills fodder depending on Landscape-type.
@@ -79,26 +122,70 @@ class AnnualCycle:
             animal.annual_weight_loss()
 
     def animal_death(self):
-        """Removes dead Herbivores and Carnivores from Island
+        """Removes dead Herbivores and Carnivores from Island. With
+        probability_bins set, the deaths are decided by binned_events.
         """
         all_herb = self.island.get_all_herb_list()
         all_carn = self.island.get_all_carn_list()
+        if self.probability_bins is not None:
+            animals = all_herb + all_carn
+            probabilities = []
+            for species in (all_herb, all_carn):
+                fitness = self._fitness_array(species)
+                omega = species[0].parameters["omega"] if species else 0
+                probabilities.append(np.where(fitness == 0, 1, omega * (1 - fitness)))
+            dead = binned_events(np.concatenate(probabilities), self.probability_bins)
+            for index in np.flatnonzero(dead).tolist():
+                self.island.remove_pop_on_loc(animals[index].get_loc(), animals[index])
+            return
         for animal in all_herb + all_carn:
             if animal.death():
                 self.island.remove_pop_on_loc(animal.get_loc(), animal)
 
     def migration(self):
-        """Makes Herbivores and Carnivores migrate if needed
+        """Makes Herbivores and Carnivores migrate if needed. With
+        probability_bins set, the movers are decided by binned_events.
         """
         all_herb = self.island.get_all_herb_list()
         all_carn = self.island.get_all_carn_list()
+        if self.probability_bins is not None:
+            animals = all_herb + all_carn
+            probabilities = [species[0].parameters["mu"] * self._fitness_array(species)
+                             for species in (all_herb, all_carn) if species]
+            movers = binned_events(np.concatenate(probabilities or [np.empty(0)]),
+                                   self.probability_bins)
+            for index in np.flatnonzero(movers).tolist():
+                animals[index].move()
+            return
         for animal in all_herb + all_carn:
             animal.migrate()
 
+    @staticmethod
+    def _fitness_array(animals):
+        """Returns the fitness of the animals as an array."""
+        return np.fromiter((animal.fitness for animal in animals), dtype=float,
+                           count=len(animals))
+
+    def get_num_animals_per_species(self):
+        """Returns the number of animals of each species on the island.
+
+        :return: Dict mapping 'Herbivore' and 'Carnivore' to number of animals
+        :rtype: dict
+        """
+        return self.island.get_num_animals_per_species()
+
+    def _migration_moves(self, version):
+        """Returns the number of animals moved since the island had the given version."""
+        # Every move removes the animal from one location and adds it to another
+        return (self.island._version - version) // 2
+
     def run_cycle(self):
         """Calls on all of the methods in the AnnualCycle class
         in the right order of the cycle.
         """
+        if self.instrumentation is not None:
+            self._run_instrumented_cycle()
+            return
         self.fodder_growth()
         self.sort_by_fitness()
         self.herb_feeding()
@@ -108,3 +195,64 @@ class AnnualCycle:
         self.aging()
         self.weight_loss()
         self.animal_death()
+
+    def run_empty_years(self, num_years):
+        """Runs num_years cycles on an island without animals, where only the
+        fodder changes. The fodder is refilled once for a single year, and in
+        closed form for more years, see Island.fodder_refill_years. With
+        instrumentation the cycles are run as usual, so every year is timed.
+
+        :param num_years: Number of years to run
+        :type num_years: int
+        """
+        if self.instrumentation is not None:
+            for _ in range(num_years):
+                self.run_cycle()
+        elif num_years == 1:
+            self.fodder_growth()
+        else:
+            self.island.fodder_refill_years(num_years)
+
+    def _run_instrumented_cycle(self):
+        """Runs the cycle like run_cycle, while timing every phase and counting
+        the animals it processes. Births, deaths and kills are found from the
+        change in the number of animals during the phase, and migrations from
+        the number of animals moved between locations, so the animals
+        themselves are not instrumented.
+        """
+        island = self.island
+        phases = [self.fodder_growth, self.sort_by_fitness, self.herb_feeding,
+                  self.carn_feeding, self.procreation_all, self.migration,
+                  self.aging, self.weight_loss, self.animal_death]
+        phase_times = []
+        processed = []
+        counts = []
+        moves = 0
+        for phase in phases:
+            num_animals = self.get_num_animals_per_species()
+            counts.append(num_animals)
+            if phase == self.fodder_growth:
+                processed.append(len(island.island_dict))
+            elif phase == self.herb_feeding:
+                processed.append(num_animals["Herbivore"])
+            elif phase == self.carn_feeding:
+                processed.append(num_animals["Carnivore"])
+            else:
+                processed.append(sum(num_animals.values()))
+
+            version = island._version
+            start = time.perf_counter()
+            phase()
+            phase_times.append(time.perf_counter() - start)
+            if phase == self.migration:
+                moves = self._migration_moves(version)
+        counts.append(self.get_num_animals_per_species())
+
+        def total(index):
+            return sum(counts[index].values())
+
+        births = total(5) - total(4)
+        kills = counts[3]["Herbivore"] - counts[4]["Herbivore"]
+        deaths = total(8) - total(9)
+        self.instrumentation.record_year(phase_times, processed,
+                                         [births, deaths, kills, moves])
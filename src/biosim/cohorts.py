@@ -0,0 +1,646 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from math import ceil, exp
+
+import numpy as np
+
+from animals import Herbivore, Carnivore
+from annual_cycle import AnnualCycle
+
+# Neighbours in the order of Animals.get_potential_coordinates
+_NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def _round_cumulative(expected, cells):
+    """Rounds expected numbers of animals to integers, so that on every cell
+    the running sum of the rounded numbers stays within one half of the
+    running sum of the expected ones. Unlike rounding each number on its
+    own, many small expectations still add up to whole animals.
+
+    :param expected: Expected number of animals for each cohort
+    :type expected: numpy.ndarray
+    :param cells: Cell index of each cohort
+    :type cells: numpy.ndarray
+    :return: Integer number of animals for each cohort
+    :rtype: numpy.ndarray
+    """
+    order = np.argsort(cells, kind="stable")
+    expected_sorted = expected[order]
+    running = np.cumsum(expected_sorted)
+    before = running - expected_sorted
+    _, first, group = np.unique(cells[order], return_index=True, return_inverse=True)
+    offset = before[first][group]
+    rounded = np.empty(len(expected), dtype=np.int64)
+    rounded[order] = (np.floor(running - offset + 0.5)
+                      - np.floor(before - offset + 0.5)).astype(np.int64)
+    return rounded
+
+
+class Cohorts:
+    """Animals of one species grouped into cohorts, where all animals in a
+    cohort have the same location, age and weight.
+    """
+
+    dtypes = (np.int64, np.int64, np.float64, np.int64)
+    compact_dtypes = (np.int32, np.uint16, np.float32, np.int32)
+
+    def __init__(self, animal_class, shape, cells=(), ages=(), weights=(), counts=(),
+                 compact=False):
+        """Animals of one species grouped into cohorts, where all animals in
+        a cohort have the same location, age and weight. The cells, ages,
+        weights and counts are stored with the dtypes in dtypes, or in
+        compact_dtypes with 14 instead of 32 bytes per cohort.
+
+        :param animal_class: Herbivore or Carnivore, whose parameters apply
+        :type animal_class: class
+        :param shape: Shape (rows, columns) of the island
+        :type shape: tuple
+        :param cells: Row-major cell index of each cohort
+        :type cells: numpy.ndarray, optional
+        :param ages: Age of each cohort
+        :type ages: numpy.ndarray, optional
+        :param weights: Weight of each cohort
+        :type weights: numpy.ndarray, optional
+        :param counts: Number of animals in each cohort
+        :type counts: numpy.ndarray, optional
+        :param compact: If True, the cohorts are stored with compact_dtypes,
+        where weights are rounded to single precision
+        :type compact: bool, optional
+        """
+        self.animal_class = animal_class
+        self.shape = shape
+        self.compact = compact
+        cell_dtype, age_dtype, weight_dtype, count_dtype = \
+            self.compact_dtypes if compact else self.dtypes
+        self.cells = np.asarray(cells, dtype=cell_dtype)
+        self.ages = np.asarray(ages, dtype=age_dtype)
+        self.weights = np.asarray(weights, dtype=weight_dtype)
+        self.counts = np.asarray(counts, dtype=count_dtype)
+
+    def __len__(self):
+        """Returns the number of cohorts."""
+        return len(self.counts)
+
+    @property
+    def itemsize(self):
+        """Number of bytes stored per cohort."""
+        return (self.cells.itemsize + self.ages.itemsize + self.weights.itemsize
+                + self.counts.itemsize)
+
+    @property
+    def parameters(self):
+        """Parameters of the species."""
+        return self.animal_class.parameters
+
+    def total(self):
+        """Returns the number of animals in all cohorts.
+
+        :rtype: int
+        """
+        return int(self.counts.sum())
+
+    def fitness(self):
+        """Returns the fitness of each cohort, as Animals.fitness_change.
+
+        :rtype: numpy.ndarray
+        """
+        params = self.parameters
+        with np.errstate(over="ignore"):
+            fitness = (1 / (1 + np.exp(params["phi_age"] * (self.ages - params["a_half"])))
+                       / (1 + np.exp(-params["phi_weight"] * (self.weights - params["w_half"]))))
+        fitness[self.weights <= 0] = 0
+        return fitness
+
+    def count_grid(self):
+        """Returns the number of animals on every location.
+
+        :rtype: numpy.ndarray of shape (rows, columns)
+        """
+        size = self.shape[0] * self.shape[1]
+        return np.bincount(self.cells, weights=self.counts,
+                           minlength=size).astype(int).reshape(self.shape)
+
+    def weight_grid(self):
+        """Returns the total weight of the animals on every location.
+
+        :rtype: numpy.ndarray of shape (rows, columns)
+        """
+        size = self.shape[0] * self.shape[1]
+        return np.bincount(self.cells, weights=self.counts * self.weights,
+                           minlength=size).reshape(self.shape)
+
+    def replace(self, cells, ages, weights, counts):
+        """Replaces all cohorts, leaving out the ones without animals."""
+        keep = np.asarray(counts) > 0
+        self.cells = np.asarray(cells, dtype=self.cells.dtype)[keep]
+        self.ages = np.asarray(ages, dtype=self.ages.dtype)[keep]
+        self.weights = np.asarray(weights, dtype=self.weights.dtype)[keep]
+        self.counts = np.asarray(counts, dtype=self.counts.dtype)[keep]
+
+    def extend(self, cells, ages, weights, counts):
+        """Adds cohorts."""
+        self.replace(np.concatenate((self.cells, cells)),
+                     np.concatenate((self.ages, ages)),
+                     np.concatenate((self.weights, weights)),
+                     np.concatenate((self.counts, counts)))
+
+    def merge(self, weight_bin):
+        """Merges the cohorts with the same location and age whose weights
+        fall in the same bin of width weight_bin. A merged cohort gets the
+        mean weight of its animals, so the total weight is kept.
+
+        :param weight_bin: Width of the weight bins
+        :type weight_bin: float
+        """
+        if len(self) == 0:
+            return
+        keys = np.stack((self.cells, self.ages,
+                         np.floor(self.weights / weight_bin).astype(np.int64)))
+        keys, inverse = np.unique(keys, axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse, weights=self.counts)
+        weights = np.bincount(inverse, weights=self.counts * self.weights) / counts
+        self.replace(keys[0], keys[1], weights, counts.astype(np.int64))
+
+    def expand(self):
+        """Returns the cell, age and weight of every single animal, with the
+        animals of a cohort next to each other."""
+        return (np.repeat(self.cells, self.counts),
+                np.repeat(self.ages, self.counts),
+                np.repeat(self.weights, self.counts))
+
+
+class CohortCycle(AnnualCycle):
+    """Annual cycle over cohorts of interchangeable animals instead of single
+    animal objects. Every phase draws the number of animals of a cohort
+    that give birth, move, die or are killed from binomial and multinomial
+    distributions, so a year costs time in proportion to the number of
+    cohorts, not animals.
+
+    The cohort engine follows the individual-based one with these
+    approximations, which are the accuracy bounds of the cohort engine:
+
+    * Merged animals get the mean weight of their weight bin, so the weight
+      of a single animal is off by less than weight_bin, and its fitness by
+      less than phi_weight * weight_bin / 4. The probabilities of moving,
+      dying, giving birth and being killed are off by at most mu, omega,
+      gamma * (N - 1) and 1 / DeltaPhiMax times that. The total weight
+      on every location is exact.
+    * Birth uses the number of animals on the location at the start of the
+      phase, while newborns already count in the individual engine.
+    * Migration uses the propensities at the start of the migration of each
+      species, while they change with every move in the individual engine.
+    * A Carnivore updates its fitness after every cohort it hunts in,
+      instead of after every kill.
+
+    Herbivore feeding and everything else is exact in distribution. With
+    weight bins of 1 the yearly counts stay within a few percent of the
+    individual engine, see benchmarks/validate_cohorts.py.
+
+    With a mean-field threshold, cells with more animals than the threshold
+    at the start of the year are saturated for that year. On saturated
+    cells births, deaths and kills are not drawn but set to their expected
+    numbers, rounded cumulatively over the cohorts of the cell, so the
+    number of animals on the cell is off from its expected value by less
+    than one per phase. A Carnivore cohort on a saturated cell hunts as a
+    whole, without updating its fitness during the hunt. Herbivore feeding
+    is deterministic anyway, while migration and the weights of newborns
+    stay random everywhere.
+    """
+
+    def __init__(self, island, weight_bin=1.0, mean_field_threshold=None, compact=False):
+        """Annual cycle over cohorts of interchangeable animals.
+
+        :param island: An instance of the :class:'src.biosim.island.Island'
+        with the geography and the fodder. Animals on the island are not
+        touched, see :meth:'take_island_animals'.
+        :type island: class:'src.biosim.island.Island'
+        :param weight_bin: Width of the weight bins animals are merged in
+        :type weight_bin: float, optional
+        :param mean_field_threshold: Number of animals above which a cell gets
+        the mean-field update, or None to keep every cell stochastic
+        :type mean_field_threshold: int, optional
+        :param compact: If True, the cohorts are stored with the compact
+        dtypes, see :class:'src.biosim.cohorts.Cohorts'
+        :type compact: bool, optional
+        :raises ValueError: If weight_bin is not positive
+        :raises ValueError: If mean_field_threshold is negative
+        """
+        if not weight_bin > 0:
+            raise ValueError("The weight bin must be a positive number")
+        if mean_field_threshold is not None and mean_field_threshold < 0:
+            raise ValueError("The mean-field threshold must be a nonnegative value.")
+        super().__init__(island)
+        self.weight_bin = weight_bin
+        self.mean_field_threshold = mean_field_threshold
+        self.cell_modes = []
+        self._mean_field = np.zeros(island.shape[0] * island.shape[1], dtype=bool)
+        self.herbivores = Cohorts(Herbivore, island.shape, compact=compact)
+        self.carnivores = Cohorts(Carnivore, island.shape, compact=compact)
+        self._version = 0
+        self._moves = 0
+        habitable = island.get_habitable_grid()
+        self._neighbour_cells = []
+        self._neighbour_habitable = []
+        size = island.shape[0] * island.shape[1]
+        rows, cols = np.divmod(np.arange(size), island.shape[1])
+        for d_row, d_col in _NEIGHBOURS:
+            # Cells on the edge are Ocean, so their neighbours are never looked up
+            n_rows = np.clip(rows + d_row, 0, island.shape[0] - 1)
+            n_cols = np.clip(cols + d_col, 0, island.shape[1] - 1)
+            self._neighbour_cells.append(n_rows * island.shape[1] + n_cols)
+            self._neighbour_habitable.append(habitable[n_rows, n_cols])
+
+    def take_island_animals(self):
+        """Moves all animals on the island into the cohorts, and removes them
+        from the island.
+        """
+        island = self.island
+        for cohorts, animals in ((self.herbivores, island.get_all_herb_list()),
+                                 (self.carnivores, island.get_all_carn_list())):
+            if not animals:
+                continue
+            cells = [animal.loc[0] * island.shape[1] + animal.loc[1] for animal in animals]
+            cohorts.extend(cells, [animal.age for animal in animals],
+                           [animal.weight for animal in animals],
+                           np.ones(len(animals), dtype=np.int64))
+            cohorts.merge(self.weight_bin)
+            for animal in animals:
+                island.remove_pop_on_loc(animal.loc, animal)
+            self._version += 1
+
+    def add_animals(self, codes, cells, ages, weights):
+        """Adds animals given as arrays directly to the cohorts, without
+        creating them on the island.
+
+        :param codes: 0 for each Herbivore and 1 for each Carnivore
+        :type codes: numpy.ndarray
+        :param cells: Row-major cell index of each animal
+        :type cells: numpy.ndarray
+        :param ages: Age of each animal
+        :type ages: numpy.ndarray
+        :param weights: Weight of each animal
+        :type weights: numpy.ndarray
+        """
+        for code, cohorts in enumerate((self.herbivores, self.carnivores)):
+            added = codes == code
+            if not added.any():
+                continue
+            cohorts.extend(cells[added], ages[added], weights[added],
+                           np.ones(int(added.sum()), dtype=np.int64))
+            cohorts.merge(self.weight_bin)
+            self._version += 1
+
+    def get_num_cohorts(self):
+        """Returns the number of cohorts of both species.
+
+        :rtype: int
+        """
+        return len(self.herbivores) + len(self.carnivores)
+
+    def get_cohort_itemsize(self):
+        """Returns the largest number of bytes stored per cohort of a species.
+
+        :rtype: int
+        """
+        return max(self.herbivores.itemsize, self.carnivores.itemsize)
+
+    def get_num_animals_per_species(self):
+        """Returns the number of animals of each species in the cohorts.
+
+        :return: Dict mapping 'Herbivore' and 'Carnivore' to number of animals
+        :rtype: dict
+        """
+        return {"Herbivore": self.herbivores.total(),
+                "Carnivore": self.carnivores.total()}
+
+    def get_herb_count_grid(self):
+        """Returns the number of Herbivores on every location.
+
+        :return: Read-only array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        grid = self.herbivores.count_grid()
+        grid.setflags(write=False)
+        return grid
+
+    def get_carn_count_grid(self):
+        """Returns the number of Carnivores on every location.
+
+        :return: Read-only array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        grid = self.carnivores.count_grid()
+        grid.setflags(write=False)
+        return grid
+
+    def _migration_moves(self, version):
+        """Returns the number of animals moved by the last migration."""
+        return self._moves
+
+    def run_empty_years(self, num_years):
+        """Runs num_years cycles without animals, recording no occupied cells
+        in cell_modes for the years that are not run as usual.
+        """
+        if self.instrumentation is None:
+            self.cell_modes.extend([(0, 0)] * num_years)
+        super().run_empty_years(num_years)
+
+    def sort_by_fitness(self):
+        """Chooses the mode of every cell for the year, and records the number
+        of occupied cells in each mode in cell_modes. The cohorts are not
+        sorted, since every phase orders the cohorts it needs by fitness.
+        """
+        animals = (self.herbivores.count_grid() + self.carnivores.count_grid()).ravel()
+        if self.mean_field_threshold is None:
+            self._mean_field[:] = False
+        else:
+            self._mean_field = animals > self.mean_field_threshold
+        mean_field = int(self._mean_field.sum())
+        self.cell_modes.append((int((animals > 0).sum()) - mean_field, mean_field))
+
+    def herb_feeding(self):
+        """Feeds all Herbivore cohorts. On every location the cohorts eat in
+        order of decreasing fitness, and within a cohort some animals eat
+        their fill F, at most one eats the rest of the fodder and the others
+        get nothing, so the cohort is split in up to three.
+        """
+        herbs = self.herbivores
+        appetite = herbs.parameters["F"]
+        beta = herbs.parameters["beta"]
+        if len(herbs) == 0 or appetite <= 0:
+            return
+        fodder = self.island.get_fodder_grid().ravel()
+        order = np.lexsort((-herbs.fitness(), herbs.cells))
+        cells = herbs.cells[order]
+        counts = herbs.counts[order]
+        weights = herbs.weights[order]
+        ages = herbs.ages[order]
+
+        demand = counts * appetite
+        eaten_before = np.cumsum(demand) - demand
+        _, first, group = np.unique(cells, return_index=True, return_inverse=True)
+        eaten_before -= eaten_before[first][group]
+        available = np.maximum(fodder[cells] - eaten_before, 0)
+        full = np.minimum(np.floor(available / appetite).astype(np.int64), counts)
+        rest = available - full * appetite
+        partial = ((full < counts) & (rest > 0)).astype(np.int64)
+        hungry = counts - full - partial
+
+        herbs.replace(np.concatenate((cells, cells, cells)),
+                      np.concatenate((ages, ages, ages)),
+                      np.concatenate((weights + beta * appetite,
+                                      weights + beta * rest, weights)),
+                      np.concatenate((full, partial, hungry)))
+        eaten = np.bincount(cells, weights=demand, minlength=fodder.size)
+        self.island.set_fodder_grid(np.maximum(fodder - eaten, 0).reshape(self.island.shape))
+
+    @staticmethod
+    def _single_fitness(params, age, weight):
+        """Returns the fitness of a single animal, as Animals.fitness_change."""
+        if weight <= 0:
+            return 0
+        return (1 / (1 + exp(params["phi_age"] * (age - params["a_half"])))
+                / (1 + exp(-params["phi_weight"] * (weight - params["w_half"]))))
+
+    def carn_feeding(self):
+        """Feeds all Carnivores. On every location the Carnivores hunt in
+        order of decreasing fitness, through the Herbivore cohorts in order
+        of increasing fitness.
+
+        On stochastic cells the Carnivores hunt one by one. The kills in all
+        cohorts left are drawn at once, and the first cohort with a kill is
+        eaten from, limited by the kills needed to eat F. The Carnivore then
+        updates its fitness and draws again for the cohorts after it.
+
+        On saturated cells a whole Carnivore cohort hunts at once, with the
+        fitness it had at the start. Of a Herbivore cohort the expected
+        number killed by at least one of the Carnivores is eaten, until the
+        Carnivores have eaten F each, and the eaten weight is shared evenly.
+        """
+        carns = self.carnivores
+        herbs = self.herbivores
+        if len(carns) == 0 or len(herbs) == 0:
+            return
+        params = carns.parameters
+        appetite = params["F"]
+        beta = params["beta"]
+        delta_phi_max = params["DeltaPhiMax"]
+
+        herb_fitness = herbs.fitness()
+        herb_order = np.lexsort((herb_fitness, herbs.cells))
+        herb_cells, first = np.unique(herbs.cells[herb_order], return_index=True)
+        prey_on_cell = dict(zip(herb_cells.tolist(), np.split(herb_order, first[1:])))
+        herb_counts = herbs.counts.copy()
+
+        mean_field = self._mean_field[carns.cells]
+        stochastic = ~mean_field
+        hunters = Cohorts(carns.animal_class, carns.shape, compact=carns.compact)
+        hunters.replace(*(np.repeat(values[stochastic], carns.counts[stochastic])
+                          for values in (carns.cells, carns.ages, carns.weights)),
+                        np.ones(int(carns.counts[stochastic].sum()), dtype=np.int64))
+        packs = Cohorts(carns.animal_class, carns.shape, carns.cells[mean_field],
+                        carns.ages[mean_field], carns.weights[mean_field],
+                        carns.counts[mean_field], compact=carns.compact)
+
+        fitness = hunters.fitness()
+        for animal in np.lexsort((-fitness, hunters.cells)).tolist():
+            prey = prey_on_cell.get(int(hunters.cells[animal]))
+            if prey is None:
+                continue
+            carn_fitness = fitness[animal]
+            eaten = 0
+            start = 0
+            while start < len(prey) and eaten < appetite:
+                left = prey[start:]
+                kill_prob = ((carn_fitness - herb_fitness[left]) / delta_phi_max).clip(0, 1)
+                draws = np.random.binomial(herb_counts[left], kill_prob)
+                hits = np.flatnonzero(draws)
+                if len(hits) == 0:
+                    break
+                index = left[hits[0]]
+                herb_weight = herbs.weights[index]
+                if herb_weight > 0:
+                    needed = ceil((appetite - eaten) / herb_weight)
+                else:
+                    needed = herb_counts[index]
+                kills = min(int(draws[hits[0]]), needed)
+                herb_counts[index] -= kills
+                gain = min(kills * herb_weight, appetite - eaten)
+                eaten += gain
+                hunters.weights[animal] += beta * gain
+                carn_fitness = self._single_fitness(params, hunters.ages[animal],
+                                                    hunters.weights[animal])
+                start += int(hits[0]) + 1
+
+        pack_fitness = packs.fitness()
+        # Expected kills on every cell so far, over all its Carnivore cohorts
+        expected_on_cell = {}
+        for pack in np.lexsort((-pack_fitness, packs.cells)).tolist():
+            cell = int(packs.cells[pack])
+            prey = prey_on_cell.get(cell)
+            if prey is None:
+                continue
+            size = packs.counts[pack]
+            kill_prob = ((pack_fitness[pack] - herb_fitness[prey]) / delta_phi_max).clip(0, 1)
+            expected = herb_counts[prey] * (1 - (1 - kill_prob) ** size)
+            # Herbivores are eaten in order until the pack has eaten F each
+            prey_weights = herbs.weights[prey]
+            eaten_before = np.cumsum(expected * prey_weights) - expected * prey_weights
+            room = np.maximum(size * appetite - eaten_before, 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected = np.where(prey_weights > 0,
+                                    np.minimum(expected, room / prey_weights), expected)
+            running = expected_on_cell.get(cell, 0.5) + np.cumsum(expected)
+            kills = np.diff(np.floor(running), prepend=np.floor(running[0] - expected[0]))
+            kills = np.minimum(kills.astype(np.int64), herb_counts[prey])
+            expected_on_cell[cell] = running[-1]
+            herb_counts[prey] -= kills
+            eaten = min(float((kills * prey_weights).sum()), size * appetite)
+            packs.weights[pack] += beta * eaten / size
+
+        herbs.replace(herbs.cells, herbs.ages, herbs.weights, herb_counts)
+        carns.replace(np.concatenate((hunters.cells, packs.cells)),
+                      np.concatenate((hunters.ages, packs.ages)),
+                      np.concatenate((hunters.weights, packs.weights)),
+                      np.concatenate((hunters.counts, packs.counts)))
+        self._version += 1
+
+    def _draw(self, cohorts, prob):
+        """Returns the number of animals in every cohort an event with
+        probability prob happens to, drawn from binomial distributions on
+        stochastic cells, and the rounded expected number on saturated cells.
+        """
+        mean_field = self._mean_field[cohorts.cells]
+        if not mean_field.any():
+            return np.random.binomial(cohorts.counts, prob)
+        events = np.empty(len(cohorts), dtype=np.int64)
+        stochastic = ~mean_field
+        events[stochastic] = np.random.binomial(cohorts.counts[stochastic], prob[stochastic])
+        events[mean_field] = _round_cumulative(cohorts.counts[mean_field] * prob[mean_field],
+                                               cohorts.cells[mean_field])
+        return events
+
+    def _procreation(self, cohorts):
+        """Gives birth in the cohorts of one species. The number of mothers
+        in a cohort is binomial, and every newborn gets its own weight."""
+        params = cohorts.parameters
+        if len(cohorts) == 0:
+            return
+        num_same = cohorts.count_grid().ravel()[cohorts.cells]
+        birth_prob = np.minimum(1, params["gamma"] * cohorts.fitness() * (num_same - 1))
+        birth_prob[cohorts.weights < params["zeta"] * (params["w_birth"] + params["sigma_birth"])] = 0
+        births = self._draw(cohorts, np.clip(birth_prob, 0, 1))
+        num_births = int(births.sum())
+        if num_births == 0:
+            return
+        baby_weights = np.random.normal(params["w_birth"], params["sigma_birth"], num_births)
+        # A newborn heavier than its mother divided by xi is not born
+        born = baby_weights * params["xi"] < np.repeat(cohorts.weights, births)
+        babies = Cohorts(cohorts.animal_class, cohorts.shape,
+                         np.repeat(cohorts.cells, births)[born],
+                         np.zeros(int(born.sum()), dtype=np.int64),
+                         baby_weights[born], np.ones(int(born.sum()), dtype=np.int64),
+                         compact=cohorts.compact)
+        babies.merge(self.weight_bin)
+        cohorts.extend(babies.cells, babies.ages, babies.weights, babies.counts)
+        self._version += 1
+
+    def procreation_herb(self):
+        """Gives birth to Herbivores
+        """
+        self._procreation(self.herbivores)
+
+    def procreation_carn(self):
+        """Gives birth to Carnivores
+        """
+        self._procreation(self.carnivores)
+
+    def _propensities(self, abundance):
+        """Returns the propensity of moving to each neighbour of every cell,
+        as Animals.propensity, given the relative abundance on every cell."""
+        with np.errstate(over="ignore"):
+            propensity = np.exp(abundance)
+        return np.stack([np.where(habitable, propensity[cells], 0)
+                         for cells, habitable in zip(self._neighbour_cells,
+                                                     self._neighbour_habitable)])
+
+    def _migrate(self, cohorts, abundance):
+        """Moves animals of one species. The number of movers in a cohort is
+        binomial, and their destinations multinomial."""
+        if len(cohorts) == 0:
+            return 0
+        lambda_ = cohorts.parameters["lambda"]
+        propensities = self._propensities(lambda_ * abundance.ravel())[:, cohorts.cells]
+        total = propensities.sum(axis=0)
+        move_prob = np.clip(cohorts.parameters["mu"] * cohorts.fitness(), 0, 1)
+        move_prob[total == 0] = 0
+        movers = np.random.binomial(cohorts.counts, move_prob)
+
+        cells, ages, weights, counts = [cohorts.cells], [cohorts.ages], \
+            [cohorts.weights], [cohorts.counts - movers]
+        remaining = movers.copy()
+        remaining_share = np.ones(len(cohorts))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for direction in range(len(_NEIGHBOURS)):
+                share = propensities[direction] / np.where(total > 0, total, 1)
+                if direction == len(_NEIGHBOURS) - 1:
+                    # Animals left by rounding stay rather than move to Ocean or Mountain
+                    moved = np.where(propensities[direction] > 0, remaining, 0)
+                    counts[0] = counts[0] + remaining - moved
+                else:
+                    prob = np.clip(np.nan_to_num(share / remaining_share), 0, 1)
+                    moved = np.random.binomial(remaining, prob)
+                remaining = remaining - moved
+                remaining_share = remaining_share - share
+                cells.append(self._neighbour_cells[direction][cohorts.cells])
+                ages.append(cohorts.ages)
+                weights.append(cohorts.weights)
+                counts.append(moved)
+        cohorts.replace(np.concatenate(cells), np.concatenate(ages),
+                        np.concatenate(weights), np.concatenate(counts))
+        return int(movers.sum())
+
+    def migration(self):
+        """Makes Herbivores and then Carnivores migrate, each species with
+        the propensities as at the start of its migration.
+        """
+        herbs = self.herbivores
+        fodder = self.island.get_fodder_grid()
+        herb_abundance = fodder / ((herbs.count_grid() + 1) * herbs.parameters["F"])
+        moves = self._migrate(herbs, herb_abundance)
+
+        carns = self.carnivores
+        carn_abundance = herbs.weight_grid() / ((carns.count_grid() + 1) * carns.parameters["F"])
+        moves += self._migrate(carns, carn_abundance)
+        self._moves = moves
+        self._version += 1
+
+    def aging(self):
+        """Adds a year to all Herbivores and Carnivores
+        """
+        for cohorts in (self.herbivores, self.carnivores):
+            cohorts.ages += 1
+
+    def weight_loss(self):
+        """Makes all Herbivores and Carnivores loose annual weight
+        """
+        for cohorts in (self.herbivores, self.carnivores):
+            cohorts.weights -= cohorts.parameters["eta"] * cohorts.weights
+
+    def animal_death(self):
+        """Removes dead Herbivores and Carnivores, with a binomial number of
+        deaths in every cohort, and merges the cohorts for the next year.
+        """
+        for cohorts in (self.herbivores, self.carnivores):
+            fitness = cohorts.fitness()
+            death_prob = np.where(fitness == 0, 1,
+                                  np.clip(cohorts.parameters["omega"] * (1 - fitness), 0, 1))
+            deaths = self._draw(cohorts, death_prob)
+            cohorts.replace(cohorts.cells, cohorts.ages, cohorts.weights,
+                            cohorts.counts - deaths)
+            cohorts.merge(self.weight_bin)
+        self._version += 1
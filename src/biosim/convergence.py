@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import json
+
+import numpy as np
+
+
+class ConvergenceMonitor:
+    """Detects when the animal counts of a simulation have become stationary.
+    """
+
+    species = ("Herbivore", "Carnivore")
+
+    def __init__(self, window=50, tolerance=0.05, grids=False, stop=True):
+        """Detects when the animal counts of a simulation have become
+        stationary. The counts of the last window years are split in two
+        halves, and the counts are stationary when, for every species, the
+        means of the two halves differ by at most tolerance relative to the
+        mean of the whole window. With grids, also the mean counts per
+        location must agree, with the differences summed over all locations
+        relative to the mean total. The sums of both halves are kept up to
+        date as years are added, so every year costs the same whatever the
+        window.
+
+        :param window: Number of years compared, an even number
+        :type window: int, optional
+        :param tolerance: Largest relative difference of the half-window means
+        :type tolerance: float, optional
+        :param grids: If True, the counts per location must be stationary too
+        :type grids: bool, optional
+        :param stop: If True, the simulation stops when the counts first
+        become stationary, otherwise it only records the year
+        :type stop: bool, optional
+        :raises ValueError: If window is not an even number of at least 2,
+        or tolerance is negative
+        """
+        if window < 2 or window % 2:
+            raise ValueError("The window must be an even number of years, at least 2")
+        if tolerance < 0:
+            raise ValueError("The tolerance must be a nonnegative value.")
+        self.window = int(window)
+        self.tolerance = tolerance
+        self.grids = grids
+        self.stop = stop
+        self.converged_year = None
+
+        self._totals = np.zeros((self.window, len(self.species)), dtype=np.int64)
+        self._total_sums = np.zeros((2, len(self.species)), dtype=np.int64)
+        self._grids = None
+        self._grid_sums = None
+        self._position = 0
+        self._filled = 0
+
+        self._years = []
+        self._counts = []
+        self._changes = []
+        self._grid_changes = []
+
+    def __len__(self):
+        """Returns the number of monitored years."""
+        return len(self._years)
+
+    def _push(self, buffer, sums, values):
+        """Adds the values of a year to a ring buffer of the window, and
+        updates the sums of the older and the newer half of the window.
+
+        :param buffer: Ring buffer with the window years along the first axis
+        :type buffer: numpy.ndarray
+        :param sums: Sums of the older and the newer half
+        :type sums: numpy.ndarray
+        :param values: Values of the new year
+        :type values: numpy.ndarray
+        """
+        half = self.window // 2
+        if self._filled >= half:
+            # The oldest year of the newer half moves to the older half
+            middle = buffer[(self._position - half) % self.window]
+            sums[1] -= middle
+            sums[0] += middle
+            if self._filled == self.window:
+                sums[0] -= buffer[self._position]
+        sums[1] += values
+        buffer[self._position] = values
+
+    def _relative_change(self, sums, axes):
+        """Returns the difference of the half-window means relative to the
+        mean of the window, per species.
+
+        :param sums: Sums of the older and the newer half
+        :type sums: numpy.ndarray
+        :param axes: Axes summed over before comparing, e.g. the locations
+        :type axes: tuple
+        :rtype: numpy.ndarray
+        """
+        half = self.window // 2
+        difference = np.abs(sums[1] - sums[0]).sum(axis=axes) / half
+        mean = sums.sum(axis=0).sum(axis=axes) / self.window
+        return difference / np.maximum(mean, 1)
+
+    def update(self, year, counts, herb_grid=None, carn_grid=None):
+        """Adds the counts after a simulated year.
+
+        :param year: The simulated year
+        :type year: int
+        :param counts: Dict mapping species to number of animals
+        :type counts: dict
+        :param herb_grid: Herbivores per location, needed with grids
+        :type herb_grid: numpy.ndarray, optional
+        :param carn_grid: Carnivores per location, needed with grids
+        :type carn_grid: numpy.ndarray, optional
+        :return: True if the counts became stationary in this year
+        :rtype: bool
+        """
+        totals = np.array([counts[species] for species in self.species], dtype=np.int64)
+        self._push(self._totals, self._total_sums, totals)
+        if self.grids:
+            grid = np.stack((herb_grid, carn_grid)).astype(np.int64)
+            if self._grids is None:
+                self._grids = np.zeros((self.window,) + grid.shape, dtype=np.int64)
+                self._grid_sums = np.zeros((2,) + grid.shape, dtype=np.int64)
+            self._push(self._grids, self._grid_sums, grid)
+        self._position = (self._position + 1) % self.window
+        self._filled = min(self._filled + 1, self.window)
+
+        change = np.full(len(self.species), np.nan)
+        grid_change = np.full(len(self.species), np.nan)
+        if self._filled == self.window:
+            change = self._relative_change(self._total_sums, ())
+            if self.grids:
+                grid_change = self._relative_change(self._grid_sums, (1, 2))
+        self._years.append(year)
+        self._counts.append(totals)
+        self._changes.append(change)
+        self._grid_changes.append(grid_change)
+
+        stationary = self._filled == self.window and (change <= self.tolerance).all()
+        if self.grids:
+            stationary = stationary and (grid_change <= self.tolerance).all()
+        if stationary and self.converged_year is None:
+            self.converged_year = year
+            return True
+        return False
+
+    @property
+    def stationary(self):
+        """Array of bool with one entry per monitored year, True where the
+        counts were stationary."""
+        changes = np.array(self._changes, dtype=float).reshape(len(self), len(self.species))
+        stationary = (changes <= self.tolerance).all(axis=1)
+        if self.grids:
+            grid_changes = np.array(self._grid_changes,
+                                    dtype=float).reshape(len(self), len(self.species))
+            stationary &= (grid_changes <= self.tolerance).all(axis=1)
+        return stationary
+
+    def as_dict(self):
+        """Returns the monitored years as arrays.
+
+        :return: Dict mapping 'year', 'herb_count', 'carn_count',
+        'herb_change', 'carn_change', 'herb_grid_change', 'carn_grid_change'
+        and 'stationary' to arrays with one entry per year. The changes are
+        NaN until the window is filled, and the grid changes without grids.
+        :rtype: dict
+        """
+        shape = (len(self), len(self.species))
+        counts = np.array(self._counts, dtype=np.int64).reshape(shape)
+        changes = np.array(self._changes, dtype=float).reshape(shape)
+        grid_changes = np.array(self._grid_changes, dtype=float).reshape(shape)
+        return {"year": np.array(self._years, dtype=np.int64),
+                "herb_count": counts[:, 0],
+                "carn_count": counts[:, 1],
+                "herb_change": changes[:, 0],
+                "carn_change": changes[:, 1],
+                "herb_grid_change": grid_changes[:, 0],
+                "carn_grid_change": grid_changes[:, 1],
+                "stationary": self.stationary}
+
+    def write(self, path):
+        """Writes the monitored years to a CSV or JSON file.
+
+        The CSV file has one line per year with the columns of as_dict, the
+        first stationary year being the year of convergence. The JSON file
+        holds a list per column, together with converged_year, window and
+        tolerance.
+
+        :param path: File name ending with '.csv' or '.json'
+        :type path: str
+        :raises ValueError: If the file type is neither CSV nor JSON
+        """
+        statistics = self.as_dict()
+        if path.endswith(".json"):
+            # NaN is not valid JSON, so changes not yet computed are written as null
+            data = {name: [None if value != value else value for value in values.tolist()]
+                    for name, values in statistics.items()}
+            data["converged_year"] = self.converged_year
+            data["window"] = self.window
+            data["tolerance"] = self.tolerance
+            with open(path, "w") as json_file:
+                json.dump(data, json_file)
+        elif path.endswith(".csv"):
+            table = np.column_stack(list(statistics.values()))
+            fmt = ["%d"] * 3 + ["%.6g"] * 4 + ["%d"]
+            np.savetxt(path, table, fmt=fmt, delimiter=",",
+                       header=",".join(statistics), comments="")
+        else:
+            raise ValueError("Unknown statistics file type: " + path)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import queue
+import subprocess
+import threading
+
+import numpy as np
+
+
+class ImageFrameWriter:
+    """Writes every frame to a separate image file.
+    """
+
+    def __init__(self, img_base, img_fmt):
+        """Writes every frame to a separate image file named as
+
+            '{}_{:05d}.{}'.format(img_base, img_no, img_fmt)
+
+        :param img_base: Beginning of file name for images, including path
+        :type img_base: str
+        :param img_fmt: File type for images, e.g. 'png'
+        :type img_fmt: str
+        """
+        self.img_base = img_base
+        self.img_fmt = img_fmt
+
+    def file_name(self, img_no):
+        """Returns the file name of an image.
+
+        :param img_no: Number of the image
+        :type img_no: int
+        :return: File name of the image
+        :rtype: str
+        """
+        return '{base}_{num:05d}.{type}'.format(base=self.img_base,
+                                                num=img_no,
+                                                type=self.img_fmt)
+
+    def write(self, frame, img_no):
+        """Writes a frame to its image file.
+
+        :param frame: RGBA pixel values of the frame, shape (height, width, 4)
+        :type frame: numpy.ndarray
+        :param img_no: Number of the image
+        :type img_no: int
+        """
+        import matplotlib.image as mimage
+
+        mimage.imsave(self.file_name(img_no), frame, format=self.img_fmt)
+
+    def flush(self):
+        """Nothing to flush, images are written directly.
+        """
+        pass
+
+    def close(self):
+        """Nothing to finish for separate image files.
+        """
+        pass
+
+
+class MovieFrameWriter:
+    """Streams frames as raw RGBA pixels into a single ffmpeg process.
+    """
+
+    def __init__(self, movie_file, ffmpeg_binary="ffmpeg", frame_rate=25):
+        """Streams frames as raw RGBA pixels into a single ffmpeg process,
+        which encodes them to movie_file. The process is started when the
+        first frame is written, since the frame size is needed to start it.
+
+        :param movie_file: File name of the movie, including path
+        :type movie_file: str
+        :param ffmpeg_binary: Name or path of the ffmpeg executable
+        :type ffmpeg_binary: str, optional
+        :param frame_rate: Frames per second in the movie
+        :type frame_rate: int, optional
+        """
+        self.movie_file = movie_file
+        self.ffmpeg_binary = ffmpeg_binary
+        self.frame_rate = frame_rate
+        self._process = None
+        self._frame_shape = None
+
+    def _command(self, width, height):
+        """Returns the ffmpeg command reading raw frames from stdin.
+
+        :param width: Width of the frames in pixels
+        :type width: int
+        :param height: Height of the frames in pixels
+        :type height: int
+        :return: Command with arguments
+        :rtype: list
+        """
+        # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
+        # section "Compatibility"
+        return [self.ffmpeg_binary,
+                '-y',
+                '-f', 'rawvideo',
+                '-pix_fmt', 'rgba',
+                '-s', '{}x{}'.format(width, height),
+                '-r', str(self.frame_rate),
+                '-i', '-',
+                '-profile:v', 'baseline',
+                '-level', '3.0',
+                '-pix_fmt', 'yuv420p',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                self.movie_file]
+
+    def write(self, frame, img_no):
+        """Writes a frame to the ffmpeg process, starting it if needed.
+
+        :param frame: RGBA pixel values of the frame, shape (height, width, 4)
+        :type frame: numpy.ndarray
+        :param img_no: Number of the image, frames are written in order
+        :type img_no: int
+        :raises ValueError: If the frame size differs from the first frame
+        :raises RuntimeError: If ffmpeg can not be started or has stopped
+        """
+        if self._process is None:
+            height, width = frame.shape[:2]
+            try:
+                self._process = subprocess.Popen(self._command(width, height),
+                                                 stdin=subprocess.PIPE)
+            except OSError as err:
+                raise RuntimeError('ERROR: ffmpeg could not be started: {}'.format(err))
+            self._frame_shape = frame.shape
+
+        if frame.shape != self._frame_shape:
+            raise ValueError("All frames in a movie must have the same size")
+
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame))
+        except (BrokenPipeError, OSError) as err:
+            raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(err))
+
+    def flush(self):
+        """Flushes the frames written so far to ffmpeg.
+        """
+        if self._process is not None:
+            self._process.stdin.flush()
+
+    def close(self):
+        """Ends the stream, and waits for ffmpeg to finish the movie file.
+
+        :raises RuntimeError: If ffmpeg did not finish successfully
+        """
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        return_code = process.wait()
+        if return_code != 0:
+            raise RuntimeError('ERROR: ffmpeg failed with return code {}'
+                               .format(return_code))
+
+
+class BackgroundFrameWriter:
+    """Writes frames with another frame writer in a background thread.
+    """
+
+    def __init__(self, writer, max_queued=8):
+        """Writes frames with another frame writer in a background thread,
+        so that encoding and writing does not block the caller. Frames are
+        written one at a time in the order they are given.
+
+        :param writer: Frame writer doing the actual writing, e.g.
+        :class:'src.biosim.frame_writer.ImageFrameWriter'
+        :type writer: ImageFrameWriter or MovieFrameWriter
+        :param max_queued: Number of frames that can wait to be written before
+        write blocks the caller
+        :type max_queued: int, optional
+        """
+        self.writer = writer
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_queued, daemon=True)
+        self._thread.start()
+
+    def _write_queued(self):
+        """Writes queued frames until the end marker None is taken.
+        Frames queued after an error are discarded.
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    frame, img_no = item
+                    self.writer.write(frame, img_no)
+            except Exception as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        """Raises the error from the background thread, if any. The error
+        is kept, so the writer stays failed and every later call raises it
+        again instead of writing an output with missing frames.
+        """
+        if self._error is not None:
+            raise self._error
+
+    def write(self, frame, img_no):
+        """Copies the frame and queues it for writing. Blocks while the
+        queue is full.
+
+        :param frame: RGBA pixel values of the frame, shape (height, width, 4)
+        :type frame: numpy.ndarray
+        :param img_no: Number of the image
+        :type img_no: int
+        :raises Exception: Error from writing an earlier frame
+        """
+        self._raise_error()
+        self._queue.put((np.array(frame), img_no))
+
+    def flush(self):
+        """Waits until all queued frames are written.
+
+        :raises Exception: Error from writing a queued frame
+        """
+        self._queue.join()
+        self._raise_error()
+        self.writer.flush()
+
+    def close(self):
+        """Writes all queued frames, stops the background thread and closes
+        the underlying writer.
+
+        :raises Exception: Error from writing a queued frame
+        """
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._raise_error()
+        finally:
+            # Also after an error, so an ffmpeg process is not left running
+            self.writer.close()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import json
+
+import numpy as np
+
+
+class CycleInstrumentation:
+    """Collects the time spent in each phase of the annual cycle, and the
+    number of animals processed, born, dead, killed and migrated per year.
+    """
+
+    phases = ("fodder_growth", "sort_by_fitness", "herb_feeding", "carn_feeding",
+              "procreation", "migration", "aging", "weight_loss", "animal_death")
+    events = ("births", "deaths", "kills", "migrations")
+
+    def __init__(self, first_year=1):
+        """Collects the time spent in each phase of the annual cycle, and the
+        number of animals processed, born, dead, killed and migrated per year.
+        Filled by :class:'src.biosim.annual_cycle.AnnualCycle' while
+        instrumentation is enabled.
+
+        :param first_year: Year given to the first recorded cycle
+        :type first_year: int, optional
+        """
+        self.first_year = first_year
+        self._phase_times = []
+        self._processed = []
+        self._events = []
+
+    def __len__(self):
+        """Returns the number of recorded years."""
+        return len(self._events)
+
+    def record_year(self, phase_times, processed, events):
+        """Records the statistics of one annual cycle.
+
+        :param phase_times: Wall time in seconds for each phase, in the order of phases
+        :type phase_times: list
+        :param processed: Number of animals or cells processed by each phase
+        :type processed: list
+        :param events: Number of births, deaths, kills and migrations
+        :type events: list
+        """
+        self._phase_times.append(phase_times)
+        self._processed.append(processed)
+        self._events.append(events)
+
+    @property
+    def years(self):
+        """Array with the year of each recorded cycle."""
+        return np.arange(self.first_year, self.first_year + len(self), dtype=np.int64)
+
+    @property
+    def phase_times(self):
+        """Array of shape (years, phases) with wall time in seconds."""
+        return np.array(self._phase_times, dtype=float).reshape(len(self), len(self.phases))
+
+    @property
+    def processed(self):
+        """Array of shape (years, phases) with number of animals processed.
+        The fodder growth phase counts the cells instead."""
+        return np.array(self._processed, dtype=np.int64).reshape(len(self), len(self.phases))
+
+    def as_dict(self):
+        """Returns all statistics as arrays.
+
+        :return: Dict mapping 'year', 'phase_times', 'processed', 'births',
+        'deaths', 'kills' and 'migrations' to arrays with one entry per year
+        :rtype: dict
+        """
+        events = np.array(self._events, dtype=np.int64).reshape(len(self), len(self.events))
+        statistics = {"year": self.years,
+                      "phase_times": self.phase_times,
+                      "processed": self.processed}
+        for index, event in enumerate(self.events):
+            statistics[event] = events[:, index]
+        return statistics
+
+    def write(self, path):
+        """Writes the statistics to a CSV or JSON file.
+
+        The CSV file has one line per year, with the columns year,
+        <phase>_time and <phase>_processed for each phase, births, deaths,
+        kills and migrations. The JSON file holds the phase names, and a
+        list per statistic as returned by as_dict.
+
+        :param path: File name ending with '.csv' or '.json'
+        :type path: str
+        :raises ValueError: If the file type is neither CSV nor JSON
+        """
+        statistics = self.as_dict()
+        if path.endswith(".json"):
+            data = {name: values.tolist() for name, values in statistics.items()}
+            data["phases"] = list(self.phases)
+            with open(path, "w") as json_file:
+                json.dump(data, json_file)
+        elif path.endswith(".csv"):
+            columns = (["year"]
+                       + [phase + "_time" for phase in self.phases]
+                       + [phase + "_processed" for phase in self.phases]
+                       + list(self.events))
+            table = np.column_stack([statistics["year"], statistics["phase_times"],
+                                     statistics["processed"]]
+                                    + [statistics[event] for event in self.events])
+            fmt = (["%d"] + ["%.9f"] * len(self.phases)
+                   + ["%d"] * (len(self.phases) + len(self.events)))
+            np.savetxt(path, table, fmt=fmt, delimiter=",",
+                       header=",".join(columns), comments="")
+        else:
+            raise ValueError("Unknown statistics file type: " + path)
@@ -3,10 +3,154 @@
 __author__ = 'Daniil Efremov', 'Sigurd Grøtan'
 __email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
 
-import textwrap
 from landscape import *
 import numpy as np
 
+_TERRAIN_LETTERS = "OJSDM"
+_TERRAIN_CLASSES = (Ocean, Jungle, Savannah, Desert, Mountain)
+_NO_TERRAIN = 255
+_TERRAIN_LOOKUP = np.full(256, _NO_TERRAIN, dtype=np.uint8)
+for _code, _letter in enumerate(_TERRAIN_LETTERS):
+    _TERRAIN_LOOKUP[ord(_letter)] = _code
+    _TERRAIN_LOOKUP[ord(_letter.lower())] = _code
+
+_NEWLINE, _CARRIAGE_RETURN, _SPACE, _TAB = 10, 13, 32, 9
+
+
+def _geo_chars(geo_string):
+    """Turns a geography into a matrix of character codes, with the common
+    leading whitespace of the lines removed as by textwrap.dedent. All work
+    is done with NumPy operations on the bytes, so even very large maps are
+    split without creating a Python object per line or character.
+
+    :param geo_string: Multi-line string specifying island geography, or its bytes
+    :type geo_string: str, bytes or numpy.ndarray of numpy.uint8
+    :raises ValueError: If the geography contains other than ASCII characters
+    :raises ValueError: If map is not of rectangular shape
+    :return: Character codes of shape (rows, columns)
+    :rtype: numpy.ndarray of numpy.uint8
+    """
+    if isinstance(geo_string, str):
+        try:
+            geo_string = geo_string.encode("ascii")
+        except UnicodeEncodeError:
+            raise ValueError("Geography string must consist of only O, J, M, S, D")
+    buffer = np.frombuffer(geo_string, dtype=np.uint8)
+    if (buffer == _CARRIAGE_RETURN).any():
+        buffer = buffer[buffer != _CARRIAGE_RETURN]
+
+    newlines = np.flatnonzero(buffer == _NEWLINE)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buffer)]))
+    text = np.flatnonzero((buffer != _SPACE) & (buffer != _TAB) & (buffer != _NEWLINE))
+    if len(text) == 0:
+        raise ValueError("The map string can not be empty!")
+
+    # Position of the first character that is not whitespace on every line
+    first = np.searchsorted(text, starts)
+    first_text = text[np.minimum(first, len(text) - 1)]
+    blank = (first == len(text)) | (first_text >= ends)
+    if blank[-1]:
+        starts, ends, first_text, blank = starts[:-1], ends[:-1], first_text[:-1], blank[:-1]
+
+    margin = (first_text - starts)[~blank].min()
+    widths = np.where(blank, 0, ends - starts - margin)
+    if widths[0] == 0 or (widths != widths[0]).any():
+        raise ValueError("The map string has to be of rectangular shape!")
+    return buffer[(starts + margin)[:, np.newaxis] + np.arange(widths[0])]
+
+
+def _terrain_from_chars(chars):
+    """Turns character codes into terrain codes, the index of the landscape
+    letter in 'OJSDM'. Lower case letters are accepted.
+
+    :param chars: Character codes of shape (rows, columns)
+    :type chars: numpy.ndarray of numpy.uint8
+    :raises ValueError: If the characters are not landscape letters
+    :return: Terrain codes of shape (rows, columns)
+    :rtype: numpy.ndarray of numpy.uint8
+    """
+    terrain = _TERRAIN_LOOKUP[chars]
+    if (terrain == _NO_TERRAIN).any():
+        raise ValueError("Geography string must consist of only O, J, M, S, D")
+    return terrain
+
+
+class _CellDict(dict):
+    """Dict mapping location to Landscape cell, where each cell is created
+    from the terrain array the first time it is looked up. Cells that exist
+    are found as fast as in a plain dict. Iterating over the dict creates
+    every cell, in row-major order.
+    """
+
+    def __init__(self, terrain, fodder_grid=None):
+        """Dict mapping location to Landscape cell, where each cell is created
+        from the terrain array the first time it is looked up.
+
+        :param terrain: Terrain codes of shape (rows, columns)
+        :type terrain: numpy.ndarray of numpy.uint8
+        :param fodder_grid: One-dimensional view of the fodder grid of the island
+        the cells keep their fodder in, if any
+        :type fodder_grid: numpy.ndarray, optional
+        """
+        super().__init__()
+        self._terrain = terrain
+        self._fodder_grid = fodder_grid
+        self._complete = False
+
+    def _is_location(self, loc):
+        """Returns True if loc is a location on the terrain."""
+        try:
+            row, col = loc
+            return 0 <= row < self._terrain.shape[0] and 0 <= col < self._terrain.shape[1]
+        except (TypeError, ValueError):
+            return False
+
+    def __missing__(self, loc):
+        if not self._is_location(loc):
+            raise KeyError(loc)
+        row, col = int(loc[0]), int(loc[1])
+        cell = _TERRAIN_CLASSES[self._terrain[row, col]]()
+        if self._fodder_grid is not None:
+            cell.bind_fodder(self._fodder_grid, row * self._terrain.shape[1] + col)
+        dict.__setitem__(self, (row, col), cell)
+        return cell
+
+    def _create_all(self):
+        """Creates every cell, and orders the dict by location."""
+        if self._complete:
+            return
+        rows, cols = self._terrain.shape
+        cells = {(row, col): self[row, col] for row in range(rows) for col in range(cols)}
+        dict.clear(self)
+        dict.update(self, cells)
+        self._complete = True
+
+    def __contains__(self, loc):
+        return dict.__contains__(self, loc) or self._is_location(loc)
+
+    def __len__(self):
+        return self._terrain.size
+
+    def __iter__(self):
+        self._create_all()
+        return dict.__iter__(self)
+
+    def get(self, loc, default=None):
+        return self[loc] if loc in self else default
+
+    def keys(self):
+        self._create_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._create_all()
+        return dict.values(self)
+
+    def items(self):
+        self._create_all()
+        return dict.items(self)
+
 
 class Island:
     """Island class. Manages the whole Island of Landscape cells.
@@ -27,22 +171,194 @@ class Island:
                OOOSSSSJJJJJJJOOOOOOO
                OOOOOOOOOOOOOOOOOOOOO"""
 
-    def __init__(self, geo_string=None):
+    terrain_letters = _TERRAIN_LETTERS
+
+    def __init__(self, geo_string=None, terrain=None):
         """Island class. Manages the whole Island of Landscape cells.
 
-        :param geo_string: Multi-line string specifying island geography
-        :type geo_string: str, optional
+        The geography is parsed and validated in one pass over its bytes
+        into the terrain array. The Landscape cells in island_dict are
+        only created when they are first looked up.
+
+        :param geo_string: Multi-line string specifying island geography,
+        or its bytes, e.g. a memory-mapped file
+        :type geo_string: str, bytes or numpy.ndarray, optional
+        :param terrain: Terrain codes to use instead of geo_string, see
+        :meth:'from_terrain'
+        :type terrain: numpy.ndarray, optional
         """
-        if geo_string is None:
-            geo_string = Island.default_geogr
-        self._check_geo_string(geo_string)
-        self.island_dict = self._island_dict_maker(geo_string)
+        if terrain is None:
+            if geo_string is None:
+                geo_string = Island.default_geogr
+            chars = _geo_chars(geo_string)
+            self._check_border(chars == ord("O"))
+            terrain = _terrain_from_chars(chars)
+        self.terrain = terrain
+        self.terrain.setflags(write=False)
+        self.shape = terrain.shape
+        self._version = 0
+        self._count_grids = None
+        self._registry = {"Herbivore": {}, "Carnivore": {}}
+        self._occupied = {}
+        self._occupied_sorted = []
+
+        self._jungle_mask = terrain == _TERRAIN_LETTERS.index("J")
+        self._savannah_mask = terrain == _TERRAIN_LETTERS.index("S")
+        self._f_max_grid = None
+        self._fodder = np.zeros(self.shape)
+        self._fodder[self._jungle_mask] = Landscape.landscape_parameters["J"]["f_max"]
+        self._fodder[self._savannah_mask] = Landscape.landscape_parameters["S"]["f_max"]
+        self.island_dict = _CellDict(terrain, self._fodder.ravel())
+
+    @classmethod
+    def from_terrain(cls, terrain):
+        """Creates an island from an array of terrain codes, where each code
+        is the index of the landscape letter in Island.terrain_letters.
+
+        :param terrain: Terrain codes of shape (rows, columns)
+        :type terrain: numpy.ndarray
+        :raises ValueError: If the array is not two-dimensional
+        :raises ValueError: If a code is not a landscape
+        :raises ValueError: If the edges of the map are not Ocean type
+        :return: Island with the given terrain
+        :rtype: Island
+        """
+        terrain = np.array(terrain)
+        if terrain.ndim != 2 or terrain.size == 0:
+            raise ValueError("The terrain has to be a two-dimensional array!")
+        if not np.issubdtype(terrain.dtype, np.integer) or \
+                (terrain < 0).any() or (terrain >= len(_TERRAIN_LETTERS)).any():
+            raise ValueError("Terrain codes must be the index of one of O, J, S, D, M")
+        terrain = terrain.astype(np.uint8)
+        cls._check_border(terrain == _TERRAIN_LETTERS.index("O"))
+        return cls(terrain=terrain)
+
+    @classmethod
+    def from_file(cls, path):
+        """Creates an island from a text file with the geography, which is
+        memory-mapped instead of read into a string.
+
+        :param path: Path of the file
+        :type path: str
+        :return: Island with the geography of the file
+        :rtype: Island
+        """
+        return cls(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    def get_terrain_letters(self):
+        """Returns the landscape letter of every location.
+
+        :return: Array of one-character strings of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        return np.array(list(_TERRAIN_LETTERS))[self.terrain]
 
     def fodder_annual_refill(self):
-        """Refills fodder on every location in island
+        """Refills fodder on every location in island. Jungle is refilled to
+        f_max, while Savannah grows by alpha times the missing fodder, up to
+        f_max. Both are done as masked updates of the fodder grid, with
+        f_max taken from the per-location f_max grid where one is set.
+        """
+        jungle_f_max = Landscape.landscape_parameters["J"]["f_max"]
+        savannah_f_max = Landscape.landscape_parameters["S"]["f_max"]
+        alpha = Landscape.landscape_parameters["S"]["alpha"]
+        fodder = self._fodder
+        jungle = self._jungle_mask
+        savannah = self._savannah_mask
+
+        if self._f_max_grid is None:
+            fodder[jungle] = jungle_f_max
+            savannah_fodder = fodder[savannah]
+            savannah_fodder += alpha * (savannah_f_max - savannah_fodder)
+            fodder[savannah] = np.minimum(savannah_fodder, savannah_f_max)
+        else:
+            overridden = ~np.isnan(self._f_max_grid)
+            fodder[jungle] = np.where(overridden[jungle],
+                                      self._f_max_grid[jungle], jungle_f_max)
+            f_max = np.where(overridden[savannah],
+                             self._f_max_grid[savannah], savannah_f_max)
+            savannah_fodder = fodder[savannah]
+            savannah_fodder += alpha * (f_max - savannah_fodder)
+            fodder[savannah] = np.minimum(savannah_fodder, f_max)
+
+    def fodder_refill_years(self, num_years):
+        """Refills fodder as num_years calls of fodder_annual_refill would on
+        an island where nothing is eaten, in closed form. Jungle is at f_max
+        after the first year, while the fodder missing on Savannah shrinks
+        by the factor 1 - alpha every year, so after n years it is
+        f_max - (1 - alpha)**n * (f_max - fodder), up to f_max. The result
+        can differ from the yearly refills in the last bits of a float.
+
+        :param num_years: Number of years to refill
+        :type num_years: int
+        """
+        if num_years <= 0:
+            return
+        jungle_f_max = Landscape.landscape_parameters["J"]["f_max"]
+        savannah_f_max = Landscape.landscape_parameters["S"]["f_max"]
+        alpha = Landscape.landscape_parameters["S"]["alpha"]
+        fodder = self._fodder
+        jungle = self._jungle_mask
+        savannah = self._savannah_mask
+
+        if self._f_max_grid is None:
+            fodder[jungle] = jungle_f_max
+            f_max = savannah_f_max
+        else:
+            overridden = ~np.isnan(self._f_max_grid)
+            fodder[jungle] = np.where(overridden[jungle],
+                                      self._f_max_grid[jungle], jungle_f_max)
+            f_max = np.where(overridden[savannah],
+                             self._f_max_grid[savannah], savannah_f_max)
+        # With alpha above 1 the first refill already reaches f_max
+        remaining = max(1 - alpha, 0) ** num_years
+        savannah_fodder = f_max - remaining * (f_max - fodder[savannah])
+        fodder[savannah] = np.minimum(savannah_fodder, f_max)
+
+    def set_f_max_grid(self, f_max_grid):
+        """Sets f_max per location, e.g. from a fertility map, replacing the
+        f_max of the landscape parameters where the grid is not NaN. Only
+        Jungle and Savannah locations are refilled.
+
+        :param f_max_grid: f_max per location, NaN to use the landscape
+        parameter, or None to use the landscape parameters everywhere
+        :type f_max_grid: numpy.ndarray of shape (rows, columns) or None
+        :raises ValueError: If the grid does not have the shape of the island
+        :raises ValueError: If the grid contains negative values
+        """
+        if f_max_grid is None:
+            self._f_max_grid = None
+            return
+        f_max_grid = np.array(f_max_grid, dtype=float)
+        if f_max_grid.shape != self.shape:
+            raise ValueError("The f_max grid must have the shape of the island")
+        if (f_max_grid < 0).any():
+            raise ValueError("Parameter f_max must be a nonnegative value.")
+        self._f_max_grid = f_max_grid
+
+    def get_f_max_grid(self):
+        """Returns the f_max set per location by set_f_max_grid.
+
+        :return: Copy of the f_max grid, or None if none is set
+        :rtype: numpy.ndarray or NoneType
+        """
+        if self._f_max_grid is None:
+            return None
+        return self._f_max_grid.copy()
+
+    def get_occupied_locations(self):
+        """Returns the locations with at least one animal, in the same
+        order as in island_dict. The locations are kept up to date as
+        animals are added and removed, so empty cells are never visited.
+        The sorted list is kept until a location becomes occupied or empty,
+        so it is shared between calls and must not be changed.
+
+        :return: List of locations
+        :rtype: list
         """
-        for loc in self.island_dict:
-            self.island_dict[loc].fodder_annual_refill()
+        if self._occupied_sorted is None:
+            self._occupied_sorted = sorted(self._occupied)
+        return self._occupied_sorted
 
     def get_fodder_on_loc(self, loc):
         """Returns fodder on location
@@ -88,6 +404,15 @@ class Island:
         <class 'src.biosim.animals.Carnivore'>
         """
         self.island_dict[loc].add_pop(animal)
+        self._version += 1
+        registry = self._registry.get(animal.__class__.__name__)
+        if registry is not None:
+            registry[animal] = None
+            if loc in self._occupied:
+                self._occupied[loc] += 1
+            else:
+                self._occupied[loc] = 1
+                self._occupied_sorted = None
 
     def remove_pop_on_loc(self, loc, animal):
         """Removes the input animal-instance of either Herbivore or Carnivore
@@ -104,6 +429,15 @@ class Island:
         """
 
         self.island_dict[loc].remove_pop(animal)
+        self._version += 1
+        registry = self._registry.get(animal.__class__.__name__)
+        if registry is not None:
+            del registry[animal]
+            if self._occupied[loc] == 1:
+                del self._occupied[loc]
+                self._occupied_sorted = None
+            else:
+                self._occupied[loc] -= 1
 
     def get_num_herb_on_loc(self, loc):
         """Returns number of Herbivores on location
@@ -136,32 +470,48 @@ class Island:
         self.island_dict[loc].herb_eats_fodder(fodder_eaten)
 
     def sort_all_animals_by_fitness(self):
-        """Sorts all animals in island by fitness.
+        """Sorts all animals in island by fitness. The registry of all
+        animals is put in the same order, location by location.
         """
-        for loc in self.island_dict:
-            self.island_dict[loc].sort_pop_by_fitness()
+        herb_registry = {}
+        carn_registry = {}
+        for loc in self.get_occupied_locations():
+            cell = self.island_dict[loc]
+            cell.sort_pop_by_fitness()
+            herb_registry.update(dict.fromkeys(cell.get_herb_pop_list()))
+            carn_registry.update(dict.fromkeys(cell.get_carn_pop_list()))
+        self._registry = {"Herbivore": herb_registry, "Carnivore": carn_registry}
 
     def get_all_herb_list(self):
-        """Returns list containing all Herbivores on island
+        """Returns list containing all Herbivores on island. The list is a
+        snapshot of the registry of all Herbivores, so animals can be added
+        and removed while iterating over it. The Herbivores are in location
+        order as of the last sort, followed by the ones added since.
 
         :return: List with all Herbivores
         :rtype: list
         """
-        all_herb_list = []
-        for loc in self.island_dict:
-            all_herb_list.extend(self.get_herb_list_on_loc(loc))
-        return all_herb_list
+        return list(self._registry["Herbivore"])
 
     def get_all_carn_list(self):
-        """Returns list containing all Carnivores on island
+        """Returns list containing all Carnivores on island. The list is a
+        snapshot of the registry of all Carnivores, so animals can be added
+        and removed while iterating over it. The Carnivores are in location
+        order as of the last sort, followed by the ones added since.
 
         :return: List with all Carnivores
         :rtype: list
         """
-        all_carn_list = []
-        for loc in self.island_dict:
-            all_carn_list.extend(self.get_carn_list_on_loc(loc))
-        return all_carn_list
+        return list(self._registry["Carnivore"])
+
+    def get_num_animals_per_species(self):
+        """Returns the number of animals of each species on island, taken
+        from the registries of all animals, so no cell has to be visited.
+
+        :return: Dict mapping 'Herbivore' and 'Carnivore' to number of animals
+        :rtype: dict
+        """
+        return {species: len(registry) for species, registry in self._registry.items()}
 
     def get_total_herb_weight_on_loc(self, loc):
         """Returns the total Herbivore weight on location
@@ -193,22 +543,85 @@ class Island:
         :raises ValueError: If map is not of rectangular shape
         :raises ValueError: If the edges of the map are not Ocean type
         """
-        geo_string = textwrap.dedent(geo_string)
-        geo_list = [list(line) for line in geo_string.splitlines()]
-        for line in geo_list:
-            if len(line) != len(geo_list[0]):
-                raise ValueError("The map string has to be of rectangular shape!")
+        Island._check_border(_geo_chars(geo_string) == ord("O"))
+
+    @staticmethod
+    def _check_border(ocean):
+        """Raises ValueError unless all edges of the map are Ocean.
+
+        :param ocean: True where the map is Ocean, of shape (rows, columns)
+        :type ocean: numpy.ndarray of bool
+        :raises ValueError: If the edges of the map are not Ocean type
+        """
+        if not (ocean[0, :].all() and ocean[-1, :].all()
+                and ocean[:, 0].all() and ocean[:, -1].all()):
+            raise ValueError("The edges of the map must be all ocean type!")
+
+    def _update_count_grids(self):
+        """Counts the animals per cell, unless animals have not been added or
+        removed since the last count.
+        """
+        if self._count_grids is not None and self._count_grids[0] == self._version:
+            return
+        herb_grid = np.zeros(self.shape, dtype=int)
+        carn_grid = np.zeros(self.shape, dtype=int)
+        for loc in self._occupied:
+            cell = self.island_dict[loc]
+            herb_grid[loc] = cell.get_num_herb()
+            carn_grid[loc] = cell.get_num_carn()
+        herb_grid.setflags(write=False)
+        carn_grid.setflags(write=False)
+        self._count_grids = (self._version, herb_grid, carn_grid)
+
+    def get_herb_count_grid(self):
+        """Returns the number of Herbivores on every location. The grid is
+        counted again only after animals have been added or removed.
+
+        :return: Read-only array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        self._update_count_grids()
+        return self._count_grids[1]
+
+    def get_carn_count_grid(self):
+        """Returns the number of Carnivores on every location. The grid is
+        counted again only after animals have been added or removed.
+
+        :return: Read-only array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        self._update_count_grids()
+        return self._count_grids[2]
+
+    def get_habitable_grid(self):
+        """Returns which locations animals can be placed on, i.e. all
+        locations that are neither Ocean nor Mountain.
 
-        geo_matrix = np.array(geo_list)
-        top_slice = geo_matrix[0, :]
-        bottom_slice = geo_matrix[-1, :]
-        left_slice = geo_matrix[:, 0]
-        right_slice = geo_matrix[:, -1]
-        whole_frame_array = np.concatenate((top_slice, bottom_slice, left_slice, right_slice), axis=None)
+        :return: Boolean array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        return (self.terrain != _TERRAIN_LETTERS.index("O")) & \
+               (self.terrain != _TERRAIN_LETTERS.index("M"))
 
-        for geo in whole_frame_array:
-            if geo != "O":
-                raise ValueError("The edges of the map must be all ocean type!")
+    def get_fodder_grid(self):
+        """Returns the fodder on every location.
+
+        :return: Array of shape (rows, columns)
+        :rtype: numpy.ndarray
+        """
+        return self._fodder.copy()
+
+    def set_fodder_grid(self, fodder_grid):
+        """Sets the fodder on every location.
+
+        :param fodder_grid: Fodder per location
+        :type fodder_grid: numpy.ndarray of shape (rows, columns)
+        :raises ValueError: If the grid does not have the shape of the island
+        """
+        fodder_grid = np.asarray(fodder_grid, dtype=float)
+        if fodder_grid.shape != self.shape:
+            raise ValueError("The fodder grid must have the shape of the island")
+        self._fodder[...] = fodder_grid
 
     @property
     def island_data(self):
@@ -218,13 +631,11 @@ class Island:
         :return: Nested list with data
         :rtype: list
         """
-        island_data = []
-        for loc in self.island_dict:
-            i, j = loc[0], loc[1]
-            herb_count = self.get_num_herb_on_loc(loc)
-            carn_count = self.get_num_carn_on_loc(loc)
-            island_data.append([i, j, herb_count, carn_count])
-        return island_data
+        rows, cols = np.indices(self.shape)
+        island_data = np.column_stack((rows.ravel(), cols.ravel(),
+                                       self.get_herb_count_grid().ravel(),
+                                       self.get_carn_count_grid().ravel()))
+        return island_data.tolist()
 
 
 
@@ -232,7 +643,8 @@ class Island:
     def _island_dict_maker(geo_string):
         """Turns geo_string into a readable format and creates a dictionary
         containing x, y coordinates as key, and an instance of one of the five
-        landscape subclasses as value.
+        landscape subclasses as value. The instances are created when they
+        are first looked up.
 
         :param geo_string: Multi-line string specifying island geography
         :type geo_string: str
@@ -241,28 +653,7 @@ class Island:
         as value
         :rtype: dict
         """
-        geo_string = textwrap.dedent(geo_string)
-        geo_list = [list(line) for line in geo_string.splitlines()]
-        island_dict = {}
-
-        for i, line in enumerate(geo_list):
-            for j, landscape_code in enumerate(line):
-                landscape_code = landscape_code.upper()
-                if landscape_code == "O":
-                    geo = Ocean()
-                elif landscape_code == "J":
-                    geo = Jungle()
-                elif landscape_code == "M":
-                    geo = Mountain()
-                elif landscape_code == "S":
-                    geo = Savannah()
-                elif landscape_code == "D":
-                    geo = Desert()
-                else:
-                    raise ValueError("Geography string must consist of only O, J, M, S, D")
-                island_dict[(i, j)] = geo
-
-        return island_dict
+        return _CellDict(_terrain_from_chars(_geo_chars(geo_string)))
 
     @staticmethod
     def _param_changer(landscape, new_params):
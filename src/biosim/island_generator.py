@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import numpy as np
+
+from island import Island
+
+default_fractions = {"J": 0.35, "S": 0.3, "D": 0.15, "M": 0.1, "O": 0.1}
+
+
+def _smooth(field, patch_size):
+    """Returns the moving average of field over patch_size x patch_size
+    windows, computed with cumulative sums along each axis."""
+    for axis in (0, 1):
+        padded = np.concatenate((np.zeros_like(np.take(field, [0], axis=axis)),
+                                 np.cumsum(field, axis=axis)), axis=axis)
+        length = field.shape[axis]
+        upper = np.minimum(np.arange(length) + patch_size // 2 + 1, length)
+        lower = np.maximum(np.arange(length) - patch_size // 2, 0)
+        window = (upper - lower).reshape((-1, 1) if axis == 0 else (1, -1))
+        field = (np.take(padded, upper, axis=axis) - np.take(padded, lower, axis=axis)) / window
+    return field
+
+
+def generate_terrain(rows, cols, fractions=None, patch_size=5, border=1, seed=None):
+    """Generates the terrain of a random island, with the landscapes in
+    clustered patches. Random values are smoothed over patches of
+    patch_size cells and ranked, and each landscape takes the band of ranks
+    given by its fraction.
+
+    :param rows: Number of rows of the map
+    :type rows: int
+    :param cols: Number of columns of the map
+    :type cols: int
+    :param fractions: Dict mapping landscape letter to the fraction of the
+    cells inside the border it covers, defaults to default_fractions
+    :type fractions: dict, optional
+    :param patch_size: Typical width of the patches in cells
+    :type patch_size: int, optional
+    :param border: Width of the Ocean border
+    :type border: int, optional
+    :param seed: Seed of the random number generator
+    :type seed: int, optional
+    :raises ValueError: If the map has no cells inside the border
+    :raises ValueError: If a letter is not a landscape, or a fraction is negative
+    :return: Terrain codes, see :meth:'src.biosim.island.Island.from_terrain'
+    :rtype: numpy.ndarray of numpy.uint8
+    """
+    if fractions is None:
+        fractions = default_fractions
+    if border < 1 or rows <= 2 * border or cols <= 2 * border:
+        raise ValueError("The map must have cells inside an Ocean border "
+                         "at least one cell wide")
+    for letter, fraction in fractions.items():
+        if letter not in Island.terrain_letters:
+            raise ValueError("Landscape letter must be one of O, J, S, D, M")
+        if fraction < 0:
+            raise ValueError("Fraction of {0} must be a nonnegative value.".format(letter))
+    total = sum(fractions.values())
+    if total <= 0:
+        raise ValueError("The fractions must not all be zero")
+
+    rng = np.random.default_rng(seed)
+    inner_shape = (rows - 2 * border, cols - 2 * border)
+    patch_size = max(int(patch_size), 1)
+    # Smoothing twice gives rounder patches than a single box average
+    field = _smooth(_smooth(rng.random(inner_shape), patch_size), patch_size)
+
+    inner = np.empty(field.size, dtype=np.uint8)
+    ranks = np.argsort(field, axis=None, kind="stable")
+    bounds = np.round(np.cumsum([fraction / total for fraction in fractions.values()])
+                      * field.size).astype(int)
+    start = 0
+    for letter, stop in zip(fractions, bounds):
+        inner[ranks[start:stop]] = Island.terrain_letters.index(letter)
+        start = stop
+
+    terrain = np.full((rows, cols), Island.terrain_letters.index("O"), dtype=np.uint8)
+    terrain[border:rows - border, border:cols - border] = inner.reshape(inner_shape)
+    return terrain
+
+
+def terrain_to_geography(terrain):
+    """Turns terrain codes into a geography string as read by Island.
+
+    :param terrain: Terrain codes of shape (rows, columns)
+    :type terrain: numpy.ndarray
+    :return: Multi-line string specifying island geography
+    :rtype: str
+    """
+    letters = np.frombuffer(Island.terrain_letters.encode("ascii"), dtype=np.uint8)
+    chars = np.full((terrain.shape[0], terrain.shape[1] + 1), ord("\n"), dtype=np.uint8)
+    chars[:, :-1] = letters[terrain]
+    return chars.tobytes()[:-1].decode("ascii")
+
+
+def generate_geography(rows, cols, fractions=None, patch_size=5, border=1, seed=None):
+    """Generates the geography string of a random island, see generate_terrain.
+
+    :return: Multi-line string specifying island geography
+    :rtype: str
+    """
+    return terrain_to_geography(generate_terrain(rows, cols, fractions=fractions,
+                                                 patch_size=patch_size,
+                                                 border=border, seed=seed))
@@ -3,6 +3,8 @@
 __author__ = 'Daniil Efremov', 'Sigurd Grøtan'
 __email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
 
+import numpy as np
+
 
 class Landscape:
     """This is the base class for all the different types
@@ -17,8 +19,35 @@ class Landscape:
         """
         self.herb_pop_list = []
         self.carn_pop_list = []
+        self._fodder_grid = np.zeros(1)
+        self._fodder_index = 0
         self.fodder = 0
 
+    @property
+    def fodder(self):
+        """Fodder on cell. Once the cell is part of an island, the fodder is
+        stored in the fodder grid of the island.
+
+        :rtype: float
+        """
+        return self._fodder_grid.item(self._fodder_index)
+
+    @fodder.setter
+    def fodder(self, fodder):
+        self._fodder_grid[self._fodder_index] = fodder
+
+    def bind_fodder(self, fodder_grid, index):
+        """Makes an element of a shared fodder grid hold the fodder on cell.
+        The fodder already in the grid is kept.
+
+        :param fodder_grid: One-dimensional view of the fodder grid of the island
+        :type fodder_grid: numpy.ndarray
+        :param index: Index of the cell in fodder_grid
+        :type index: int
+        """
+        self._fodder_grid = fodder_grid
+        self._fodder_index = index
+
     def add_pop(self, animal):
         """Adds an animal instance to the appropriate animal list on cell
 
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+import json
+import os
+
+import numpy as np
+
+_METADATA_FILE = "history.json"
+
+
+def _write_json(path, data):
+    """Writes data as JSON to a temporary file which then replaces path,
+    so readers never see a partly written file.
+
+    :param path: Path of the JSON file
+    :type path: str
+    :param data: Data to write
+    :type data: dict
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, path)
+
+
+def load_history(out_dir):
+    """Loads the series recorded by a HistoryRecorder, also while it is
+    still recording.
+
+    :param out_dir: Directory the recorder writes to
+    :type out_dir: str
+    :return: Dict mapping series name to read-only memory-mapped array
+    holding the recorded years along the first axis
+    :rtype: dict
+    """
+    with open(os.path.join(out_dir, _METADATA_FILE)) as json_file:
+        metadata = json.load(json_file)
+    length = metadata["length"]
+    return {name: np.load(os.path.join(out_dir, name + ".npy"), mmap_mode="r")[:length]
+            for name in metadata["series"]}
+
+
+class HistoryRecorder:
+    """Records yearly series of the island to memory-mapped .npy files.
+    """
+
+    species = ("Herbivore", "Carnivore")
+    histogram_attributes = ("age", "weight", "fitness")
+
+    def __init__(self, island, out_dir, count_grids=True, fodder_grids=True,
+                 histograms=None, capacity=64):
+        """Records yearly series of the island to memory-mapped .npy files in
+        out_dir, one file per series with the years along the first axis:
+
+        ===================  ===================================================
+        year                 Year of the record
+        totals               Number of Herbivores and Carnivores
+        herb_counts          Herbivores per location (if count_grids)
+        carn_counts          Carnivores per location (if count_grids)
+        fodder               Fodder per location (if fodder_grids)
+        herb_<attr>_hist     Histogram of a Herbivore attribute (if histograms)
+        carn_<attr>_hist     Histogram of a Carnivore attribute (if histograms)
+        ===================  ===================================================
+
+        The files are preallocated and grown by doubling when full. The number
+        of recorded years is kept in history.json, which is updated after
+        every record, so other processes can read the series with
+        load_history while the simulation runs.
+
+        :param island: An instance of the :class:'src.biosim.island.Island'
+        with data and methods, containing info about the geography.
+        :type island: class:'src.biosim.island.Island'
+        :param out_dir: Directory to write the files to, created if needed
+        :type out_dir: str
+        :param count_grids: If True, animals per location are recorded
+        :type count_grids: bool, optional
+        :param fodder_grids: If True, fodder per location is recorded
+        :type fodder_grids: bool, optional
+        :param histograms: Dict mapping 'age', 'weight' or 'fitness' to bin edges
+        :type histograms: dict, optional
+        :param capacity: Number of years the files are first allocated for
+        :type capacity: int, optional
+        :raises ValueError: If a histogram attribute is not age, weight or fitness
+        """
+        if histograms is None:
+            histograms = {}
+        for attribute in histograms:
+            if attribute not in self.histogram_attributes:
+                raise ValueError("Can not record histogram of '{0}', it must be "
+                                 "one of age, weight or fitness".format(attribute))
+
+        self.island = island
+        self.out_dir = out_dir
+        self.count_grids = count_grids
+        self.fodder_grids = fodder_grids
+        self.bin_edges = {attribute: np.asarray(edges, dtype=float)
+                          for attribute, edges in histograms.items()}
+        self.length = 0
+        self._capacity = capacity
+
+        os.makedirs(out_dir, exist_ok=True)
+        self._series_spec = {"year": ((), np.int64),
+                             "totals": ((len(self.species),), np.int64)}
+        if count_grids:
+            self._series_spec["herb_counts"] = (island.shape, np.int32)
+            self._series_spec["carn_counts"] = (island.shape, np.int32)
+        if fodder_grids:
+            self._series_spec["fodder"] = (island.shape, np.float64)
+        for attribute, edges in self.bin_edges.items():
+            for prefix in ("herb", "carn"):
+                name = "{}_{}_hist".format(prefix, attribute)
+                self._series_spec[name] = ((len(edges) - 1,), np.int64)
+
+        self._arrays = {name: self._open_series(name, capacity)
+                        for name in self._series_spec}
+        self._write_metadata()
+
+    def _path(self, name):
+        """Returns the path of the file of a series."""
+        return os.path.join(self.out_dir, name + ".npy")
+
+    def _open_series(self, name, capacity):
+        """Creates the file of a series with room for capacity years.
+
+        :param name: Name of the series
+        :type name: str
+        :param capacity: Number of years to allocate
+        :type capacity: int
+        :return: Writable memory-mapped array
+        :rtype: numpy.memmap
+        """
+        shape, dtype = self._series_spec[name]
+        return np.lib.format.open_memmap(self._path(name), mode="w+", dtype=dtype,
+                                         shape=(capacity,) + tuple(shape))
+
+    def _resize(self, capacity):
+        """Copies every series into a new file with room for capacity years,
+        which then replaces the old file. Readers of the old file keep their
+        data, since the old file is only unlinked.
+
+        :param capacity: New number of years to allocate
+        :type capacity: int
+        """
+        for name in self._series_spec:
+            shape, dtype = self._series_spec[name]
+            tmp_path = self._path(name) + ".tmp"
+            new_array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype,
+                                                  shape=(capacity,) + tuple(shape))
+            kept = min(self.length, capacity)
+            new_array[:kept] = self._arrays[name][:kept]
+            new_array.flush()
+            self._arrays[name] = None  # Closes the old mapping before replacing
+            os.replace(tmp_path, self._path(name))
+            self._arrays[name] = new_array
+        self._capacity = capacity
+
+    def _write_metadata(self):
+        """Writes the number of recorded years and the series descriptions."""
+        _write_json(os.path.join(self.out_dir, _METADATA_FILE),
+                    {"length": self.length,
+                     "species": list(self.species),
+                     "series": {name: {"shape": list(shape),
+                                       "dtype": np.dtype(dtype).str}
+                                for name, (shape, dtype) in self._series_spec.items()},
+                     "bin_edges": {attribute: edges.tolist()
+                                   for attribute, edges in self.bin_edges.items()}})
+
+    def _histogram(self, animals, attribute):
+        """Returns the histogram of an attribute over a list of animals."""
+        values = np.fromiter((getattr(animal, attribute) for animal in animals),
+                             dtype=float, count=len(animals))
+        return np.histogram(values, bins=self.bin_edges[attribute])[0]
+
+    def record(self, year):
+        """Records the current state of the island as the given year.
+
+        :param year: Year of the record
+        :type year: int
+        """
+        if self.length == self._capacity:
+            self._resize(2 * self._capacity)
+
+        index = self.length
+        num_animals = self.island.get_num_animals_per_species()
+        self._arrays["year"][index] = year
+        self._arrays["totals"][index] = [num_animals[species] for species in self.species]
+        if self.count_grids:
+            self._arrays["herb_counts"][index] = self.island.get_herb_count_grid()
+            self._arrays["carn_counts"][index] = self.island.get_carn_count_grid()
+        if self.fodder_grids:
+            self._arrays["fodder"][index] = self.island.get_fodder_grid()
+        if self.bin_edges:
+            herbs = self.island.get_all_herb_list()
+            carns = self.island.get_all_carn_list()
+        for attribute in self.bin_edges:
+            self._arrays["herb_{}_hist".format(attribute)][index] = \
+                self._histogram(herbs, attribute)
+            self._arrays["carn_{}_hist".format(attribute)][index] = \
+                self._histogram(carns, attribute)
+
+        self.length += 1
+        self._write_metadata()
+
+    def close(self):
+        """Shrinks the files to the recorded years and flushes them to disk.
+        """
+        if self.length != self._capacity:
+            self._resize(self.length)
+        for array in self._arrays.values():
+            array.flush()
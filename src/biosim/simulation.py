@@ -6,24 +6,58 @@
 __author__ = ""
 __email__ = ""
 
+import gc
+import io
+import json
+import os
 import random as rd
 import shutil
 import subprocess
-import textwrap
+import threading
+import time
+from collections import deque, namedtuple
+from types import MappingProxyType
 
-import matplotlib.colors as mcolors
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from matplotlib.widgets import Button
 
-from animals import *
-from annual_cycle import *
-from island import *
+from animals import Herbivore, Carnivore
+from annual_cycle import AnnualCycle
+from cohorts import CohortCycle
+from convergence import ConvergenceMonitor
+from frame_writer import BackgroundFrameWriter, ImageFrameWriter, MovieFrameWriter
+from instrumentation import CycleInstrumentation
+from island import Island
+from landscape import Landscape
+from recorder import HistoryRecorder
 
 
 _FFMPEG_BINARY = r"ffmpeg"
+_MAX_PENDING_FRAMES = 10
+_CHECKPOINT_VERSION = 1
+_SPECIES = {"Herbivore": Herbivore, "Carnivore": Carnivore}
+_POPULATION_FIELDS = ("species", "row", "col", "age", "weight")
 
+population_dtype = np.dtype([("species", "U9"), ("row", np.int32), ("col", np.int32),
+                             ("age", np.int64), ("weight", np.float64)])
+population_table_dtype = np.dtype(population_dtype.descr + [("fitness", np.float64)])
+compact_population_dtype = np.dtype([("species", np.uint8), ("cell", np.int32),
+                                     ("age", np.uint16), ("weight", np.float32),
+                                     ("fitness", np.float32)])
+
+# Measured with tracemalloc: an animal with its entries in the cell and the
+# island registry, and a cell once its landscape object exists
+_BYTES_PER_ANIMAL = 160
+_BYTES_PER_CELL = 400
+
+_Frame = namedtuple("_Frame", ["year", "herb_counts", "carn_counts",
+                               "herb_grid", "carn_grid", "num_animals", "save"])
+
+YearSnapshot = namedtuple("YearSnapshot", ["year", "counts", "herb_grid", "carn_grid"])
+YearSnapshot.__doc__ = """State of the island after a simulated year, as yielded by BioSim.iter_years.
+
+counts is a read-only mapping from species to number of animals. herb_grid
+and carn_grid are read-only arrays with animals per cell, or None if grids
+were not requested."""
 
 
 class BioSim:
@@ -36,15 +70,24 @@ class BioSim:
         cmax_animals=None,
         img_base=None,
         img_fmt="png",
+        movie_fmt=None,
+        headless=False,
+        max_fps=25,
+        memory_budget=None,
     ):
         """
-        :param island_map: Multi-line string specifying island geography
+        :param island_map: Multi-line string specifying island geography, its bytes,
+                           an array of terrain codes or the path of a map file
         :param ini_pop: List of dictionaries specifying initial population
         :param seed: Integer used as random number seed
         :param ymax_animals: Number specifying y-axis limit for graph showing animal numbers
         :param cmax_animals: Dict specifying color-code limits for animal densities
         :param img_base: String with beginning of file name for figures, including path
         :param img_fmt: String with file type for figures, e.g. 'png'
+        :param movie_fmt: String with movie file type, e.g. 'mp4', to stream frames into
+        :param headless: If True, simulate never creates any figures
+        :param max_fps: Maximal number of times per second the figure is redrawn
+        :param memory_budget: Maximal projected memory use in bytes, or None for no limit
 
         If ymax_animals is None, the y-axis limit should be adjusted automatically.
 
@@ -59,21 +102,52 @@ class BioSim:
 
         where img_no are consecutive image numbers starting from 0.
         img_base should contain a path and beginning of a file name.
+
+        If movie_fmt is given, no image files are written. Instead the frames
+        are streamed into a single ffmpeg process, which encodes the movie
+        '{}.{}'.format(img_base, movie_fmt). The movie is finished when
+        simulate ends, and every later call of simulate streams into a new
+        movie '{}_{:05d}.{}'.format(img_base, img_no, movie_fmt), where img_no
+        is the number of its first frame.
+
+        A str or bytes island_map is parsed as by Island, a two-dimensional
+        array as by Island.from_terrain, and an os.PathLike path, e.g. a
+        pathlib.Path, as by Island.from_file, which memory-maps the file.
+
+        If headless is True, no figure is set up, updated or saved while
+        simulating, but the animal counts are still recorded in
+        count_history. The mode can be overridden per call to simulate.
+
+        If memory_budget is given, populations that would make
+        memory_footprint exceed it are refused before any animal is created,
+        and so are runs starting with such a population.
         """
         rd.seed(seed)
         np.random.seed(seed)
 
-        island_map = textwrap.dedent(island_map)
-        self._island_map = island_map
-        self.island = Island(self._island_map)
+        if isinstance(island_map, os.PathLike):
+            self.island = Island.from_file(island_map)
+        elif isinstance(island_map, np.ndarray) and island_map.ndim == 2:
+            self.island = Island.from_terrain(island_map)
+        else:
+            self.island = Island(island_map)
         self.cycle = AnnualCycle(self.island)
+        self._memory_budget = memory_budget
+        self._population = self.island
+        self._num_animals = None
+        self._num_animal_per_species = None
+        self._num_animals_version = None
         self.add_population(ini_pop)
 
-        self._n_rows = len(island_map.splitlines())
-        self._n_columns = len(island_map.splitlines()[0]) # LAG METHOD
-
         self._img_base = img_base
         self._img_fmt = img_fmt
+        self._movie_fmt = movie_fmt
+        self._frame_writer = None
+        self._headless = headless
+        self._max_fps = max_fps
+
+        self._count_history = {"Herbivore": np.array([]),
+                               "Carnivore": np.array([])}
 
         self._herbivore_line = None
         self._carnivore_line = None
@@ -87,8 +161,6 @@ class BioSim:
         self._final_year = None
         self._img_ctr = 0
 
-        self._num_animals = None
-        self._num_animal_per_species = None
         self._animal_distribution = None
         self._max_animals = None
 
@@ -108,6 +180,23 @@ class BioSim:
         self._paused = False
         self._interrupt = False
 
+        self._background = None
+        self._frame_cond = threading.Condition()
+        self._saved_frames = deque()
+        self._latest_frame = None
+        self._worker_error = None
+
+        self._recorder = None
+        self._monitor = None
+        self._settings = {"ymax_animals": ymax_animals,
+                          "cmax_animals": cmax_animals,
+                          "img_base": img_base,
+                          "img_fmt": img_fmt,
+                          "movie_fmt": movie_fmt,
+                          "headless": headless,
+                          "max_fps": max_fps,
+                          "memory_budget": memory_budget}
+
         if ymax_animals is not None:
             self._ymax_animals = ymax_animals
         else:
@@ -144,7 +233,18 @@ class BioSim:
 
         self.island._param_changer(landscape, params)
 
+    def set_f_max_grid(self, f_max_grid):
+        """
+        Set f_max per cell, e.g. from a fertility map.
+
+        :param f_max_grid: Array with f_max per cell, NaN where the landscape
+                           parameter applies, or None to remove all overrides
+        """
+        self.island.set_f_max_grid(f_max_grid)
+
     def island_map(self):
+        import matplotlib.colors as mcolors
+
         self._map_ax = self._fig.add_axes([0.05, 0.7, 0.25, 0.25])
         color_code = {
             "O": mcolors.to_rgba("navy"),
@@ -154,16 +254,18 @@ class BioSim:
             "M": mcolors.to_rgba("lightslategrey"),
         }
 
-        kart_rgb = [[color_code[column] for column in row]
-                    for row in self._island_map.splitlines()]
+        colors = np.array([color_code[letter] for letter in Island.terrain_letters])
 
-        self._map_ax.imshow(kart_rgb)
+        self._map_ax.imshow(colors[self.island.terrain])
         self._map_ax.set_title('Island map', fontsize=18)
 
     def _setup_graphics(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import Button
 
         if self._fig is None:
             self._fig = plt.figure(figsize=(18, 12))
+            self._fig.canvas.mpl_connect('draw_event', self._on_draw)
 
         if self._map_ax is None:
             self.island_map()
@@ -183,64 +285,52 @@ class BioSim:
 
         self._animal_ax.set_xlim(0, self._final_year + 1)
 
+        years = np.arange(len(self._count_history['Herbivore']))
         if self._herbivore_line is None:
-            herbivore_plot = self._animal_ax.plot(np.arange(0, self._final_year),
-                                                  np.full(self._final_year, np.nan),
-                                                  label='Herbivores')
+            herbivore_plot = self._animal_ax.plot(years,
+                                                  self._count_history['Herbivore'],
+                                                  label='Herbivores', animated=True)
             self._herbivore_line = herbivore_plot[0]
         else:
-            xdata, ydata = self._herbivore_line.get_data()
-            xnew = np.arange(xdata[-1] + 1, self._final_year)
-            if len(xnew) > 0:
-                ynew = np.full(xnew.shape, np.nan)
-                self._herbivore_line.set_data(np.hstack((xdata, xnew)),
-                                              np.hstack((ydata, ynew)))
+            self._herbivore_line.set_data(years, self._count_history['Herbivore'])
 
         if self._carnivore_line is None:
-            carnivore_plot = self._animal_ax.plot(np.arange(0, self._final_year),
-                                                  np.full(self._final_year, np.nan),
-                                                  label='Carnivores')
+            carnivore_plot = self._animal_ax.plot(years,
+                                                  self._count_history['Carnivore'],
+                                                  label='Carnivores', animated=True)
             self._carnivore_line = carnivore_plot[0]
+            self._animal_ax.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc='lower left',
+                                   ncol=2, mode="expand", borderaxespad=0.)
         else:
-            xdata, ydata = self._carnivore_line.get_data()
-            xnew = np.arange(xdata[-1] + 1, self._final_year)
-            if len(xnew) > 0:
-                ynew = np.full(xnew.shape, np.nan)
-                self._carnivore_line.set_data(np.hstack((xdata, xnew)),
-                                              np.hstack((ydata, ynew)))
+            self._carnivore_line.set_data(years, self._count_history['Carnivore'])
+
+        herb_grid, carn_grid = self._distribution_grids()
 
         if self._herb_dist_ax is None:
             self._herb_dist_ax = self._fig.add_axes([0.05, 0.4, 0.25, 0.25])
             self._herb_dist_ax.set_title("Herbivore distribution")
 
         if self._herb_dist_plot is None:
-            self._herb_dist_plot = self._herb_dist_ax.imshow(np.reshape(self.animal_distribution[
-                                                                            'Herbivore'].values,
-                                                                        newshape=(self._n_rows,
-                                                                                  self._n_columns)),
+            self._herb_dist_plot = self._herb_dist_ax.imshow(herb_grid,
                                                              interpolation='none',
-                                                             vmin=0.9, vmax=self._cmax_herbivore)
+                                                             vmin=0.9, vmax=self._cmax_herbivore,
+                                                             animated=True)
             plt.colorbar(mappable=self._herb_dist_plot)
         else:
-            self._herb_dist_plot.set_data(np.reshape(self.animal_distribution['Herbivore'].values,
-                                                     newshape=(self._n_rows, self._n_columns)))
+            self._herb_dist_plot.set_data(herb_grid)
 
         if self._carn_dist_ax is None:
             self._carn_dist_ax = self._fig.add_axes([0.05, 0.1, 0.25, 0.25])
             self._carn_dist_ax.set_title("Carnivore distribution")
 
         if self._carn_dist_plot is None:
-            self._carn_dist_plot = self._carn_dist_ax.imshow(np.reshape(self.animal_distribution[
-                                                                            'Carnivore'].values,
-                                                                        newshape=(self._n_rows,
-                                                                                  self._n_columns)),
+            self._carn_dist_plot = self._carn_dist_ax.imshow(carn_grid,
                                                              interpolation='none',
-                                                             vmin=0.9, vmax=self._cmax_carnivore)
+                                                             vmin=0.9, vmax=self._cmax_carnivore,
+                                                             animated=True)
             plt.colorbar(mappable=self._carn_dist_plot)
         else:
-            self._carn_dist_plot.set_data(np.reshape(self.animal_distribution[
-                                                         'Carnivore'].values,
-                                                     newshape=(self._n_rows, self._n_columns)))
+            self._carn_dist_plot.set_data(carn_grid)
 
         # Button to pause/run
         if self._ax_pause is None:
@@ -256,86 +346,886 @@ class BioSim:
                                        hovercolor='0.975')
             self._w_interrupt.on_clicked(self._stop_sim)
 
-    def _update_animal_ax(self):
-        ydata = self._herbivore_line.get_ydata()
-        ydata[self.year] = self.num_animals_per_species['Herbivore']
-        self._herbivore_line.set_ydata(ydata)
-
-        ydata = self._carnivore_line.get_ydata()
-        ydata[self.year] = self.num_animals_per_species['Carnivore']
-        self._carnivore_line.set_ydata(ydata)
-        self._animal_ax.legend(bbox_to_anchor=(0., 1.02, 1., .102), loc='lower left',
-                               ncol=2, mode="expand", borderaxespad=0.)
-
-    def _update_heatmap_axes(self):
-        self._herb_dist_plot.set_data(np.reshape(a=self.animal_distribution['Herbivore'].values,
-                                                 newshape=(self._n_rows, self._n_columns)))
-        self._carn_dist_plot.set_data(np.reshape(a=self.animal_distribution['Carnivore'].values,
-                                                 newshape=(self._n_rows, self._n_columns)))
-
-    def _update_graphics(self):
-        """Updates graphics with current data."""
-        self._update_animal_ax()
-        self._update_heatmap_axes()
+        # Full draw, which also stores the background used for blitting
+        self._background = None
+        plt.show(block=False)
+        self._fig.canvas.draw()
+
+    def _animated_artists(self):
+        """Returns the artists that change between frames."""
+        return [self._herbivore_line, self._carnivore_line,
+                self._herb_dist_plot, self._carn_dist_plot]
+
+    def _draw_animated(self):
+        """Draws the changing artists on top of the current canvas."""
+        for artist in self._animated_artists():
+            self._fig.draw_artist(artist)
+
+    def _on_draw(self, event):
+        """Stores the static background after a full draw of the figure,
+        and draws the changing artists on top of it.
+        """
+        canvas = self._fig.canvas
+        if canvas.is_saving():
+            return
+        if canvas.supports_blit:
+            self._background = canvas.copy_from_bbox(self._fig.bbox)
+        self._draw_animated()
+
+    def _distribution_grids(self):
+        """Returns the Herbivore and Carnivore count per cell as 2D arrays."""
+        return self._population.get_herb_count_grid(), self._population.get_carn_count_grid()
+
+    def _update_animal_ax(self, frame):
+        years = np.arange(len(frame.herb_counts))
+        self._herbivore_line.set_data(years, frame.herb_counts)
+        self._carnivore_line.set_data(years, frame.carn_counts)
+
+    def _update_heatmap_axes(self, frame):
+        self._herb_dist_plot.set_data(frame.herb_grid)
+        self._carn_dist_plot.set_data(frame.carn_grid)
+
+    def _update_graphics(self, frame):
+        """Updates graphics with the data of a published frame.
+
+        Only the changing artists are redrawn and blitted onto the stored
+        background. The whole figure is redrawn when the y-limit changes.
+        """
+        self._update_animal_ax(frame)
+        self._update_heatmap_axes(frame)
         # ylimit for the animal ax:
         if self._ymax_animals is None:
-            if self.num_animals > self._max_animals:
-                self._max_animals = self.num_animals
+            if frame.num_animals > self._max_animals:
+                self._max_animals = frame.num_animals
                 self._animal_ax.set_ylim(0, self._max_animals + 100)
-        plt.pause(1e-2)
+                self._background = None
+
+        canvas = self._fig.canvas
+        if self._background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            self._draw_animated()
+            canvas.blit(self._fig.bbox)
+        canvas.flush_events()
+
+    def _extend_count_history(self):
+        """Pads the count history with NaN up to the final year."""
+        for species, counts in self._count_history.items():
+            padding = np.full(max(self._final_year - len(counts), 0), np.nan)
+            self._count_history[species] = np.hstack((counts, padding))
+
+    def _record_counts(self):
+        """Stores the current animal count per species in the count history."""
+        for species, count in self.num_animals_per_species.items():
+            self._count_history[species][self.year] = count
+
+    def _publish_frame(self, save):
+        """Publishes a snapshot of the current year for the renderer.
+
+        Frames that are to be saved are queued, and the simulation waits
+        if too many of them are waiting to be drawn.
+
+        :param save: True if the frame has to be drawn and saved to file
+        """
+        herb_grid, carn_grid = self._distribution_grids()
+        frame = _Frame(year=self.year,
+                       herb_counts=self._count_history['Herbivore'].copy(),
+                       carn_counts=self._count_history['Carnivore'].copy(),
+                       herb_grid=herb_grid,
+                       carn_grid=carn_grid,
+                       num_animals=self.num_animals,
+                       save=save)
+
+        with self._frame_cond:
+            while len(self._saved_frames) >= _MAX_PENDING_FRAMES and not self._interrupt:
+                self._frame_cond.wait()
+            if save:
+                self._saved_frames.append(frame)
+            self._latest_frame = frame
+
+    def _render_frames(self, worker):
+        """Draws the frames published by the simulation until it has finished.
+
+        All frames that are to be saved are drawn and saved in order. Other
+        frames are only drawn if they are the latest one, at most max_fps
+        times per second, so a slow display never holds back the simulation.
+
+        :param worker: Thread running the simulation
+        """
+        frame_interval = 1 / self._max_fps
+        last_drawn = None
+        next_draw = 0
+        while True:
+            finished = not worker.is_alive()
+            with self._frame_cond:
+                saved_frames = list(self._saved_frames)
+                self._saved_frames.clear()
+                latest = self._latest_frame
+                self._frame_cond.notify_all()
+
+            for frame in saved_frames:
+                self._update_graphics(frame)
+                self._save_graphics()
+                last_drawn = frame
+
+            now = time.perf_counter()
+            if latest is not last_drawn and (finished or now >= next_draw):
+                self._update_graphics(latest)
+                last_drawn = latest
+                next_draw = now + frame_interval
+
+            if finished:
+                break
+            self._fig.canvas.start_event_loop(frame_interval)
+
+    def _capture_frame(self):
+        """Returns the RGBA pixel values currently shown on the canvas."""
+        canvas = self._fig.canvas
+        if hasattr(canvas, 'buffer_rgba'):
+            return np.asarray(canvas.buffer_rgba())
+
+        width, height = canvas.get_width_height(physical=True)
+        with io.BytesIO() as buffer:
+            self._fig.savefig(buffer, format='rgba')
+            return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(height, width, 4)
+
+    def _open_frame_writer(self):
+        """Creates the writer for saved frames, unless it already exists.
+
+        A movie streamed by a later call of simulate is a new file, named
+        after the number of its first image, so earlier movies are kept.
+        """
+        if self._img_base is None or self._frame_writer is not None:
+            return
+        if self._movie_fmt is not None:
+            if self._img_ctr == 0:
+                movie_file = '{}.{}'.format(self._img_base, self._movie_fmt)
+            else:
+                movie_file = '{}_{:05d}.{}'.format(self._img_base, self._img_ctr,
+                                                   self._movie_fmt)
+            writer = MovieFrameWriter(movie_file, ffmpeg_binary=_FFMPEG_BINARY)
+        else:
+            writer = ImageFrameWriter(self._img_base, self._img_fmt)
+        self._frame_writer = BackgroundFrameWriter(writer)
+
+    def _close_frame_writer(self):
+        """Writes the remaining frames, stops the background thread and
+        closes the frame writer, if open."""
+        if self._frame_writer is None:
+            return
+        writer, self._frame_writer = self._frame_writer, None
+        writer.close()
 
     def _save_graphics(self):
-        """Saves graphics to file if file name is given."""
+        """Saves graphics to file if file name is given.
+
+        The pixels are captured directly, while encoding and writing is
+        done by the background thread of the frame writer.
+        """
 
         if self._img_base is None:
             return
 
-        plt.savefig('{base}_{num:05d}.{type}'.format(base=self._img_base,
-                                                     num=self._img_ctr,
-                                                     type=self._img_fmt))
+        self._frame_writer.write(self._capture_frame(), self._img_ctr)
         self._img_ctr += 1  # Image counter += 1
 
-    def simulate(self, num_years, vis_years=1, img_years=None):
+    def _advance_year(self):
+        """Runs the annual cycle once, and records the new year if recording.
+        On an island without animals only the fodder is refilled.
+
+        :return: True if the convergence monitor asks the simulation to stop
+        """
+        if self.num_animals == 0:
+            self.cycle.run_empty_years(1)
+        else:
+            self.cycle.run_cycle()
+        self._year += 1
+        if self._recorder is not None:
+            self._recorder.record(self.year)
+        if self._monitor is None:
+            return False
+        if self._monitor.grids:
+            herb_grid, carn_grid = self._distribution_grids()
+        else:
+            herb_grid = carn_grid = None
+        converged = self._monitor.update(self.year, self.num_animals_per_species,
+                                         herb_grid, carn_grid)
+        return converged and self._monitor.stop
+
+    def _fast_forward(self, vis_years):
+        """Runs all years up to the final year at once on an island without
+        animals, recording zero counts every vis_years.
+
+        :param vis_years: years between recorded counts
+        """
+        years = np.arange(self.year, self._final_year)
+        for counts in self._count_history.values():
+            counts[years[years % vis_years == 0]] = 0
+        self.cycle.run_empty_years(self._final_year - self.year)
+        self._year = self._final_year
+
+    def _run_years(self, vis_years, img_years, publish):
+        """Runs the annual cycle until the final year or until interrupted.
+
+        :param vis_years: years between recorded counts and visualization updates
+        :param img_years: years between visualizations saved to files
+        :param publish: If True, frames are published for the renderer
+        """
+        try:
+            while self.year < self._final_year:
+                if (not publish and self._recorder is None and self._monitor is None
+                        and self.num_animals == 0):
+                    self._fast_forward(vis_years)
+                    break
+                vis_year = self.year % vis_years == 0
+                img_year = self.year % img_years == 0
+                if vis_year:
+                    self._record_counts()
+                if publish and (vis_year or img_year):
+                    self._publish_frame(save=img_year and self._img_base is not None)
+
+                converged = self._advance_year()
+
+                if self._interrupt or converged:
+                    break
+                while self._paused and not self._interrupt:
+                    time.sleep(0.05)
+        except BaseException as err:
+            self._worker_error = err
+
+    def simulate(self, num_years, vis_years=1, img_years=None, headless=None):
         """
         Run simulation while visualizing the result.
 
         :param num_years: number of years to simulate
         :param vis_years: years between visualization updates
         :param img_years: years between visualizations saved to files (default: vis_years)
+        :param headless: If True, run without graphics (default: as given to constructor)
+
+        Image files will be numbered consecutively, and are all written
+        when simulate returns.
+
+        In headless mode no figure is created and no images are saved, but
+        animal counts are recorded in count_history every vis_years.
 
-        Image files will be numbered consecutively.
+        Otherwise the simulation runs in a separate thread and publishes a
+        frame every vis_years, while the figure shows the latest frame at
+        most max_fps times per second. Frames to be saved are never skipped.
+
+        Once no animals are left, a year only refills the fodder. Without
+        graphics, history recording and convergence monitoring the remaining
+        years are then run at once, with the fodder refilled in closed form.
+
+        The simulation stops before num_years when a convergence monitor
+        set up with stop=True finds the counts stationary, see
+        monitor_convergence.
         """
         if img_years is None:
             img_years = vis_years
+        if headless is None:
+            headless = self._headless
+        self._check_memory_budget(0)
 
         self._final_year = self._year + num_years
-        self._setup_graphics()
+        self._extend_count_history()
+        self._worker_error = None
 
-        while self.year < self._final_year:
-            if self.year % vis_years == 0:
-                self._update_graphics()
+        if headless:
+            self._run_years(vis_years, img_years, publish=False)
+        else:
+            self._setup_graphics()
+            self._open_frame_writer()
+            self._saved_frames.clear()
+            self._latest_frame = None
+            worker = threading.Thread(target=self._run_years,
+                                      args=(vis_years, img_years, True),
+                                      daemon=True)
+            worker.start()
+            try:
+                self._render_frames(worker)
+            finally:
+                if worker.is_alive():
+                    self._interrupt = True
+                    with self._frame_cond:
+                        self._saved_frames.clear()
+                        self._frame_cond.notify_all()
+                worker.join()
+                # Images and streamed movies are finished when simulate ends,
+                # also if it fails
+                self._close_frame_writer()
 
-            if self.year % img_years == 0:
-                self._save_graphics()
-                pass
+        self._interrupt = False
+        if self._worker_error is not None:
+            raise self._worker_error
 
-            self.cycle.run_cycle()
-            self._year += 1
+    def iter_years(self, num_years, grids=False):
+        """
+        Simulate lazily, one year per iteration, without any graphics.
 
-            if self._interrupt:
-                break
-            while self._paused:
-                plt.pause(0.05)
+        :param num_years: maximal number of years to simulate
+        :param grids: If True, the snapshots include animals per cell
+        :return: Generator yielding a YearSnapshot after every simulated year
 
-        self._interrupt = False
+        A year is only simulated when the next snapshot is requested, so
+        the consumer can stop early by leaving the loop, e.g.
+
+            for snapshot in sim.iter_years(1000):
+                if snapshot.counts["Carnivore"] == 0:
+                    break
+
+        The snapshots are immutable and do not change as the simulation
+        continues. History recording and convergence monitoring are updated
+        as with simulate, while count_history is not. A convergence monitor
+        set up with stop=True ends the iteration after the year the counts
+        become stationary.
+        """
+        self._check_memory_budget(0)
+        for _ in range(num_years):
+            converged = self._advance_year()
+            if grids:
+                herb_grid, carn_grid = self._distribution_grids()
+            else:
+                herb_grid = carn_grid = None
+            yield YearSnapshot(year=self.year,
+                               counts=MappingProxyType(self.num_animals_per_species),
+                               herb_grid=herb_grid,
+                               carn_grid=carn_grid)
+            if converged:
+                return
+
+    def record_history(self, out_dir, count_grids=True, fodder_grids=True,
+                       histograms=None):
+        """
+        Start recording the state of the island after every simulated year.
+
+        :param out_dir: Directory to write the memory-mapped .npy files to
+        :param count_grids: If True, animals per cell are recorded for each species
+        :param fodder_grids: If True, fodder per cell is recorded
+        :param histograms: Dict mapping 'age', 'weight' or 'fitness' to histogram bin edges
+        :return: The HistoryRecorder writing the files
+
+        The current year is recorded at once. The files can be read with
+        recorder.load_history, also by other processes while simulating.
+        A recording already in progress is stopped first.
+        """
+        self._check_animal_objects("History recording")
+        self.stop_recording()
+        self._recorder = HistoryRecorder(self.island, out_dir,
+                                         count_grids=count_grids,
+                                         fodder_grids=fodder_grids,
+                                         histograms=histograms)
+        self._recorder.record(self.year)
+        return self._recorder
+
+    def stop_recording(self):
+        """Stop recording, and shrink the recorded files to the recorded years."""
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def monitor_convergence(self, window=50, tolerance=0.05, grids=False, stop=True):
+        """
+        Start detecting when the animal counts have become stationary.
+
+        :param window: Number of years compared, an even number
+        :param tolerance: Largest relative difference of the half-window means
+        :param grids: If True, the animals per cell must be stationary too
+        :param stop: If True, simulate stops when the counts become stationary
+        :return: The ConvergenceMonitor following the simulation
+
+        After every following year the means of the older and the newer
+        half of the last window years are compared for each species, see
+        convergence.ConvergenceMonitor. The first year in which they agree
+        is kept as converged_year, and the diagnostics of every year are
+        available from convergence_statistics. With stop=True the run is
+        stopped in that year, otherwise it continues to num_years. A monitor
+        already in use is replaced.
+        """
+        self._monitor = ConvergenceMonitor(window, tolerance, grids, stop)
+        return self._monitor
+
+    def stop_monitoring(self):
+        """Stop detecting convergence, discarding the monitored years."""
+        self._monitor = None
+
+    @property
+    def converged_year(self):
+        """Year in which the monitored counts first became stationary, or None."""
+        if self._monitor is None:
+            return None
+        return self._monitor.converged_year
+
+    @property
+    def convergence_statistics(self):
+        """Dict with the diagnostics collected since monitor_convergence was
+        called, as arrays with one entry per year: 'year', the counts
+        'herb_count' and 'carn_count', the relative changes 'herb_change',
+        'carn_change', 'herb_grid_change' and 'carn_grid_change', and
+        'stationary'. None if convergence is not monitored."""
+        if self._monitor is None:
+            return None
+        return self._monitor.as_dict()
+
+    def write_convergence_statistics(self, path):
+        """
+        Write the diagnostics collected since monitor_convergence was called to file.
+
+        :param path: File name ending with '.csv' or '.json'
+        """
+        if self._monitor is None:
+            raise RuntimeError("Convergence is not monitored.")
+        self._monitor.write(path)
+
+    def use_binned_draws(self, bins=16):
+        """
+        Decide deaths and migrations with a few draws per probability bin.
+
+        :param bins: Number of probability bins, or None for one draw per animal
+
+        Instead of one random number per animal, the animals are binned by
+        their probability of dying or moving, and each bin takes a binomial
+        draw and a sample without replacement, see
+        annual_cycle.binned_events. The outcome has the same distribution
+        as with one draw per animal, but not the same random numbers, so a
+        seed gives other results than without binned draws.
+        """
+        if bins is not None and bins < 1:
+            raise ValueError("The number of bins must be a positive integer")
+        self.cycle.probability_bins = bins
+
+    def use_cohorts(self, weight_bin=1.0, mean_field_threshold=None, compact=False):
+        """
+        Continue the simulation with the cohort engine.
+
+        :param weight_bin: Width of the weight bins animals are merged in
+        :param mean_field_threshold: Number of animals above which a cell is
+                                     updated with expected values, or None
+        :param compact: If True, cohorts are stored in 14 instead of 32 bytes,
+                        with single precision weights
+
+        All animals are moved from the island into cohorts of animals with
+        the same location, age and weight bin, which the annual cycle treats
+        with binomial and multinomial draws instead of animal by animal,
+        see cohorts.CohortCycle for the accuracy. Animals added later join
+        the cohorts. Population tables, checkpoints and history recording
+        need single animals, and raise RuntimeError once cohorts are used.
+        Instrumentation carries over.
+
+        With a mean_field_threshold, births, deaths and kills on cells with
+        more animals than the threshold are set to their expected numbers
+        instead of drawn, which trades accuracy for speed on crowded cells.
+        cell_modes shows how many cells ran in each mode every year.
+
+        With compact=True, cells and counts are stored as 32-bit integers,
+        ages as 16-bit integers and weights in single precision, see
+        cohorts.Cohorts. memory_footprint and the memory budget count the
+        bytes actually stored per cohort.
+        """
+        if self._population is not self.island:
+            raise RuntimeError("The simulation already uses cohorts.")
+        cycle = CohortCycle(self.island, weight_bin, mean_field_threshold, compact)
+        self._cohort_first_year = self.year + 1
+        cycle.instrumentation = self.cycle.instrumentation
+        cycle.take_island_animals()
+        self.cycle = cycle
+        self._population = cycle
+
+    @property
+    def cell_modes(self):
+        """
+        Number of occupied cells per mode of the cohort engine.
+
+        :return: Dict mapping 'year', 'stochastic' and 'mean_field' to arrays
+                 with one entry per year simulated with cohorts, or None
+                 without cohorts
+        """
+        if self._population is self.island:
+            return None
+        modes = np.array(self.cycle.cell_modes, dtype=np.int64).reshape(-1, 2)
+        return {"year": np.arange(self._cohort_first_year,
+                                  self._cohort_first_year + len(modes), dtype=np.int64),
+                "stochastic": modes[:, 0],
+                "mean_field": modes[:, 1]}
+
+    def _check_animal_objects(self, action):
+        """Raises RuntimeError if the animals are held in cohorts."""
+        if self._population is not self.island:
+            raise RuntimeError(action + " is not available with cohorts.")
+
+    def instrument(self, enabled=True):
+        """
+        Start or stop collecting timing and event statistics of the annual cycle.
+
+        :param enabled: If True, every following year is instrumented
+
+        While enabled, the wall time and the number of animals processed
+        are recorded for every phase of every simulated year, together with
+        the number of births, deaths, kills and migrations. Starting again
+        discards the statistics collected so far. Instrumentation is off
+        by default, and costs only a few clock readings per year when on.
+        """
+        if enabled:
+            self.cycle.instrumentation = CycleInstrumentation(first_year=self.year + 1)
+        else:
+            self.cycle.instrumentation = None
+
+    @property
+    def cycle_statistics(self):
+        """Dict with the statistics collected since instrument was called,
+        as arrays with one entry per year: 'year', 'phase_times' and
+        'processed' of shape (years, phases), 'births', 'deaths', 'kills'
+        and 'migrations'. None if instrumentation is off."""
+        if self.cycle.instrumentation is None:
+            return None
+        return self.cycle.instrumentation.as_dict()
+
+    def write_cycle_statistics(self, path):
+        """
+        Write the statistics collected since instrument was called to file.
+
+        :param path: File name ending with '.csv' or '.json'
+        """
+        if self.cycle.instrumentation is None:
+            raise RuntimeError("Instrumentation is not enabled.")
+        self.cycle.instrumentation.write(path)
+
+    def memory_footprint(self, num_animals=None):
+        """
+        Projected peak memory use of the simulation in bytes.
+
+        :param num_animals: Number of animals to project for (default: animals on the island)
+        :return: Projected number of bytes
+
+        Every cell is counted as if animals have visited it, and every
+        animal twice, since at most one newborn per animal is added in a
+        year before any animal dies. With cohorts, num_animals is the number
+        of cohorts (default: cohorts stored), each taking the bytes of one
+        row of the cohort arrays instead of an animal object.
+        """
+        if num_animals is None:
+            num_animals = self._stored_animals()
+        if self._population is self.island:
+            bytes_per_animal = _BYTES_PER_ANIMAL
+        else:
+            bytes_per_animal = self.cycle.get_cohort_itemsize()
+        return (self.island.terrain.size * _BYTES_PER_CELL
+                + 2 * num_animals * bytes_per_animal)
+
+    def _stored_animals(self):
+        """Returns the number of animal objects, or of cohorts with cohorts."""
+        if self._population is self.island:
+            return self.num_animals
+        return self.cycle.get_num_cohorts()
+
+    def _check_memory_budget(self, new_animals):
+        """Raises RuntimeError if new_animals more animals would make the
+        projected memory use exceed the memory budget. With cohorts, every
+        new animal is counted as at most one new cohort."""
+        if self._memory_budget is None:
+            return
+        stored = self._stored_animals() + new_animals
+        footprint = self.memory_footprint(stored)
+        if footprint > self._memory_budget:
+            unit = "animals" if self._population is self.island else "cohorts"
+            raise RuntimeError("The projected memory use of {0:.1f} MB with {1} {2} "
+                               "exceeds the memory budget of {3:.1f} MB"
+                               .format(footprint / 1e6, stored, unit,
+                                       self._memory_budget / 1e6))
+
+    def save_checkpoint(self, path, compact=False):
+        """
+        Save the complete state of the simulation to a checkpoint file.
+
+        :param path: File name of the checkpoint, '.npz' is added if missing
+        :param compact: If True, store the animals with the dtypes of compact_population_dtype
+
+        The checkpoint holds NumPy arrays with every animal, in the order it
+        has in its cell, and the terrain, fodder and any f_max set on every cell.
+        A small JSON header holds the year, the image counter, the animal and
+        landscape parameters, the constructor settings, the probability bins
+        of binned draws and the states of both random number generators.
+        Continuing a loaded checkpoint therefore gives exactly the same
+        results as continuing this simulation.
+        Graphics and history recording are not part of the checkpoint.
+
+        A compact checkpoint needs 11 instead of 25 bytes per animal, but
+        the weights are rounded to single precision, so a loaded compact
+        checkpoint continues close to, not exactly as, this simulation.
+        """
+        self._check_animal_objects("Saving a checkpoint")
+        species, rows, cols, ages, weights = [], [], [], [], []
+        for loc in self.island.get_occupied_locations():
+            cell = self.island.island_dict[loc]
+            for code, animals in enumerate((cell.get_herb_pop_list(),
+                                            cell.get_carn_pop_list())):
+                for animal in animals:
+                    species.append(code)
+                    rows.append(loc[0])
+                    cols.append(loc[1])
+                    ages.append(animal.age)
+                    weights.append(animal.weight)
+
+        rd_version, rd_internal, rd_gauss_next = rd.getstate()
+        np_name, np_keys, np_pos, np_has_gauss, np_cached_gaussian = np.random.get_state()
+        header = {
+            "version": _CHECKPOINT_VERSION,
+            "year": self._year,
+            "img_ctr": self._img_ctr,
+            "max_animals": self._max_animals,
+            "settings": self._settings,
+            "probability_bins": self.cycle.probability_bins,
+            "parameters": {name: animal_class.parameters
+                           for name, animal_class in _SPECIES.items()},
+            "landscape_parameters": Landscape.landscape_parameters,
+            "random_state": {"version": rd_version, "gauss_next": rd_gauss_next},
+            "np_random_state": {"name": np_name,
+                                "pos": int(np_pos),
+                                "has_gauss": int(np_has_gauss),
+                                "cached_gaussian": float(np_cached_gaussian)},
+        }
+
+        if compact:
+            animal_arrays = {"species": np.array(species, dtype=np.uint8),
+                             "cells": self._cell_indices(rows, cols),
+                             "ages": self._compact_ages(ages),
+                             "weights": np.array(weights, dtype=np.float32)}
+        else:
+            animal_arrays = {"species": np.array(species, dtype=np.uint8),
+                             "rows": np.array(rows, dtype=np.int32),
+                             "cols": np.array(cols, dtype=np.int32),
+                             "ages": np.array(ages, dtype=np.int64),
+                             "weights": np.array(weights, dtype=np.float64)}
+
+        np.savez(path,
+                 header=np.array(json.dumps(header)),
+                 terrain=self.island.terrain,
+                 fodder=self.island.get_fodder_grid(),
+                 f_max=self._f_max_array(),
+                 herb_history=self._count_history["Herbivore"],
+                 carn_history=self._count_history["Carnivore"],
+                 rd_state=np.array(rd_internal, dtype=np.uint32),
+                 np_state=np.asarray(np_keys, dtype=np.uint32),
+                 **animal_arrays)
+
+    def _cell_indices(self, rows, cols):
+        """Returns the row-major cell index of each location as int32."""
+        return (np.asarray(rows, dtype=np.int32) * np.int32(self.island.shape[1])
+                + np.asarray(cols, dtype=np.int32))
+
+    @staticmethod
+    def _compact_ages(ages):
+        """Returns the ages as uint16, and raises ValueError if any does not fit."""
+        ages = np.asarray(ages)
+        if ages.size and ages.max() > np.iinfo(np.uint16).max:
+            raise ValueError("The ages must be at most {0} for compact storage"
+                             .format(np.iinfo(np.uint16).max))
+        return ages.astype(np.uint16)
+
+    def _f_max_array(self):
+        """Returns the f_max grid of the island for a checkpoint, as an
+        empty array if none is set."""
+        f_max_grid = self.island.get_f_max_grid()
+        if f_max_grid is None:
+            return np.empty((0, 0))
+        return f_max_grid
+
+    @classmethod
+    def load_checkpoint(cls, path, **settings):
+        """
+        Create a simulation from a checkpoint file written by save_checkpoint.
 
+        :param path: File name of the checkpoint
+        :param settings: Constructor arguments replacing the saved ones, e.g. img_base
+        :return: Simulation continuing exactly where the saved one stopped
+
+        The saved animal and landscape parameters are set on the classes,
+        so they apply to all simulations, as with set_animal_parameters.
+        """
+        with np.load(path) as data:
+            header = json.loads(str(data["header"]))
+            if header["version"] != _CHECKPOINT_VERSION:
+                raise ValueError("Unknown checkpoint version: {}".format(header["version"]))
+            arrays = {name: data[name] for name in data.files if name != "header"}
+
+        for name, animal_class in _SPECIES.items():
+            animal_class.param_changer(header["parameters"][name])
+        for landscape, params in header["landscape_parameters"].items():
+            Landscape.param_changer(landscape, params)
+
+        kwargs = dict(header["settings"])
+        kwargs.update(settings)
+        # Checkpoints written before the terrain was stored hold the map string
+        sim = cls(arrays["terrain"] if "terrain" in arrays else header["island_map"],
+                  [], **kwargs)
+        sim.island.set_fodder_grid(arrays["fodder"])
+        if arrays.get("f_max", np.empty(0)).size:
+            sim.island.set_f_max_grid(arrays["f_max"])
+        if "cells" in arrays:
+            rows, cols = np.divmod(arrays["cells"], sim.island.shape[1])
+        else:
+            rows, cols = arrays["rows"], arrays["cols"]
+        sim._check_memory_budget(len(arrays["species"]))
+        sim._create_animals(arrays["species"], rows, cols,
+                            arrays["ages"], arrays["weights"])
+        sim.use_binned_draws(header.get("probability_bins"))
+
+        sim._year = header["year"]
+        sim._img_ctr = header["img_ctr"]
+        sim._max_animals = header["max_animals"]
+        sim._count_history = {"Herbivore": arrays["herb_history"],
+                              "Carnivore": arrays["carn_history"]}
+
+        rd_state = header["random_state"]
+        rd.setstate((rd_state["version"], tuple(arrays["rd_state"].tolist()),
+                     rd_state["gauss_next"]))
+        np_state = header["np_random_state"]
+        np.random.set_state((np_state["name"], arrays["np_state"], np_state["pos"],
+                             np_state["has_gauss"], np_state["cached_gaussian"]))
+        return sim
+
+    def _create_animals(self, codes, rows, cols, ages, weights):
+        """Creates animals from validated arrays, in the order given.
+
+        :param codes: Index of the species of each animal in _SPECIES
+        :param rows: Row of each animal
+        :param cols: Column of each animal
+        :param ages: Age of each animal
+        :param weights: Weight of each animal
+        """
+        if self._population is not self.island:
+            shape = self.island.shape
+            self.cycle.add_animals(np.asarray(codes),
+                                   np.asarray(rows) * shape[1] + np.asarray(cols),
+                                   np.asarray(ages), np.asarray(weights))
+            return
+        animal_classes = list(_SPECIES.values())
+        # The cyclic garbage collector would scan the growing population over
+        # and over while millions of animals are created
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for code, row, col, age, weight in zip(np.asarray(codes).tolist(),
+                                                   np.asarray(rows).tolist(),
+                                                   np.asarray(cols).tolist(),
+                                                   np.asarray(ages).tolist(),
+                                                   np.asarray(weights).tolist()):
+                animal_classes[code](self.island, (row, col), age, weight)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def add_population_arrays(self, species, rows, cols, ages, weights):
+        """
+        Add a population given as one array per attribute to the island
+
+        :param species: Array of species names, 'Herbivore' or 'Carnivore'
+        :param rows: Integer array with the row of each animal
+        :param cols: Integer array with the column of each animal
+        :param ages: Integer array with the age of each animal
+        :param weights: Array with the weight of each animal
+
+        All arrays are validated at once before any animal is created, with
+        the same rules as add_population, so either all animals are added
+        or none. This includes the memory budget.
+        """
+        species = np.asarray(species)
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        ages = np.asarray(ages)
+        weights = np.asarray(weights)
+
+        if not species.ndim == rows.ndim == cols.ndim == ages.ndim == weights.ndim == 1:
+            raise ValueError("The population arrays must be one-dimensional")
+        if not len(species) == len(rows) == len(cols) == len(ages) == len(weights):
+            raise ValueError("The population arrays must have the same length")
+        if len(species) == 0:
+            # Empty lists become float arrays, which would fail the dtype checks
+            return
+
+        codes = np.full(len(species), -1, dtype=np.int8)
+        for code, name in enumerate(_SPECIES):
+            codes[species == name] = code
+        if (codes < 0).any():
+            raise ValueError("The species must be of either"
+                             " Herbivore or Carnivore")
+
+        if not (np.issubdtype(rows.dtype, np.integer) and np.issubdtype(cols.dtype, np.integer)):
+            raise ValueError("The locations must be integers")
+        outside = (rows < 0) | (rows >= self.island.shape[0]) | \
+                  (cols < 0) | (cols >= self.island.shape[1])
+        if outside.any():
+            loc = (int(rows[outside][0]), int(cols[outside][0]))
+            raise ValueError("The location {0} does not exist "
+                             "in the given Island".format(loc))
+        if not self.island.get_habitable_grid()[rows, cols].all():
+            raise ValueError("Animal can not be placed "
+                             "in mountain or ocean!")
+
+        if not np.issubdtype(ages.dtype, np.integer) or (ages < 0).any():
+            raise ValueError("The age needs to be a positive integer")
+        if not np.issubdtype(weights.dtype, np.number) or weights.dtype == bool \
+                or (weights < 0).any():
+            raise ValueError("The weight needs to be a positive number")
+
+        self._check_memory_budget(len(codes))
+        self._create_animals(codes, rows, cols, ages, weights)
+
+    def add_population_table(self, table):
+        """
+        Add a population given as a table to the island
+
+        :param table: Structured array with the fields of population_dtype,
+                      or a mapping from 'species', 'row', 'col', 'age' and 'weight' to arrays,
+                      or a table of compact_population_dtype
+        """
+        if getattr(table, "dtype", None) == compact_population_dtype:
+            if (table["species"] >= len(_SPECIES)).any():
+                raise ValueError("The species must be of either"
+                                 " Herbivore or Carnivore")
+            rows, cols = np.divmod(table["cell"], self.island.shape[1])
+            self.add_population_arrays(np.array(list(_SPECIES))[table["species"]],
+                                       rows, cols, table["age"], table["weight"])
+        else:
+            self.add_population_arrays(*(table[field] for field in _POPULATION_FIELDS))
+
+    def load_population(self, path):
+        """
+        Add a population stored in a .npz or CSV file to the island
+
+        :param path: File name ending with '.npz' or '.csv'
+
+        A .npz file holds one array named 'species', 'row', 'col', 'age'
+        and 'weight' each, as written by numpy.savez. A CSV file has a
+        header line with these column names, in any order, and one animal
+        per line. A 'fitness' column, as written by write_population_table,
+        is ignored since fitness follows from age and weight.
+        """
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                self.add_population_table(data)
+        elif path.endswith(".csv"):
+            with open(path) as csv_file:
+                header = [name.strip() for name in csv_file.readline().split(",")]
+                if not set(_POPULATION_FIELDS) <= set(header) <= set(population_table_dtype.names):
+                    raise ValueError("The CSV header must name the columns "
+                                     + ", ".join(_POPULATION_FIELDS))
+                dtype = [(name, population_table_dtype[name]) for name in header]
+                table = np.loadtxt(csv_file, dtype=dtype, delimiter=",", ndmin=1)
+            self.add_population_table(table)
+        else:
+            raise ValueError("Unknown population file type: " + path)
 
     def add_population(self, population):
         """
         Add a population to the island
 
         :param population: List of dictionaries specifying population
+
+        For large populations, add_population_arrays is much faster.
         """
+        self._check_memory_budget(sum(len(loc_dict.get("pop", ()))
+                                      for loc_dict in population))
 
         for loc_dict in population:
 
@@ -345,7 +1235,7 @@ class BioSim:
 
             loc = loc_dict["loc"]
 
-            if loc not in self.island.locations:
+            if loc not in self.island.island_dict:
                 raise ValueError("The location {0} does not exist "
                                  "in the given Island".format(loc))
 
@@ -373,6 +1263,114 @@ class BioSim:
                 else:
                     raise ValueError("The species must be of either"
                                      " Herbivore or Carnivore")
+        if self._population is not self.island:
+            self.cycle.take_island_animals()
+
+    def _iter_population_chunks(self, chunk_size):
+        """Yields the population table in parts of at most chunk_size animals.
+
+        :param chunk_size: Maximal number of animals per part
+        """
+        chunk = np.empty(chunk_size, dtype=population_table_dtype)
+        filled = 0
+        for loc in self.island.get_occupied_locations():
+            cell = self.island.island_dict[loc]
+            for species, animals in (("Herbivore", cell.get_herb_pop_list()),
+                                     ("Carnivore", cell.get_carn_pop_list())):
+                start = 0
+                while start < len(animals):
+                    part = animals[start:start + chunk_size - filled]
+                    rows = chunk[filled:filled + len(part)]
+                    rows["species"] = species
+                    rows["row"] = loc[0]
+                    rows["col"] = loc[1]
+                    rows["age"] = [animal.age for animal in part]
+                    rows["weight"] = [animal.weight for animal in part]
+                    rows["fitness"] = [animal.fitness for animal in part]
+                    filled += len(part)
+                    start += len(part)
+                    if filled == chunk_size:
+                        yield chunk
+                        chunk = np.empty(chunk_size, dtype=population_table_dtype)
+                        filled = 0
+        if filled:
+            yield chunk[:filled]
+
+    def _compact_chunk(self, chunk):
+        """Returns a part of the population table with the dtype compact_population_dtype."""
+        compact = np.empty(len(chunk), dtype=compact_population_dtype)
+        compact["species"] = chunk["species"] == "Carnivore"
+        compact["cell"] = self._cell_indices(chunk["row"], chunk["col"])
+        compact["age"] = self._compact_ages(chunk["age"])
+        compact["weight"] = chunk["weight"]
+        compact["fitness"] = chunk["fitness"]
+        return compact
+
+    def population_table(self, compact=False):
+        """
+        Table with every animal on the island, one row per animal.
+
+        :param compact: If True, return a table of compact_population_dtype
+        :return: Structured array of population_table_dtype, with the fields
+                 species, row, col, age, weight and fitness
+
+        The animals are ordered by location, with the Herbivores before the
+        Carnivores on each location. The table is a copy, so it does not
+        change as the simulation continues, and can be passed directly to
+        add_population_table.
+
+        The compact table takes 15 instead of 68 bytes per animal. It has
+        the species as index 0 for Herbivore and 1 for Carnivore, the
+        row-major cell index row * columns + col as int32, ages as uint16,
+        and weight and fitness as float32.
+        """
+        self._check_animal_objects("The population table")
+        num_animals = self.num_animals
+        if num_animals == 0:
+            table = np.empty(0, dtype=population_table_dtype)
+        else:
+            table = next(self._iter_population_chunks(num_animals))
+        if compact:
+            return self._compact_chunk(table)
+        return table
+
+    def write_population_table(self, path, chunk_size=100000, compact=False):
+        """
+        Write the population table to a .npy or CSV file, part by part.
+
+        :param path: File name ending with '.npy' or '.csv'
+        :param chunk_size: Number of animals converted and written at a time
+        :param compact: If True, write a .npy file of compact_population_dtype
+
+        Only chunk_size animals are held as a table at any time, so large
+        populations can be written without a copy of the whole table in
+        memory. A .npy file holds the structured array as returned by
+        population_table, and is written through a memory map. A CSV file
+        has a header line and can be read back with load_population.
+        """
+        self._check_animal_objects("The population table")
+        if compact and not path.endswith(".npy"):
+            raise ValueError("The compact population table is only written to .npy files")
+        if path.endswith(".npy"):
+            dtype = compact_population_dtype if compact else population_table_dtype
+            table = np.lib.format.open_memmap(path, mode="w+", dtype=dtype,
+                                              shape=(self.num_animals,))
+            start = 0
+            for chunk in self._iter_population_chunks(chunk_size):
+                if compact:
+                    chunk = self._compact_chunk(chunk)
+                table[start:start + len(chunk)] = chunk
+                start += len(chunk)
+            table.flush()
+            del table
+        elif path.endswith(".csv"):
+            with open(path, "w") as csv_file:
+                csv_file.write(",".join(population_table_dtype.names) + "\n")
+                for chunk in self._iter_population_chunks(chunk_size):
+                    np.savetxt(csv_file, chunk, delimiter=",",
+                               fmt=["%s", "%d", "%d", "%d", "%.17g", "%.17g"])
+        else:
+            raise ValueError("Unknown population table file type: " + path)
 
     @property
     def year(self):
@@ -380,26 +1378,45 @@ class BioSim:
         return self._year
 
 
+    @property
+    def count_history(self):
+        """Dict mapping species to array of animal counts per year.
+        Years that were not visualized are NaN."""
+        return self._count_history
+
+    def _update_num_animals(self):
+        """Takes the animal counts from the island, unless animals have not
+        been added or removed since they were last taken."""
+        version = (self._population, self._population._version)
+        if self._num_animals_version == version:
+            return
+        self._num_animal_per_species = self._population.get_num_animals_per_species()
+        self._num_animals = sum(self._num_animal_per_species.values())
+        self._num_animals_version = version
+
     @property
     def num_animals(self):
         """Total number of animals on island."""
-        self._num_animals = len(self.island.get_all_herb_list()) + \
-                            len(self.island.get_all_carn_list())
+        self._update_num_animals()
         return self._num_animals
 
     @property
     def num_animals_per_species(self):
         """Number of animals per species in island, as dictionary."""
-        self._num_animal_per_species = {
-            "Herbivore": len(self.island.get_all_herb_list()),
-            "Carnivore": len(self.island.get_all_carn_list())
-        }
-        return self._num_animal_per_species
+        self._update_num_animals()
+        return dict(self._num_animal_per_species)
 
     @property
     def animal_distribution(self):
         """Pandas DataFrame with animal count per species for each cell on island."""
-        df = pd.DataFrame(self.island.island_data, columns=["Row", "Col", "Herbivore", "Carnivore"])
+        import pandas as pd
+
+        herb_grid, carn_grid = self._distribution_grids()
+        rows, cols = np.indices(herb_grid.shape)
+        df = pd.DataFrame({"Row": rows.ravel(),
+                           "Col": cols.ravel(),
+                           "Herbivore": herb_grid.ravel(),
+                           "Carnivore": carn_grid.ravel()})
         return df
 
     def make_movie(self, movie_fmt='mp4'):
@@ -410,11 +1427,19 @@ class BioSim:
             Requires ffmpeg
 
         The movie is stored as img_base + movie_fmt (Only mp4 is supported in the current version)
+
+        If frames were streamed into ffmpeg while simulating, the movie
+        files are already finished by simulate, and nothing is done.
         """
 
         if self._img_base is None:
             raise RuntimeError("No filename defined.")
 
+        if self._movie_fmt is not None:
+            if movie_fmt != self._movie_fmt:
+                raise ValueError('Frames are streamed as movie format: ' + self._movie_fmt)
+            return
+
         if movie_fmt == 'mp4':
             if shutil.which('ffmpeg') is None:
                 raise RuntimeError("FFMPEG is not installed")
@@ -57,6 +57,14 @@ class TestAnimals:
         assert Carnivore.parameters["lambda"] == 1.0
         assert Carnivore.parameters["F"] == 50.0
 
+    def test_animals_have_no_instance_dict(self):
+        """Tests that the animals store their attributes in slots only.
+        """
+        for animal in self.stnd_a_list:
+            assert not hasattr(animal, "__dict__")
+            with pytest.raises(AttributeError):
+                animal.color = "brown"
+
     def test_aging(self):
         """Test if the age of all animals increase by
         1 for each time method is called
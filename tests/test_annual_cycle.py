@@ -5,7 +5,8 @@ __email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
 
 from island import Island
 from animals import Herbivore, Carnivore
-from annual_cycle import AnnualCycle
+from annual_cycle import AnnualCycle, binned_events
+import numpy as np
 import pytest
 from mock import patch
 
@@ -234,3 +235,54 @@ class TestAnnualCycle:
 
         assert h.get_loc() == new_loc
         assert c.get_loc() == new_loc
+
+
+class TestBinnedEvents:
+
+    def test_frequencies_match_probabilities(self):
+        """Tests that every animal is chosen with its own probability.
+        """
+        np.random.seed(1)
+        probabilities = np.linspace(0, 1, 41)
+        trials = 4000
+        chosen = np.zeros(len(probabilities))
+        for _ in range(trials):
+            chosen += binned_events(probabilities, 8)
+        frequencies = chosen / trials
+        standard_error = np.sqrt(probabilities * (1 - probabilities) / trials)
+        assert np.all(np.abs(frequencies - probabilities) <= 4 * standard_error + 1e-12)
+
+    def test_certain_and_impossible_events(self):
+        """Tests that probability 1 always and probability 0 never happens.
+        """
+        happens = binned_events([0, 1, 0, 1, 1.5, -0.5], 4)
+        assert happens.tolist() == [False, True, False, True, True, False]
+
+    def test_draws_per_bin(self, mocker):
+        """Tests that the number of binomial draws follows the bins, not the animals.
+        """
+        binomial = mocker.spy(np.random, "binomial")
+        binned_events(np.random.random(10000), 16)
+        assert binomial.call_count <= 16
+
+    def test_binned_death_removes_zero_fitness(self):
+        """Tests that animals with zero fitness always die with binned draws.
+        """
+        i = Island()
+        cycle = AnnualCycle(i)
+        cycle.probability_bins = 4
+        for _ in range(10):
+            Herbivore(i, (2, 7), weight=0)
+        cycle.animal_death()
+        assert i.get_num_herb_on_loc((2, 7)) == 0
+
+    @patch.dict(Herbivore.parameters, {"mu": 0})
+    def test_binned_migration_without_mu(self):
+        """Tests that no animal moves with binned draws when mu is zero.
+        """
+        i = Island()
+        cycle = AnnualCycle(i)
+        cycle.probability_bins = 4
+        herbs = [Herbivore(i, (2, 7), weight=30) for _ in range(10)]
+        cycle.migration()
+        assert all(herb.get_loc() == (2, 7) for herb in herbs)
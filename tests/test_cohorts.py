@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.simulation import BioSim
+from src.biosim.cohorts import Cohorts, _round_cumulative
+import numpy as np
+import pytest
+from mock import patch
+
+
+class TestCohorts:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OJJDO
+                     OOOOO"""
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(100)]
+                                + [{"species": "Herbivore", "age": 5, "weight": 20.3},
+                                   {"species": "Herbivore", "age": 5, "weight": 24.0}]},
+                        {"loc": (2, 2),
+                         "pop": [{"species": "Carnivore", "age": 3, "weight": 30}
+                                 for _ in range(5)]}]
+        self.sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+
+    def test_animals_moved_into_cohorts(self):
+        """Tests that the animals leave the island and are merged into
+        cohorts by location, age and weight bin, keeping the total weight.
+        """
+        herb_grid = self.sim.island.get_herb_count_grid().copy()
+        self.sim.use_cohorts(weight_bin=1.0)
+        herbs = self.sim.cycle.herbivores
+        assert self.sim.island.get_num_animals_per_species() == {"Herbivore": 0,
+                                                                 "Carnivore": 0}
+        assert self.sim.num_animals_per_species == {"Herbivore": 102, "Carnivore": 5}
+        assert np.array_equal(self.sim.cycle.get_herb_count_grid(), herb_grid)
+        assert sorted(herbs.counts.tolist()) == [1, 101]
+        assert np.isclose((herbs.counts * herbs.weights).sum(), 100 * 20 + 20.3 + 24.0)
+        assert len(self.sim.cycle.carnivores) == 1
+
+    def test_fitness_as_animals(self):
+        """Tests that the fitness of a cohort is the fitness of its animals.
+        """
+        herb = self.sim.island.get_herb_list_on_loc((1, 1))[-1]
+        self.sim.use_cohorts(weight_bin=0.1)
+        herbs = self.sim.cycle.herbivores
+        fitness = herbs.fitness()[herbs.weights == 24.0]
+        assert fitness == pytest.approx(herb.fitness)
+
+    def test_herb_feeding_splits_cohort(self):
+        """Tests that a cohort eats the fodder in F portions, with one animal
+        eating the rest and the others nothing.
+        """
+        self.sim.use_cohorts(weight_bin=0.1)
+        cycle = self.sim.cycle
+        fodder = self.sim.island.get_fodder_grid()
+        fodder[1, 1] = 455.0
+        self.sim.island.set_fodder_grid(fodder)
+        cycle.herb_feeding()
+        herbs = cycle.herbivores
+        on_cell = herbs.cells == 6
+        weights = dict(zip(herbs.weights[on_cell].round(6).tolist(),
+                           herbs.counts[on_cell].tolist()))
+        beta = herbs.parameters["beta"]
+        # The two heaviest Herbivores are the fittest and eat first
+        assert weights[round(24.0 + 10 * beta, 6)] == 1
+        assert weights[round(20.3 + 10 * beta, 6)] == 1
+        assert weights[round(20.0 + 10 * beta, 6)] == 43
+        assert weights[round(20.0 + 5 * beta, 6)] == 1
+        assert weights[20.0] == 56
+        assert self.sim.island.get_fodder_grid()[1, 1] == 0
+
+    def test_carnivore_eats_its_fill(self):
+        """Tests that Carnivores certain to kill eat exactly F each.
+        """
+        self.sim.add_population([{"loc": (2, 2),
+                                  "pop": [{"species": "Herbivore", "age": 50, "weight": 5}
+                                          for _ in range(100)]}])
+        self.sim.use_cohorts()
+        cycle = self.sim.cycle
+        with patch.dict(cycle.carnivores.parameters, {"DeltaPhiMax": 1e-6}):
+            cycle.carn_feeding()
+        appetite = cycle.carnivores.parameters["F"]
+        beta = cycle.carnivores.parameters["beta"]
+        # Each of the 5 Carnivores kills Herbivores of weight 5 until it has eaten F
+        assert cycle.herbivores.count_grid()[2, 2] == 100 - 5 * appetite // 5
+        assert np.allclose(cycle.carnivores.weights, 30 + beta * appetite)
+
+    def test_no_deaths_without_omega(self):
+        """Tests that no animal with positive fitness dies when omega is zero.
+        """
+        self.sim.use_cohorts()
+        with patch.dict(self.sim.cycle.herbivores.parameters, {"omega": 0}):
+            self.sim.cycle.animal_death()
+        assert self.sim.num_animals_per_species["Herbivore"] == 102
+
+    def test_migration_to_habitable_neighbours(self):
+        """Tests that migrating animals only land on habitable neighbours and
+        that no animal is lost.
+        """
+        self.sim.use_cohorts()
+        with patch.dict(self.sim.cycle.herbivores.parameters, {"mu": 4.0}):
+            self.sim.cycle.migration()
+        herb_grid = self.sim.cycle.get_herb_count_grid()
+        assert herb_grid.sum() == 102
+        assert herb_grid[1, 1] < 102
+        assert herb_grid[self.sim.island.get_habitable_grid() == 0].sum() == 0
+        assert herb_grid[2, 2] == 0
+
+    def test_added_animals_join_cohorts(self):
+        """Tests that animals added after switching join the cohorts.
+        """
+        self.sim.use_cohorts()
+        self.sim.add_population_arrays(["Herbivore"] * 3, [1] * 3, [2] * 3, [5] * 3,
+                                       [20.0] * 3)
+        assert self.sim.num_animals_per_species["Herbivore"] == 105
+        assert self.sim.island.get_num_animals_per_species()["Herbivore"] == 0
+
+    def test_object_features_refused(self, tmpdir):
+        """Tests that features needing single animals raise with cohorts.
+        """
+        self.sim.use_cohorts()
+        with pytest.raises(RuntimeError):
+            self.sim.population_table()
+        with pytest.raises(RuntimeError):
+            self.sim.save_checkpoint(str(tmpdir.join("checkpoint.npz")))
+        with pytest.raises(RuntimeError):
+            self.sim.use_cohorts()
+
+    def test_compact_cohorts(self):
+        """Tests that compact cohorts keep their dtypes through the cycle, are
+        counted with their real size by the memory footprint, and follow
+        the full-precision cohorts closely.
+        """
+        full = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        full.use_cohorts()
+        self.sim.use_cohorts(compact=True)
+        assert self.sim.memory_footprint() < full.memory_footprint()
+        self.sim.simulate(5)
+        full.simulate(5)
+        for cohorts in (self.sim.cycle.herbivores, self.sim.cycle.carnivores):
+            assert cohorts.itemsize == 14
+            assert [array.dtype for array in (cohorts.cells, cohorts.ages, cohorts.weights,
+                                              cohorts.counts)] == list(Cohorts.compact_dtypes)
+        assert self.sim.num_animals == pytest.approx(full.num_animals, rel=0.2)
+
+    def test_invalid_weight_bin(self):
+        """Tests that the weight bin must be positive.
+        """
+        with pytest.raises(ValueError):
+            self.sim.use_cohorts(weight_bin=0)
+
+    def test_instrumented_cohort_cycle(self):
+        """Tests that the instrumentation counts the events of the cohort engine.
+        """
+        self.sim.use_cohorts()
+        self.sim.instrument()
+        self.sim.simulate(3)
+        statistics = self.sim.cycle_statistics
+        assert list(statistics["year"]) == [1, 2, 3]
+        assert statistics["migrations"].sum() > 0
+
+    def test_close_to_individual_engine(self):
+        """Tests that the mean Herbivore count of a few replicates is close
+        to the individual-based engine.
+        """
+        means = []
+        for cohorts in (False, True):
+            counts = []
+            for seed in range(3):
+                sim = BioSim(self.geogr, self.ini_pop[:1], seed=seed, headless=True)
+                if cohorts:
+                    sim.use_cohorts()
+                sim.simulate(10)
+                counts.append(sim.num_animals)
+            means.append(np.mean(counts))
+        assert means[1] == pytest.approx(means[0], rel=0.15)
+
+
+class TestCohortsMeanField:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OOOOO"""
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": age, "weight": 10 + age}
+                                 for age in range(60)]},
+                        {"loc": (1, 3),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(3)]}]
+
+    def test_round_cumulative_keeps_totals(self):
+        """Tests that cumulative rounding keeps the total on every cell within
+        one half of the expected total, also for many small expectations.
+        """
+        expected = np.array([0.3, 0.3, 0.3, 0.3, 2.6, 0.2])
+        cells = np.array([4, 4, 4, 4, 7, 7])
+        rounded = _round_cumulative(expected, cells)
+        assert rounded.dtype == np.int64
+        assert rounded[:4].sum() == 1
+        assert rounded[4:].sum() == 3
+        assert (rounded >= 0).all()
+
+    def test_saturated_cells_are_deterministic(self):
+        """Tests that deaths on saturated cells do not depend on the seed.
+        """
+        counts = []
+        for seed in range(3):
+            sim = BioSim(self.geogr, self.ini_pop[:1], seed=seed, headless=True)
+            sim.use_cohorts(mean_field_threshold=10)
+            sim.cycle.sort_by_fitness()
+            sim.cycle.animal_death()
+            counts.append(sim.cycle.herbivores.counts.tolist())
+        assert counts[0] == counts[1] == counts[2]
+        assert sum(counts[0]) < 60
+
+    def test_cell_modes_per_year(self):
+        """Tests that the number of cells in each mode is recorded every year.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        assert sim.cell_modes is None
+        sim.simulate(2)
+        sim.use_cohorts(mean_field_threshold=50)
+        sim.simulate(3)
+        modes = sim.cell_modes
+        assert list(modes["year"]) == [3, 4, 5]
+        assert modes["mean_field"][0] == 1
+        assert (modes["stochastic"] + modes["mean_field"] <= 3).all()
+
+    def test_no_threshold_is_stochastic(self):
+        """Tests that without a threshold every occupied cell is stochastic.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        sim.use_cohorts()
+        sim.simulate(1)
+        assert list(sim.cell_modes["mean_field"]) == [0]
+        assert list(sim.cell_modes["stochastic"]) == [2]
+
+    def test_cell_modes_of_empty_years(self):
+        """Tests that years without animals are recorded with no occupied cells.
+        """
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        sim.use_cohorts()
+        sim.simulate(3)
+        assert list(sim.cell_modes["year"]) == [1, 2, 3]
+        assert list(sim.cell_modes["stochastic"]) == [0, 0, 0]
+
+    def test_negative_threshold(self):
+        """Tests that the mean-field threshold must not be negative.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        with pytest.raises(ValueError):
+            sim.use_cohorts(mean_field_threshold=-1)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.convergence import ConvergenceMonitor
+from src.biosim.simulation import BioSim
+import numpy as np
+import json
+import pytest
+
+
+class TestConvergenceMonitor:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.monitor = ConvergenceMonitor(window=4, tolerance=0.1)
+
+    def update(self, year, herbivores, carnivores=0, **grids):
+        return self.monitor.update(year, {"Herbivore": herbivores, "Carnivore": carnivores},
+                                   **grids)
+
+    def test_rolling_half_window_means(self):
+        """Tests that the change compares the means of the two halves of the
+        last window years, also after the window has moved on.
+        """
+        for year, count in enumerate([100, 200, 300, 400, 500, 600], start=1):
+            self.update(year, count)
+        changes = self.monitor.as_dict()["herb_change"]
+        assert np.isnan(changes[:3]).all()
+        # Halves (100, 200) and (300, 400), window mean 250
+        assert changes[3] == pytest.approx(200 / 250)
+        # Halves (300, 400) and (500, 600), window mean 450
+        assert changes[5] == pytest.approx(200 / 450)
+
+    def test_converged_year_is_first_stationary_year(self):
+        """Tests that only the first stationary year is reported as convergence.
+        """
+        converged = [self.update(year, count, 10)
+                     for year, count in enumerate([50, 100, 101, 99, 100, 100, 100], start=1)]
+        assert converged == [False] * 4 + [True, False, False]
+        assert self.monitor.converged_year == 5
+        assert list(self.monitor.stationary) == [False] * 4 + [True] * 3
+
+    def test_grids_must_be_stationary(self):
+        """Tests that with grids the animals per location must also be stationary.
+        """
+        self.monitor = ConvergenceMonitor(window=2, tolerance=0.1, grids=True)
+        empty = np.zeros((1, 2), dtype=int)
+        self.update(1, 10, herb_grid=np.array([[10, 0]]), carn_grid=empty)
+        assert not self.update(2, 10, herb_grid=np.array([[0, 10]]), carn_grid=empty)
+        assert self.monitor.as_dict()["herb_grid_change"][1] == pytest.approx(2)
+        assert self.update(3, 10, herb_grid=np.array([[0, 10]]), carn_grid=empty)
+
+    def test_invalid_window(self):
+        """Tests that the window must be an even number of years.
+        """
+        with pytest.raises(ValueError):
+            ConvergenceMonitor(window=5)
+        with pytest.raises(ValueError):
+            ConvergenceMonitor(window=0)
+        with pytest.raises(ValueError):
+            ConvergenceMonitor(tolerance=-1)
+
+    def test_write(self, tmpdir):
+        """Tests that the diagnostics are written to CSV and JSON.
+        """
+        for year in range(1, 6):
+            self.update(year, 100)
+        csv_path = str(tmpdir.join("convergence.csv"))
+        self.monitor.write(csv_path)
+        table = np.genfromtxt(csv_path, delimiter=",", names=True)
+        assert list(table["year"]) == [1, 2, 3, 4, 5]
+        json_path = str(tmpdir.join("convergence.json"))
+        self.monitor.write(json_path)
+        with open(json_path) as json_file:
+            data = json.load(json_file)
+        assert data["converged_year"] == 4
+        assert data["herb_change"][0] is None
+        with pytest.raises(ValueError):
+            self.monitor.write(str(tmpdir.join("convergence.txt")))
+
+
+class TestSimulationConvergence:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(50)]}]
+        self.sim = BioSim("OOOOO\nOJJSO\nOOOOO", self.ini_pop, seed=1, headless=True)
+
+    def test_simulate_stops_at_convergence(self):
+        """Tests that simulate stops in the year the counts become stationary.
+        """
+        self.sim.monitor_convergence(window=10, tolerance=0.1)
+        self.sim.simulate(500)
+        assert self.sim.converged_year is not None
+        assert self.sim.year == self.sim.converged_year < 500
+        statistics = self.sim.convergence_statistics
+        assert statistics["year"][-1] == self.sim.year
+        assert statistics["herb_count"][-1] == self.sim.num_animals_per_species["Herbivore"]
+
+    def test_signal_without_stopping(self):
+        """Tests that with stop=False the convergence is only recorded.
+        """
+        self.sim.monitor_convergence(window=10, tolerance=0.1, grids=True, stop=False)
+        self.sim.simulate(100)
+        assert self.sim.year == 100
+        assert self.sim.converged_year is not None
+        assert len(self.sim.convergence_statistics["year"]) == 100
+
+    def test_iter_years_stops_at_convergence(self):
+        """Tests that iterating over the years ends with the converged year.
+        """
+        self.sim.monitor_convergence(window=10, tolerance=0.1)
+        years = [snapshot.year for snapshot in self.sim.iter_years(500)]
+        assert years[-1] == self.sim.converged_year
+
+    def test_not_monitored(self, tmpdir):
+        """Tests that convergence is not monitored unless asked to.
+        """
+        assert self.sim.converged_year is None
+        assert self.sim.convergence_statistics is None
+        with pytest.raises(RuntimeError):
+            self.sim.write_convergence_statistics(str(tmpdir.join("convergence.csv")))
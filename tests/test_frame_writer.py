@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.frame_writer import (BackgroundFrameWriter, ImageFrameWriter,
+                                     MovieFrameWriter)
+import numpy as np
+import threading
+import pytest
+
+
+class TestImageFrameWriter:
+
+    def test_file_name(self):
+        """Tests that image files are named by base, number and format.
+        """
+        writer = ImageFrameWriter("dir/sim", "png")
+        assert writer.file_name(12) == "dir/sim_00012.png"
+
+    def test_write_creates_image_file(self, tmpdir):
+        """Tests that write creates an image file of the frame.
+        """
+        writer = ImageFrameWriter(str(tmpdir.join("sim")), "png")
+        frame = np.zeros((4, 6, 4), dtype=np.uint8)
+        writer.write(frame, 3)
+        assert tmpdir.join("sim_00003.png").check(file=1)
+
+
+class TestMovieFrameWriter:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.popen = mocker.patch("subprocess.Popen")
+        self.process = self.popen.return_value
+        self.process.wait.return_value = 0
+        self.frame = np.zeros((4, 6, 4), dtype=np.uint8)
+
+    def test_process_started_once_with_frame_size(self):
+        """Tests that one ffmpeg process is started with the size of the first frame.
+        """
+        writer = MovieFrameWriter("sim.mp4")
+        writer.write(self.frame, 0)
+        writer.write(self.frame, 1)
+        assert self.popen.call_count == 1
+        command = self.popen.call_args[0][0]
+        assert command[command.index("-s") + 1] == "6x4"
+        assert command[-1] == "sim.mp4"
+
+    def test_frames_written_to_stdin(self):
+        """Tests that the raw frame bytes are written to ffmpeg.
+        """
+        writer = MovieFrameWriter("sim.mp4")
+        writer.write(self.frame, 0)
+        written = self.process.stdin.write.call_args[0][0]
+        assert bytes(written) == self.frame.tobytes()
+
+    def test_frame_of_other_size_raises(self):
+        """Tests that a frame of another size than the first raises ValueError.
+        """
+        writer = MovieFrameWriter("sim.mp4")
+        writer.write(self.frame, 0)
+        with pytest.raises(ValueError):
+            writer.write(np.zeros((2, 2, 4), dtype=np.uint8), 1)
+
+    def test_close_waits_for_ffmpeg(self):
+        """Tests that close ends the stream and waits for ffmpeg.
+        """
+        writer = MovieFrameWriter("sim.mp4")
+        writer.write(self.frame, 0)
+        writer.close()
+        self.process.stdin.close.assert_called_once_with()
+        self.process.wait.assert_called_once_with()
+
+    def test_close_raises_if_ffmpeg_fails(self):
+        """Tests that close raises RuntimeError if ffmpeg returns an error code.
+        """
+        self.process.wait.return_value = 1
+        writer = MovieFrameWriter("sim.mp4")
+        writer.write(self.frame, 0)
+        with pytest.raises(RuntimeError):
+            writer.close()
+
+    def test_broken_pipe_raises(self):
+        """Tests that write raises RuntimeError if ffmpeg has stopped.
+        """
+        self.process.stdin.write.side_effect = BrokenPipeError
+        writer = MovieFrameWriter("sim.mp4")
+        with pytest.raises(RuntimeError):
+            writer.write(self.frame, 0)
+
+
+class TestBackgroundFrameWriter:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.written = []
+        self.frame = np.zeros((4, 6, 4), dtype=np.uint8)
+
+    def test_frames_written_in_order(self, mocker):
+        """Tests that queued frames are written in the order they were given.
+        """
+        writer = mocker.Mock()
+        writer.write.side_effect = lambda frame, img_no: self.written.append(img_no)
+        background = BackgroundFrameWriter(writer, max_queued=2)
+        for img_no in range(10):
+            background.write(self.frame, img_no)
+        background.flush()
+        assert self.written == list(range(10))
+
+    def test_frame_copied_when_queued(self, mocker):
+        """Tests that changing the frame after write does not change the written frame.
+        """
+        writer = mocker.Mock()
+        writer.write.side_effect = lambda frame, img_no: self.written.append(frame)
+        background = BackgroundFrameWriter(writer)
+        background.write(self.frame, 0)
+        self.frame[:] = 255
+        background.flush()
+        assert (self.written[0] == 0).all()
+
+    def test_write_blocks_when_queue_full(self, mocker):
+        """Tests that write waits while the queue is full.
+        """
+        release = threading.Event()
+        writer = mocker.Mock()
+        writer.write.side_effect = lambda frame, img_no: release.wait()
+        background = BackgroundFrameWriter(writer, max_queued=1)
+        background.write(self.frame, 0)
+        background.write(self.frame, 1)
+
+        blocked = threading.Thread(target=background.write, args=(self.frame, 2))
+        blocked.start()
+        blocked.join(timeout=0.2)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join()
+        background.close()
+        assert writer.write.call_count == 3
+
+    def test_error_raised_by_flush(self, mocker):
+        """Tests that an error in the background thread is raised by flush.
+        """
+        writer = mocker.Mock()
+        writer.write.side_effect = IOError
+        background = BackgroundFrameWriter(writer)
+        background.write(self.frame, 0)
+        with pytest.raises(IOError):
+            background.flush()
+
+    def test_writer_stays_failed(self, mocker):
+        """Tests that after an error every later write and close raises it again,
+        and no further frames are written.
+        """
+        writer = mocker.Mock()
+        writer.write.side_effect = IOError
+        background = BackgroundFrameWriter(writer)
+        background.write(self.frame, 0)
+        with pytest.raises(IOError):
+            background.flush()
+        with pytest.raises(IOError):
+            background.write(self.frame, 1)
+        with pytest.raises(IOError):
+            background.close()
+        assert writer.write.call_count == 1
+
+    def test_close_after_error_closes_writer(self, mocker):
+        """Tests that close raises an earlier error and still closes the underlying writer.
+        """
+        writer = mocker.Mock()
+        writer.write.side_effect = IOError
+        background = BackgroundFrameWriter(writer)
+        background.write(self.frame, 0)
+        with pytest.raises(IOError):
+            background.close()
+        writer.close.assert_called_once_with()
+
+    def test_close_closes_writer(self, mocker):
+        """Tests that close writes the queued frames and closes the underlying writer.
+        """
+        writer = mocker.Mock()
+        background = BackgroundFrameWriter(writer)
+        background.write(self.frame, 0)
+        background.close()
+        assert writer.write.call_count == 1
+        writer.close.assert_called_once_with()
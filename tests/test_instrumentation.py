@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.instrumentation import CycleInstrumentation
+from src.biosim.annual_cycle import AnnualCycle
+from src.biosim.island import Island
+from src.biosim.animals import Herbivore, Carnivore
+import numpy as np
+import json
+import pytest
+
+
+class TestCycleInstrumentation:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.island = Island()
+        for _ in range(30):
+            Herbivore(self.island, (2, 7), age=5, weight=30)
+        for _ in range(5):
+            Carnivore(self.island, (2, 7), age=5, weight=30)
+        self.cycle = AnnualCycle(self.island)
+        self.cycle.instrumentation = CycleInstrumentation(first_year=1)
+
+    def test_not_instrumented_by_default(self):
+        """Tests that the annual cycle does not collect statistics unless asked to.
+        """
+        assert AnnualCycle(self.island).instrumentation is None
+
+    def test_statistics_shapes(self):
+        """Tests that one row of statistics is recorded per year.
+        """
+        for _ in range(3):
+            self.cycle.run_cycle()
+        statistics = self.cycle.instrumentation.as_dict()
+        phases = len(CycleInstrumentation.phases)
+        assert list(statistics["year"]) == [1, 2, 3]
+        assert statistics["phase_times"].shape == (3, phases)
+        assert (statistics["phase_times"] >= 0).all()
+        assert statistics["processed"].shape == (3, phases)
+        assert statistics["processed"][0, 0] == len(self.island.island_dict)
+        assert statistics["processed"][0, 2] == 30
+        assert statistics["processed"][0, 3] == 5
+
+    def test_events_balance_population(self):
+        """Tests that births minus deaths and kills equals the change in population.
+        """
+        before = sum(self.island.get_num_animals_per_species().values())
+        self.cycle.run_cycle()
+        after = sum(self.island.get_num_animals_per_species().values())
+        statistics = self.cycle.instrumentation.as_dict()
+        births, deaths, kills = (statistics[event][0] for event in ("births", "deaths", "kills"))
+        assert after - before == births - deaths - kills
+
+    def test_migrations_counted(self, mocker):
+        """Tests that every animal that moves to another location is counted as a migration.
+        """
+        migration = self.cycle.migration
+        moved = []
+
+        def count_moves():
+            animals = self.island.get_all_herb_list() + self.island.get_all_carn_list()
+            locs = [animal.loc for animal in animals]
+            migration()
+            moved.append(sum(animal.loc != loc for animal, loc in zip(animals, locs)))
+
+        mocker.patch.object(self.cycle, "migration", side_effect=count_moves)
+        for _ in range(3):
+            self.cycle.run_cycle()
+        assert list(self.cycle.instrumentation.as_dict()["migrations"]) == moved
+        assert sum(moved) > 0
+
+    def test_write_csv_and_json(self, tmpdir):
+        """Tests that the statistics are written to CSV and JSON files.
+        """
+        for _ in range(2):
+            self.cycle.run_cycle()
+        csv_path = str(tmpdir.join("stats.csv"))
+        json_path = str(tmpdir.join("stats.json"))
+        self.cycle.instrumentation.write(csv_path)
+        self.cycle.instrumentation.write(json_path)
+
+        table = np.genfromtxt(csv_path, delimiter=",", names=True)
+        assert list(table["year"]) == [1, 2]
+        assert list(table["births"]) == list(self.cycle.instrumentation.as_dict()["births"])
+        with open(json_path) as json_file:
+            data = json.load(json_file)
+        assert data["phases"] == list(CycleInstrumentation.phases)
+        assert len(data["phase_times"]) == 2
+
+    def test_unknown_file_type(self, tmpdir):
+        """Tests that writing to an unknown file type raises ValueError.
+        """
+        with pytest.raises(ValueError):
+            self.cycle.instrumentation.write(str(tmpdir.join("stats.txt")))
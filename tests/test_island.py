@@ -6,6 +6,7 @@ __email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
 from src.biosim.island import Island
 from src.biosim.animals import Carnivore, Herbivore
 from src.biosim.landscape import *
+import numpy as np
 import pytest
 
 
@@ -235,5 +236,218 @@ class TestIsland:
         i._param_changer(landscape, new_param)
         assert i.island_dict[(0, 0)].landscape_parameters[landscape]["f_max"] == 700
 
+    def test_shape(self):
+        """Tests that the shape of the island is the number of rows and columns in the map.
+        """
+        i = Island()
+        assert i.shape == (13, 21)
+
+    def test_count_grids(self):
+        """Tests that the count grids contain the number of animals on every location.
+        """
+        i = Island()
+        for _ in range(3):
+            Herbivore(i, (2, 7))
+        Herbivore(i, (1, 8))
+        Carnivore(i, (2, 7))
+        herb_grid = i.get_herb_count_grid()
+        carn_grid = i.get_carn_count_grid()
+        assert herb_grid.shape == i.shape
+        assert herb_grid[2, 7] == 3
+        assert herb_grid[1, 8] == 1
+        assert herb_grid.sum() == 4
+        assert carn_grid[2, 7] == 1
+        assert carn_grid.sum() == 1
+
+    def test_count_grids_cached_until_population_changes(self):
+        """Tests that the count grids are reused until animals are added or removed.
+        """
+        i = Island()
+        h = Herbivore(i, (2, 7))
+        grid = i.get_herb_count_grid()
+        assert i.get_herb_count_grid() is grid
+        i.remove_pop_on_loc((2, 7), h)
+        assert i.get_herb_count_grid() is not grid
+        assert i.get_herb_count_grid()[2, 7] == 0
+
+    def test_count_grids_read_only(self):
+        """Tests that the cached count grids can not be changed by the caller.
+        """
+        i = Island()
+        with pytest.raises(ValueError):
+            i.get_carn_count_grid()[2, 7] = 5
+
+    def test_habitable_grid(self):
+        """Tests that only locations that are neither Ocean nor Mountain are habitable.
+        """
+        i = Island("OOOO\nOJMO\nOSDO\nOOOO")
+        assert i.get_habitable_grid().tolist() == [[False, False, False, False],
+                                                   [False, True, False, False],
+                                                   [False, True, True, False],
+                                                   [False, False, False, False]]
+
+    def test_num_animals_per_species(self):
+        """Tests that the number of animals per species follows additions and removals.
+        """
+        i = Island()
+        herbs = [Herbivore(i, (2, 7)) for _ in range(3)]
+        Carnivore(i, (1, 8))
+        i.remove_pop_on_loc((2, 7), herbs[0])
+        assert i.get_num_animals_per_species() == {"Herbivore": 2, "Carnivore": 1}
+        assert i.get_num_animals_per_species()["Herbivore"] == len(i.get_all_herb_list())
+
+    def test_all_lists_are_snapshots(self):
+        """Tests that animals can be added and removed while iterating over the list of all animals.
+        """
+        i = Island()
+        for _ in range(3):
+            Herbivore(i, (2, 7))
+        for herb in i.get_all_herb_list():
+            i.remove_pop_on_loc(herb.loc, herb)
+            Herbivore(i, (1, 8))
+        assert len(i.get_all_herb_list()) == 3
+        assert all(herb.loc == (1, 8) for herb in i.get_all_herb_list())
+
+    def test_sort_orders_registry_by_location(self):
+        """Tests that after sorting, the list of all animals follows the location order.
+        """
+        i = Island()
+        late = Carnivore(i, (5, 5))
+        early = Carnivore(i, (1, 8))
+        assert i.get_all_carn_list() == [late, early]
+        i.sort_all_animals_by_fitness()
+        assert i.get_all_carn_list() == [early, late]
+
+    def test_occupied_locations(self):
+        """Tests that the occupied locations follow the animals, in location order.
+        """
+        i = Island()
+        herb = Herbivore(i, (5, 5))
+        Carnivore(i, (1, 8))
+        Carnivore(i, (5, 5))
+        assert i.get_occupied_locations() == [(1, 8), (5, 5)]
+        i.remove_pop_on_loc((5, 5), herb)
+        assert i.get_occupied_locations() == [(1, 8), (5, 5)]
+        i.remove_pop_on_loc((1, 8), i.get_carn_list_on_loc((1, 8))[0])
+        assert i.get_occupied_locations() == [(5, 5)]
+
+    def test_occupied_locations_sorted_once(self):
+        """Tests that the occupied locations are only sorted again when a
+        location becomes occupied or empty.
+        """
+        i = Island()
+        Herbivore(i, (5, 5))
+        Herbivore(i, (1, 8))
+        first = i.get_occupied_locations()
+        Herbivore(i, (5, 5))
+        assert i.get_occupied_locations() is first
+        herb = Herbivore(i, (2, 7))
+        assert i.get_occupied_locations() == [(1, 8), (2, 7), (5, 5)]
+        i.remove_pop_on_loc((2, 7), herb)
+        assert i.get_occupied_locations() == [(1, 8), (5, 5)]
+
+    def test_refill_by_landscape(self):
+        """Tests that fodder is refilled on Jungle and Savannah, and left alone elsewhere.
+        """
+        i = Island("OOOO\nOJSO\nODMO\nOOOO")
+        i.set_fodder_grid(np.full(i.shape, 100.0))
+        i.fodder_annual_refill()
+        parameters = i.island_dict[(0, 0)].landscape_parameters
+        f_max_jungle = parameters["J"]["f_max"]
+        f_max_savannah = parameters["S"]["f_max"]
+        alpha = parameters["S"]["alpha"]
+        assert i.get_fodder_on_loc((1, 1)) == f_max_jungle
+        assert i.get_fodder_on_loc((1, 2)) == 100 + alpha * (f_max_savannah - 100)
+        assert i.get_fodder_on_loc((2, 1)) == 100
+        assert i.get_fodder_on_loc((0, 0)) == 100
+
+    def test_refill_years_in_closed_form(self):
+        """Tests that refilling several years at once gives the fodder of the yearly refills.
+        """
+        geogr = "OOOOO\nOJSSO\nOOOOO"
+        i = Island(geogr)
+        i.set_fodder_grid(np.array([[0, 0, 0, 0, 0], [0, 10, 5, 350, 0], [0, 0, 0, 0, 0]],
+                                   dtype=float))
+        other = Island(geogr)
+        other.set_fodder_grid(i.get_fodder_grid())
+        i.fodder_refill_years(7)
+        for _ in range(7):
+            other.fodder_annual_refill()
+        assert np.allclose(i.get_fodder_grid(), other.get_fodder_grid())
+
+    def test_cell_fodder_shared_with_grid(self):
+        """Tests that fodder set on a cell is seen in the fodder grid and the other way around.
+        """
+        i = Island("OOOO\nOJSO\nOOOO")
+        i.island_dict[(1, 2)].fodder = 12.5
+        assert i.get_fodder_grid()[1, 2] == 12.5
+        i.set_fodder_grid(np.zeros(i.shape))
+        assert i.island_dict[(1, 1)].fodder == 0
+
+    def test_f_max_grid(self):
+        """Tests that f_max per location replaces the landscape parameter where it is not NaN.
+        """
+        i = Island("OOOOO\nOJJSO\nOOOOO")
+        f_max_grid = np.full(i.shape, np.nan)
+        f_max_grid[1, 1] = 50
+        f_max_grid[1, 3] = 20
+        i.set_f_max_grid(f_max_grid)
+        i.set_fodder_grid(np.full(i.shape, 30.0))
+        i.fodder_annual_refill()
+        assert i.get_fodder_on_loc((1, 1)) == 50
+        assert i.get_fodder_on_loc((1, 2)) == i.island_dict[(0, 0)].landscape_parameters["J"]["f_max"]
+        assert i.get_fodder_on_loc((1, 3)) == 20
+        with pytest.raises(ValueError):
+            i.set_f_max_grid(np.ones((2, 2)))
 
+    def test_terrain_parsed_from_indented_string(self):
+        """Tests that an indented geography with Windows line endings is parsed to terrain codes.
+        """
+        i = Island("    OOOO\r\n    OJSO\r\n    OdMO\r\n    OOOO\r\n    ")
+        assert i.shape == (4, 4)
+        assert i.get_terrain_letters().tolist()[1:3] == [["O", "J", "S", "O"],
+                                                        ["O", "D", "M", "O"]]
+        assert i.terrain.dtype == np.uint8
+
+    def test_blank_line_not_rectangular(self):
+        """Tests that a blank line inside the geography is not accepted.
+        """
+        with pytest.raises(ValueError):
+            Island("OOO\nOJO\n\nOOO")
 
+    def test_from_file(self, tmpdir):
+        """Tests that an island read from a memory-mapped file equals one made from the string.
+        """
+        path = tmpdir.join("map.txt")
+        path.write(Island.default_geogr)
+        assert np.array_equal(Island.from_file(str(path)).terrain, Island().terrain)
+
+    def test_from_terrain(self):
+        """Tests that an island can be made from terrain codes, which are validated.
+        """
+        terrain = np.zeros((3, 4), dtype=int)
+        terrain[1, 1:3] = [Island.terrain_letters.index("J"), Island.terrain_letters.index("S")]
+        i = Island.from_terrain(terrain)
+        assert i.get_cell_type((1, 1)) == "Jungle"
+        assert i.get_cell_type((1, 2)) == "Savannah"
+        terrain[0, 0] = 1
+        with pytest.raises(ValueError):
+            Island.from_terrain(terrain)
+        terrain[0, 0] = 7
+        with pytest.raises(ValueError):
+            Island.from_terrain(terrain)
+
+    def test_cells_created_when_looked_up(self):
+        """Tests that cells are only created when looked up, while the dict still holds every location.
+        """
+        i = Island()
+        assert dict.__len__(i.island_dict) == 0
+        assert len(i.island_dict) == 13 * 21
+        assert (5, 5) in i.island_dict
+        assert (13, 0) not in i.island_dict
+        assert (-1, 0) not in i.island_dict
+        with pytest.raises(KeyError):
+            i.island_dict[(0, 21)]
+        assert dict.__len__(i.island_dict) == 0
+        assert list(i.island_dict)[:2] == [(0, 0), (0, 1)]
+        assert dict.__len__(i.island_dict) == 13 * 21
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.island_generator import generate_terrain, generate_geography, \
+    terrain_to_geography
+from src.biosim.island import Island
+import numpy as np
+import pytest
+
+
+class TestIslandGenerator:
+
+    def test_terrain_is_valid_island(self):
+        """Tests that a generated terrain has the given shape and an Ocean border.
+        """
+        terrain = generate_terrain(30, 50, border=2, seed=1)
+        assert terrain.shape == (30, 50)
+        ocean = Island.terrain_letters.index("O")
+        assert (terrain[:2] == ocean).all() and (terrain[:, -2:] == ocean).all()
+        assert Island.from_terrain(terrain).shape == (30, 50)
+
+    def test_fractions(self):
+        """Tests that every landscape covers its fraction of the cells inside the border.
+        """
+        terrain = generate_terrain(102, 102, fractions={"J": 0.5, "S": 0.25, "M": 0.25},
+                                   seed=3)
+        counts = np.bincount(terrain[1:-1, 1:-1].ravel(), minlength=5)
+        for letter, fraction in {"J": 0.5, "S": 0.25, "D": 0, "M": 0.25}.items():
+            assert counts[Island.terrain_letters.index(letter)] == fraction * 100 * 100
+
+    def test_reproducible_with_seed(self):
+        """Tests that the same seed gives the same island, and another seed another island.
+        """
+        assert generate_geography(20, 20, seed=5) == generate_geography(20, 20, seed=5)
+        assert generate_geography(20, 20, seed=5) != generate_geography(20, 20, seed=6)
+
+    def test_patches_are_clustered(self):
+        """Tests that neighbouring cells share landscape much more often than by chance.
+        """
+        terrain = generate_terrain(100, 100, fractions={"J": 0.5, "D": 0.5}, seed=2)
+        inner = terrain[1:-1, 1:-1]
+        same = np.mean(inner[:, 1:] == inner[:, :-1])
+        assert same > 0.8
+
+    def test_geography_string_round_trip(self):
+        """Tests that the geography string gives back the terrain when read by Island.
+        """
+        terrain = generate_terrain(15, 25, seed=4)
+        assert np.array_equal(Island(terrain_to_geography(terrain)).terrain, terrain)
+
+    @pytest.mark.parametrize("kwargs", [{"rows": 2, "cols": 10},
+                                        {"fractions": {"X": 1}},
+                                        {"fractions": {"J": -1, "S": 2}},
+                                        {"fractions": {"J": 0}}])
+    def test_invalid_arguments(self, kwargs):
+        """Tests that invalid sizes and fractions raise ValueError.
+        """
+        arguments = dict(rows=10, cols=10)
+        arguments.update(kwargs)
+        with pytest.raises(ValueError):
+            generate_terrain(**arguments)
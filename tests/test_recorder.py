@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.recorder import HistoryRecorder, load_history
+from src.biosim.island import Island
+from src.biosim.animals import Herbivore, Carnivore
+import numpy as np
+import os
+import subprocess
+import sys
+import pytest
+
+
+class TestHistoryRecorder:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir):
+        self.out_dir = str(tmpdir.join("history"))
+        self.island = Island()
+        self.herbs = [Herbivore(self.island, (2, 7), age=age, weight=10)
+                      for age in range(4)]
+        self.carn = Carnivore(self.island, (1, 8), age=2, weight=10)
+
+    def test_record_writes_series(self):
+        """Tests that a record stores totals, count grids and fodder for the year.
+        """
+        recorder = HistoryRecorder(self.island, self.out_dir)
+        recorder.record(3)
+        history = load_history(self.out_dir)
+        assert list(history["year"]) == [3]
+        assert list(history["totals"][0]) == [4, 1]
+        assert history["herb_counts"][0, 2, 7] == 4
+        assert history["carn_counts"][0, 1, 8] == 1
+        assert history["fodder"][0, 2, 7] == self.island.get_fodder_on_loc((2, 7))
+
+    def test_optional_series_not_written(self):
+        """Tests that grids are not written when they are not requested.
+        """
+        HistoryRecorder(self.island, self.out_dir, count_grids=False, fodder_grids=False)
+        assert set(load_history(self.out_dir)) == {"year", "totals"}
+        assert not os.path.exists(os.path.join(self.out_dir, "fodder.npy"))
+
+    def test_histograms(self):
+        """Tests that histograms are recorded with the given bin edges.
+        """
+        recorder = HistoryRecorder(self.island, self.out_dir,
+                                   histograms={"age": [0, 2, 10]})
+        recorder.record(0)
+        history = load_history(self.out_dir)
+        assert list(history["herb_age_hist"][0]) == [2, 2]
+        assert list(history["carn_age_hist"][0]) == [0, 1]
+
+    def test_invalid_histogram_attribute(self):
+        """Tests that an unknown histogram attribute raises ValueError.
+        """
+        with pytest.raises(ValueError):
+            HistoryRecorder(self.island, self.out_dir, histograms={"height": [0, 1]})
+
+    def test_files_grow_when_full(self):
+        """Tests that the files grow when more years are recorded than allocated.
+        """
+        recorder = HistoryRecorder(self.island, self.out_dir, capacity=2)
+        for year in range(5):
+            recorder.record(year)
+        assert list(load_history(self.out_dir)["year"]) == list(range(5))
+        assert np.load(os.path.join(self.out_dir, "year.npy")).shape == (8,)
+
+    def test_close_shrinks_files(self):
+        """Tests that close shrinks the files to the recorded years.
+        """
+        recorder = HistoryRecorder(self.island, self.out_dir)
+        recorder.record(0)
+        recorder.record(1)
+        recorder.close()
+        assert np.load(os.path.join(self.out_dir, "herb_counts.npy")).shape == \
+            (2,) + self.island.shape
+
+    def test_readable_by_other_process_while_recording(self):
+        """Tests that another process can read the series while recording continues.
+        """
+        recorder = HistoryRecorder(self.island, self.out_dir)
+        recorder.record(0)
+        recorder.record(1)
+        biosim_dir = os.path.join(os.path.dirname(__file__), "..", "src", "biosim")
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(biosim_dir))
+        output = subprocess.check_output(
+            [sys.executable, "-c",
+             "from recorder import load_history; "
+             "print(load_history({!r})['totals'][:, 0].tolist())".format(self.out_dir)],
+            env=env, universal_newlines=True)
+        assert output.strip() == "[4, 4]"
+        recorder.record(2)
@@ -0,0 +1,732 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Daniil Efremov', 'Sigurd Grøtan'
+__email__ = 'daniil.vitalevich.efremov@nmbu.no', 'sgrotan@nmbu.no'
+
+from src.biosim.simulation import BioSim, population_dtype, population_table_dtype, \
+    compact_population_dtype, BackgroundFrameWriter
+from src.biosim.recorder import load_history
+import numpy as np
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import pytest
+
+IMPORT_TIME_BUDGET_US = 500000
+BIOSIM_DIR = os.path.join(os.path.dirname(__file__), "..", "src", "biosim")
+
+
+def import_times(module):
+    """Imports module in a fresh interpreter with -X importtime and returns a dict
+    mapping each imported module to its cumulative import time in microseconds.
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(BIOSIM_DIR))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             "import {}".format(module)],
+                            env=env, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestSimulation:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OJJDO
+                     OOOOO"""
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(20)]},
+                        {"loc": (2, 2),
+                         "pop": [{"species": "Carnivore", "age": 5, "weight": 20}
+                                 for _ in range(5)]}]
+
+    def test_island_map_types(self, tmpdir):
+        """Tests that the island map can be given as string, bytes, terrain
+        array or path, all giving the same island.
+        """
+        terrain = BioSim(self.geogr, [], seed=1, headless=True).island.terrain
+        path = tmpdir.join("map.txt")
+        path.write(self.geogr)
+        for island_map in (self.geogr.encode("ascii"), np.array(terrain),
+                           pathlib.Path(str(path))):
+            sim = BioSim(island_map, self.ini_pop, seed=1, headless=True)
+            assert np.array_equal(sim.island.terrain, terrain)
+            assert sim.num_animals == 25
+
+    def test_headless_constructor_never_creates_figure(self):
+        """Tests that a headless simulation runs without setting up any figure.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        sim.simulate(5)
+        assert sim.year == 5
+        assert sim._fig is None
+
+    def test_headless_argument_overrides_constructor(self):
+        """Tests that simulate can be run headless even if the constructor was not.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1)
+        sim.simulate(3, headless=True)
+        assert sim._fig is None
+
+    def test_headless_does_not_save_images(self, tmpdir):
+        """Tests that no images are written in headless mode.
+        """
+        img_base = str(tmpdir.join("sim"))
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, img_base=img_base, headless=True)
+        sim.simulate(3, vis_years=1, img_years=1)
+        assert tmpdir.listdir() == []
+
+    def test_count_history_recorded_headless(self):
+        """Tests that animal counts are recorded every vis_years in headless mode.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        sim.simulate(4, vis_years=2)
+        herb_history = sim.count_history["Herbivore"]
+        assert len(herb_history) == 4
+        assert herb_history[0] == 20
+        assert sim.count_history["Carnivore"][0] == 5
+        assert np.isnan(herb_history[1])
+        assert not np.isnan(herb_history[2])
+
+    def test_count_history_same_with_and_without_graphics(self):
+        """Tests that the headless and graphical modes record the same counts.
+        """
+        headless_sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        headless_sim.simulate(5, vis_years=1, img_years=100)
+        graphic_sim = BioSim(self.geogr, self.ini_pop, seed=1)
+        graphic_sim.simulate(5, vis_years=1, img_years=100)
+
+        for species in ["Herbivore", "Carnivore"]:
+            assert np.array_equal(headless_sim.count_history[species],
+                                  graphic_sim.count_history[species])
+
+    def test_num_animals_follows_population(self):
+        """Tests that the animal counts match the animals on the island while simulating.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        assert sim.num_animals == 25
+        for _ in range(3):
+            sim.simulate(1)
+            assert sim.num_animals_per_species == {
+                "Herbivore": len(sim.island.get_all_herb_list()),
+                "Carnivore": len(sim.island.get_all_carn_list())}
+            assert sim.num_animals == sum(sim.num_animals_per_species.values())
+
+    def test_count_history_extends_over_multiple_simulate(self):
+        """Tests that the count history grows with repeated simulate calls.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        sim.simulate(2)
+        sim.simulate(3)
+        assert len(sim.count_history["Herbivore"]) == 5
+        assert not np.isnan(sim.count_history["Herbivore"]).any()
+
+
+class TestSimulationIterYears:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OOOOO"""
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(20)]}]
+
+    def test_iter_years_matches_simulate(self):
+        """Tests that iterating the years gives the same state as simulate.
+        """
+        iterated = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        snapshots = list(iterated.iter_years(5))
+        simulated = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        simulated.simulate(5)
+
+        assert [snapshot.year for snapshot in snapshots] == [1, 2, 3, 4, 5]
+        assert iterated.year == 5
+        assert snapshots[-1].counts == simulated.num_animals_per_species
+
+    def test_iter_years_is_lazy(self):
+        """Tests that years are only simulated when snapshots are requested.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        for snapshot in sim.iter_years(100):
+            if snapshot.year == 3:
+                break
+        assert sim.year == 3
+
+    def test_snapshots_are_immutable(self):
+        """Tests that snapshots can not be changed and keep their grids.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        years = sim.iter_years(10, grids=True)
+        first = next(years)
+        herb_grid = first.herb_grid.copy()
+        list(years)
+
+        assert np.array_equal(first.herb_grid, herb_grid)
+        with pytest.raises(ValueError):
+            first.herb_grid[1, 1] = 0
+        with pytest.raises(TypeError):
+            first.counts["Herbivore"] = 0
+        assert next(sim.iter_years(1)).herb_grid is None
+
+
+class TestSimulationBulkPopulation:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OMJDO
+                     OOOOO"""
+        self.table = np.array([("Herbivore", 1, 1, 5, 20.0),
+                               ("Carnivore", 2, 2, 3, 15.5),
+                               ("Herbivore", 2, 3, 0, 8.0)], dtype=population_dtype)
+
+    @staticmethod
+    def animals(sim):
+        """Returns location, species, age and weight of every animal."""
+        return sorted((animal.loc, type(animal).__name__, animal.age, animal.weight)
+                      for animal in sim.island.get_all_herb_list() +
+                      sim.island.get_all_carn_list())
+
+    def test_table_same_as_dicts(self):
+        """Tests that adding a table gives the same animals as the dict population.
+        """
+        dict_sim = BioSim(self.geogr, [{"loc": (int(row), int(col)),
+                                        "pop": [{"species": str(species), "age": int(age),
+                                                 "weight": float(weight)}]}
+                                       for species, row, col, age, weight in self.table],
+                          seed=1, headless=True)
+        table_sim = BioSim(self.geogr, [], seed=1, headless=True)
+        table_sim.add_population_table(self.table)
+        assert self.animals(table_sim) == self.animals(dict_sim)
+        assert isinstance(table_sim.island.get_all_herb_list()[0].age, int)
+
+    @pytest.mark.parametrize("field, value", [("species", "Fish"),
+                                              ("row", 7),
+                                              ("col", 0),
+                                              ("age", -1),
+                                              ("weight", -2.0)])
+    def test_invalid_table_adds_nothing(self, field, value):
+        """Tests that an invalid animal raises ValueError before any animal is added.
+        """
+        table = self.table.copy()
+        table[field][-1] = value
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        with pytest.raises(ValueError):
+            sim.add_population_table(table)
+        assert sim.num_animals == 0
+
+    def test_mountain_rejected(self):
+        """Tests that animals can not be placed on mountains.
+        """
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        with pytest.raises(ValueError):
+            sim.add_population_arrays(["Herbivore"], [2], [1], [1], [10.0])
+
+    def test_float_ages_rejected(self):
+        """Tests that ages must be integers.
+        """
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        with pytest.raises(ValueError):
+            sim.add_population_arrays(["Herbivore"], [1], [1], [1.5], [10.0])
+
+    def test_empty_arrays_add_nothing(self):
+        """Tests that empty arrays, also from a table with no rows, are accepted.
+        """
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        sim.add_population_arrays([], [], [], [], [])
+        sim.add_population_table(self.table[:0])
+        assert sim.num_animals == 0
+
+    def test_load_npz_and_csv(self, tmpdir):
+        """Tests that the same population is loaded from .npz and CSV files.
+        """
+        npz_path = str(tmpdir.join("pop.npz"))
+        np.savez(npz_path, **{name: self.table[name] for name in population_dtype.names})
+        csv_path = str(tmpdir.join("pop.csv"))
+        with open(csv_path, "w") as csv_file:
+            csv_file.write("weight,species,row,col,age\n")
+            for species, row, col, age, weight in self.table:
+                csv_file.write("{},{},{},{},{}\n".format(weight, species, row, col, age))
+
+        npz_sim = BioSim(self.geogr, [], seed=1, headless=True)
+        npz_sim.load_population(npz_path)
+        csv_sim = BioSim(self.geogr, [], seed=1, headless=True)
+        csv_sim.load_population(csv_path)
+        assert self.animals(npz_sim) == self.animals(csv_sim)
+        assert npz_sim.num_animals == 3
+
+
+class TestSimulationPopulationTable:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        geogr = """\
+                OOOOO
+                OJJSO
+                OOOOO"""
+        ini_pop = [{"loc": (1, 2),
+                    "pop": [{"species": "Carnivore", "age": 3, "weight": 15},
+                            {"species": "Herbivore", "age": 5, "weight": 20}]},
+                   {"loc": (1, 1),
+                    "pop": [{"species": "Herbivore", "age": age, "weight": 10 + age}
+                            for age in range(4)]}]
+        self.sim = BioSim(geogr, ini_pop, seed=1, headless=True)
+
+    def test_population_table(self):
+        """Tests that the table holds every animal ordered by location and species.
+        """
+        table = self.sim.population_table()
+        assert table.dtype == population_table_dtype
+        assert list(table["species"]) == ["Herbivore"] * 5 + ["Carnivore"]
+        assert list(zip(table["row"], table["col"]))[3:] == [(1, 1), (1, 2), (1, 2)]
+        assert list(table["age"][:4]) == [0, 1, 2, 3]
+        herb = self.sim.island.get_herb_list_on_loc((1, 2))[0]
+        assert table["fitness"][4] == herb.fitness
+
+    def test_empty_population_table(self):
+        """Tests that the table of an island without animals is empty.
+        """
+        sim = BioSim("OOO\nOJO\nOOO", [], seed=1, headless=True)
+        assert len(sim.population_table()) == 0
+
+    @pytest.mark.parametrize("file_name", ["pop.npy", "pop.csv"])
+    def test_write_in_chunks(self, tmpdir, file_name):
+        """Tests that the table written in small chunks equals the table in memory.
+        """
+        path = str(tmpdir.join(file_name))
+        self.sim.write_population_table(path, chunk_size=4)
+        if file_name.endswith(".npy"):
+            written = np.load(path)
+        else:
+            written = np.loadtxt(path, dtype=population_table_dtype, delimiter=",",
+                                 skiprows=1)
+        assert np.array_equal(written, self.sim.population_table())
+
+    def test_written_csv_can_be_loaded(self, tmpdir):
+        """Tests that a written CSV table can be loaded as population.
+        """
+        path = str(tmpdir.join("pop.csv"))
+        self.sim.write_population_table(path)
+        sim = BioSim("OOOOO\nOJJSO\nOOOOO", [], seed=1, headless=True)
+        sim.load_population(path)
+        assert np.array_equal(sim.population_table(), self.sim.population_table())
+
+    def test_compact_table(self, tmpdir):
+        """Tests that the compact table holds the same animals in reduced precision,
+        and can be added back as population.
+        """
+        table = self.sim.population_table()
+        compact = self.sim.population_table(compact=True)
+        assert compact.dtype == compact_population_dtype
+        assert compact.itemsize < table.itemsize / 4
+        assert list(compact["species"]) == [0] * 5 + [1]
+        assert list(compact["cell"]) == [6] * 4 + [7] * 2
+        assert np.array_equal(compact["age"], table["age"])
+        assert np.allclose(compact["fitness"], table["fitness"])
+
+        path = str(tmpdir.join("pop.npy"))
+        self.sim.write_population_table(path, chunk_size=4, compact=True)
+        assert np.array_equal(np.load(path), compact)
+        sim = BioSim("OOOOO\nOJJSO\nOOOOO", [], seed=1, headless=True)
+        sim.add_population_table(np.load(path))
+        assert np.array_equal(sim.population_table(compact=True), compact)
+
+    def test_compact_table_only_npy(self, tmpdir):
+        """Tests that the compact table is not written to CSV.
+        """
+        with pytest.raises(ValueError):
+            self.sim.write_population_table(str(tmpdir.join("pop.csv")), compact=True)
+
+
+class TestSimulationFastForward:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.sim = BioSim("OOOOO\nOJJSO\nOOOOO", [], seed=1, headless=True)
+
+    def test_fast_forward_empty_island(self, mocker):
+        """Tests that years without animals only refill the fodder, and still
+        advance the year and the count history.
+        """
+        sim = self.sim
+        run_cycle = mocker.spy(sim.cycle, "run_cycle")
+        refill = mocker.spy(sim.island, "fodder_refill_years")
+        sim.simulate(10, vis_years=3)
+        assert sim.year == 10
+        assert run_cycle.call_count == 0
+        refill.assert_called_once_with(10)
+        assert list(sim.count_history["Herbivore"][[0, 3, 6, 9]]) == [0] * 4
+        assert np.isnan(sim.count_history["Herbivore"][1])
+
+    def test_empty_years_recorded(self, tmpdir):
+        """Tests that every year without animals is still recorded.
+        """
+        sim = self.sim
+        sim.record_history(str(tmpdir))
+        sim.simulate(4)
+        sim.stop_recording()
+        history = load_history(str(tmpdir))
+        assert list(history["year"]) == [0, 1, 2, 3, 4]
+
+
+class TestSimulationBinnedDraws:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        ini_pop = [{"loc": (1, 1),
+                    "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                            for _ in range(20)]},
+                   {"loc": (1, 2),
+                    "pop": [{"species": "Carnivore", "age": 5, "weight": 20}
+                            for _ in range(5)]}]
+        self.sim = BioSim("OOOOO\nOJJSO\nOOOOO", ini_pop, seed=1, headless=True)
+
+    def test_binned_draws(self):
+        """Tests that binned draws are set on the cycle and need a positive bin count.
+        """
+        self.sim.use_binned_draws(8)
+        assert self.sim.cycle.probability_bins == 8
+        self.sim.simulate(2)
+        assert self.sim.year == 2
+        with pytest.raises(ValueError):
+            self.sim.use_binned_draws(0)
+
+
+class TestSimulationMemoryBudget:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = "OOOO\nOJSO\nOOOO"
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(100)]}]
+
+    def test_footprint_grows_with_animals(self):
+        """Tests that the projected footprint grows with the number of animals.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True)
+        assert sim.memory_footprint() == sim.memory_footprint(100)
+        assert sim.memory_footprint(200) > sim.memory_footprint() > sim.memory_footprint(0)
+
+    def test_population_over_budget_refused(self):
+        """Tests that a population exceeding the budget is refused before
+        any animal is created.
+        """
+        sim = BioSim(self.geogr, [], seed=1, headless=True)
+        budget = sim.memory_footprint(50)
+        with pytest.raises(RuntimeError):
+            BioSim(self.geogr, self.ini_pop, seed=1, headless=True, memory_budget=budget)
+        sim = BioSim(self.geogr, [], seed=1, headless=True, memory_budget=budget)
+        with pytest.raises(RuntimeError):
+            sim.add_population_arrays(["Herbivore"] * 60, [1] * 60, [1] * 60,
+                                      [5] * 60, [20.0] * 60)
+        assert sim.num_animals == 0
+
+    def test_run_over_budget_refused(self):
+        """Tests that a run is refused when the population has grown over the budget.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, headless=True,
+                     memory_budget=BioSim(self.geogr, [], seed=1).memory_footprint(100))
+        sim.simulate(1)
+        sim.add_population_arrays(["Herbivore"], [1], [2], [5], [20.0])
+        sim._memory_budget = sim.memory_footprint() - 1
+        with pytest.raises(RuntimeError):
+            sim.simulate(1)
+        with pytest.raises(RuntimeError):
+            next(sim.iter_years(1))
+        assert sim.year == 1
+
+    def test_single_cohort_within_budget(self):
+        """Tests that with cohorts the budget counts stored cohorts, so a large
+        population of identical animals fits in a budget too small for objects.
+        """
+        num_herbivores = 40000
+        sim = BioSim(self.geogr, [], seed=1, headless=True, memory_budget=10e6)
+        with pytest.raises(RuntimeError):
+            sim._check_memory_budget(num_herbivores)
+        sim.use_cohorts()
+        sim.add_population_arrays(["Herbivore"] * num_herbivores, [1] * num_herbivores,
+                                  [1] * num_herbivores, [5] * num_herbivores,
+                                  [20.0] * num_herbivores)
+        assert sim.num_animals == num_herbivores
+        assert len(sim.cycle.herbivores) == 1
+        assert sim.memory_footprint() == sim.memory_footprint(1) < 10e6
+        sim.simulate(1)
+
+
+class TestSimulationInstrumentation:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        ini_pop = [{"loc": (1, 1),
+                    "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                            for _ in range(20)]}]
+        self.sim = BioSim("OOOO\nOJSO\nOOOO", ini_pop, seed=1, headless=True)
+
+    def test_off_by_default(self):
+        """Tests that no statistics are collected unless instrumentation is enabled.
+        """
+        self.sim.simulate(2)
+        assert self.sim.cycle_statistics is None
+        with pytest.raises(RuntimeError):
+            self.sim.write_cycle_statistics("stats.csv")
+
+    def test_statistics_per_simulated_year(self, tmpdir):
+        """Tests that statistics are collected for every year after enabling them.
+        """
+        self.sim.simulate(2)
+        self.sim.instrument()
+        self.sim.simulate(3)
+        assert list(self.sim.cycle_statistics["year"]) == [3, 4, 5]
+        path = str(tmpdir.join("stats.json"))
+        self.sim.write_cycle_statistics(path)
+        assert os.path.exists(path)
+        self.sim.instrument(False)
+        assert self.sim.cycle_statistics is None
+
+
+class TestSimulationImport:
+
+    def test_import_does_not_load_matplotlib_or_pandas(self):
+        """Tests that importing the simulation module defers the heavy imports.
+        """
+        times = import_times("simulation")
+        assert "simulation" in times
+        for name in times:
+            assert not name.startswith("matplotlib")
+            assert not name.startswith("pandas")
+
+    def test_import_time_within_budget(self):
+        """Tests that importing the simulation module stays within the time budget.
+        """
+        times = import_times("simulation")
+        assert times["simulation"] < IMPORT_TIME_BUDGET_US
+
+
+class TestSimulationRendering:
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.geogr = """\
+                     OOOOO
+                     OJJSO
+                     OOOOO"""
+        self.ini_pop = [{"loc": (1, 1),
+                         "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                                 for _ in range(10)]}]
+
+    def test_background_stored_for_blitting(self):
+        """Tests that the static background is stored after the figure is drawn.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1)
+        sim.simulate(2)
+        assert sim._background is not None
+
+    def test_slow_display_does_not_throttle_simulation(self, mocker):
+        """Tests that only the latest frames are drawn when the display is slower
+        than the simulation.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, max_fps=2)
+        draw = mocker.patch.object(BioSim, "_update_graphics",
+                                   side_effect=lambda frame: time.sleep(0.05))
+        sim.simulate(20, vis_years=1, img_years=1000)
+        assert sim.year == 20
+        assert draw.call_count < 20
+
+    def test_all_saved_frames_drawn_in_order(self, tmpdir, mocker):
+        """Tests that every frame to be saved is drawn and numbered in year order.
+        """
+        img_base = str(tmpdir.join("sim"))
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, img_base=img_base, max_fps=1)
+        draw = mocker.spy(BioSim, "_update_graphics")
+        sim.simulate(6, vis_years=1, img_years=2)
+        saved_years = [call.args[1].year for call in draw.call_args_list
+                       if call.args[1].save]
+        assert saved_years == [0, 2, 4]
+        assert sorted(f.basename for f in tmpdir.listdir()) == [
+            "sim_00000.png", "sim_00001.png", "sim_00002.png"]
+
+    def test_image_writer_closed(self, tmpdir, mocker):
+        """Tests that simulate writes all images and stops the writer thread before returning.
+        """
+        img_base = str(tmpdir.join("sim"))
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, img_base=img_base)
+        close = mocker.spy(BackgroundFrameWriter, "close")
+        sim.simulate(2, vis_years=1, img_years=1)
+        close.assert_called_once()
+        assert not close.call_args.args[0]._thread.is_alive()
+        assert sorted(f.basename for f in tmpdir.listdir()) == ["sim_00000.png",
+                                                                "sim_00001.png"]
+
+    def test_error_in_simulation_is_raised(self, mocker):
+        """Tests that an error in the simulation thread is raised by simulate.
+        """
+        sim = BioSim(self.geogr, self.ini_pop, seed=1)
+        mocker.patch.object(sim.cycle, "run_cycle", side_effect=RuntimeError)
+        with pytest.raises(RuntimeError):
+            sim.simulate(2)
+
+    def test_movie_streams_frames_instead_of_images(self, tmpdir, mocker):
+        """Tests that frames are streamed to a movie writer when movie_fmt is given,
+        that simulate finishes the movie, and that a later call streams a new movie.
+        """
+        writer_class = mocker.patch("src.biosim.simulation.MovieFrameWriter")
+        writer = writer_class.return_value
+        img_base = str(tmpdir.join("sim"))
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, img_base=img_base,
+                     movie_fmt="mp4")
+        sim.simulate(4, vis_years=1, img_years=1)
+        writer_class.assert_called_once_with(img_base + ".mp4", ffmpeg_binary="ffmpeg")
+        writer.close.assert_called_once_with()
+
+        sim.simulate(2, vis_years=1, img_years=1)
+        writer_class.assert_called_with(img_base + "_00004.mp4", ffmpeg_binary="ffmpeg")
+        assert writer.close.call_count == 2
+        assert [call.args[1] for call in writer.write.call_args_list] == list(range(6))
+        assert tmpdir.listdir() == []
+
+        sim.make_movie()
+        assert writer.close.call_count == 2
+
+    def test_movie_finished_on_error(self, tmpdir, mocker):
+        """Tests that the movie writer is closed when the simulation fails.
+        """
+        writer_class = mocker.patch("src.biosim.simulation.MovieFrameWriter")
+        sim = BioSim(self.geogr, self.ini_pop, seed=1, img_base=str(tmpdir.join("sim")),
+                     movie_fmt="mp4")
+        mocker.patch.object(sim.cycle, "run_cycle", side_effect=RuntimeError)
+        with pytest.raises(RuntimeError):
+            sim.simulate(2)
+        writer_class.return_value.close.assert_called_once_with()
+
+
+class TestSimulationHistory:
+
+    def test_record_history_every_year(self, tmpdir):
+        """Tests that the initial year and every simulated year are recorded.
+        """
+        out_dir = str(tmpdir.join("history"))
+        ini_pop = [{"loc": (1, 1),
+                    "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                            for _ in range(10)]}]
+        sim = BioSim("OOOO\nOJSO\nOOOO", ini_pop, seed=1, headless=True)
+        sim.record_history(out_dir, histograms={"weight": [0, 50, 100]})
+        sim.simulate(3, vis_years=1)
+        sim.simulate(2, vis_years=1)
+        sim.stop_recording()
+
+        history = load_history(out_dir)
+        assert list(history["year"]) == list(range(6))
+        assert history["totals"][0, 0] == 10
+        assert history["totals"][-1, 0] == sim.num_animals_per_species["Herbivore"]
+        assert history["herb_counts"].shape == (6, 3, 4)
+        assert history["herb_weight_hist"].shape == (6, 2)
+
+
+class TestSimulationCheckpoint:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmpdir):
+        self.path = str(tmpdir.join("checkpoint.npz"))
+        geogr = """\
+                OOOOOOO
+                OJJSSDO
+                OJJJSSO
+                OOOOOOO"""
+        ini_pop = [{"loc": (1, 1),
+                    "pop": [{"species": "Herbivore", "age": 5, "weight": 20}
+                            for _ in range(50)]},
+                   {"loc": (2, 2),
+                    "pop": [{"species": "Carnivore", "age": 5, "weight": 20}
+                            for _ in range(10)]}]
+        self.sim = BioSim(geogr, ini_pop, seed=3, headless=True)
+
+    @staticmethod
+    def state(sim):
+        """Returns every animal attribute and all fodder of a simulation."""
+        animals = [(loc, type(animal).__name__, animal.age, animal.weight, animal.fitness)
+                   for loc, cell in sim.island.island_dict.items()
+                   for animal in cell.get_herb_pop_list() + cell.get_carn_pop_list()]
+        return animals, sim.island.get_fodder_grid().tolist()
+
+    @pytest.mark.parametrize("bins", [None, 8])
+    def test_resume_is_bit_exact(self, bins):
+        """Tests that a loaded checkpoint continues exactly like the saved
+        simulation, also with binned draws.
+        """
+        self.sim.use_binned_draws(bins)
+        self.sim.simulate(5)
+        self.sim.save_checkpoint(self.path)
+        self.sim.simulate(5)
+
+        resumed = BioSim.load_checkpoint(self.path)
+        assert resumed.year == 5
+        assert resumed.cycle.probability_bins == bins
+        resumed.simulate(5)
+
+        assert resumed.year == 10
+        assert self.state(resumed) == self.state(self.sim)
+        assert np.array_equal(resumed.count_history["Herbivore"],
+                              self.sim.count_history["Herbivore"])
+
+    def test_compact_checkpoint(self):
+        """Tests that a compact checkpoint restores the animals with single
+        precision weights.
+        """
+        self.sim.simulate(3)
+        self.sim.save_checkpoint(self.path, compact=True)
+        with np.load(self.path) as data:
+            assert data["weights"].dtype == np.float32
+            assert data["ages"].dtype == np.uint16
+        resumed = BioSim.load_checkpoint(self.path)
+        expected, _ = self.state(self.sim)
+        restored, _ = self.state(resumed)
+        assert [animal[:3] for animal in restored] == [animal[:3] for animal in expected]
+        assert np.allclose([animal[3] for animal in restored],
+                           [animal[3] for animal in expected], rtol=1e-6)
+
+    def test_f_max_grid_saved(self):
+        """Tests that f_max set per cell is restored from the checkpoint.
+        """
+        f_max_grid = np.full(self.sim.island.shape, np.nan)
+        f_max_grid[1, 3] = 123.0
+        self.sim.set_f_max_grid(f_max_grid)
+        self.sim.save_checkpoint(self.path)
+        resumed = BioSim.load_checkpoint(self.path)
+        assert np.array_equal(resumed.island.get_f_max_grid(), f_max_grid, equal_nan=True)
+
+    def test_load_restores_parameters(self):
+        """Tests that the saved animal parameters are set when loading.
+        """
+        self.sim.set_animal_parameters("Herbivore", {"F": 12.0})
+        self.sim.save_checkpoint(self.path)
+        self.sim.set_animal_parameters("Herbivore", {"F": 10.0})
+        resumed = BioSim.load_checkpoint(self.path)
+        assert resumed.island.get_all_herb_list()[0].parameters["F"] == 12.0
+        resumed.set_animal_parameters("Herbivore", {"F": 10.0})
+
+    def test_load_with_replaced_settings(self, tmpdir):
+        """Tests that constructor settings can be replaced when loading.
+        """
+        self.sim.save_checkpoint(self.path)
+        img_base = str(tmpdir.join("resumed"))
+        resumed = BioSim.load_checkpoint(self.path, img_base=img_base)
+        assert resumed._img_base == img_base
+        assert resumed._headless